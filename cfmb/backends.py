@@ -0,0 +1,183 @@
+"""Ollama backend pool.
+
+OLLAMA_HOSTS lists the Ollama servers the bot may use, comma-separated, each
+optionally followed by "=" and the models it serves separated by "|":
+
+    http://gpu1:11434=qwen3:32b|qwen3:4b, http://gpu2:11434=embeddinggemma|flux, http://spare:11434
+
+A host without a model list serves every model.  When OLLAMA_HOSTS is empty
+there is a single backend at the ollama client's default host.
+
+Each call goes to the backend serving its model with the fewest requests in
+flight.  A backend that fails is skipped in favour of the next one, and after
+OLLAMA_FAILURE_THRESHOLD failures in a row its circuit opens: it gets no
+traffic for OLLAMA_COOLDOWN_SECONDS, then one trial request, which closes the
+circuit again if it succeeds.  Health checks (ollama ps) run in the
+background and also open and close circuits.
+"""
+import asyncio
+import time
+
+import ollama
+
+from cfmb.config import config
+
+DEFAULT_HOST = "http://localhost:11434"
+
+
+class NoBackendError(RuntimeError):
+    """No configured backend serves the requested model."""
+
+
+def _is_client_error(error) -> bool:
+    """True for request errors another backend would reject too; a missing model (404) is worth retrying elsewhere."""
+    return isinstance(error, ollama.ResponseError) and 400 <= error.status_code < 500 and error.status_code != 404
+
+
+class Backend:
+    """One Ollama server: its client, the models it serves and its circuit state."""
+
+    def __init__(self, host=None, models=None):
+        self.host = host
+        self.models = set(models or ())
+        self.client = ollama.AsyncClient(host) if host else ollama.AsyncClient()
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.loaded = []
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        return self.host or DEFAULT_HOST
+
+    def serves(self, model: str) -> bool:
+        return not self.models or model in self.models or model.split(":")[0] in self.models
+
+    def available(self, now=None) -> bool:
+        """False while the circuit is open."""
+        return (now or time.monotonic()) >= self.open_until
+
+    def record_success(self):
+        if self.failures >= config.OLLAMA_FAILURE_THRESHOLD:
+            print(f"Ollama pool: {self.url} recovered, circuit closed")
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, error):
+        self.failures += 1
+        if self.failures >= config.OLLAMA_FAILURE_THRESHOLD:
+            self.open_until = time.monotonic() + config.OLLAMA_COOLDOWN_SECONDS
+            print(f"Ollama pool: {self.url} failed {self.failures} times in a row ({error}); "
+                  f"circuit open for {config.OLLAMA_COOLDOWN_SECONDS:.0f}s")
+
+
+class BackendPool:
+    """Spreads Ollama calls over several backends by model, with failover and circuit breaking."""
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    @classmethod
+    def from_config(cls, hosts=None):
+        hosts = config.OLLAMA_HOSTS if hosts is None else hosts
+        backends = []
+        for entry in hosts.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            host, _, models = entry.partition("=")
+            backends.append(Backend(host.strip(), [m.strip() for m in models.split("|") if m.strip()]))
+        return cls(backends or [Backend()])
+
+    def candidates(self, model: str) -> list[Backend]:
+        """Returns the backends that serve model in the order to try them: least busy first, open circuits last."""
+        serving = [b for b in self.backends if b.serves(model)]
+        if not serving:
+            raise NoBackendError(f"No Ollama backend serves {model}")
+        now = time.monotonic()
+        return sorted(serving, key=lambda b: (not b.available(now), b.outstanding, b.failures))
+
+    async def _start(self, model, start):
+        """Runs start(backend) on each candidate until one succeeds.
+
+        Returns (backend, result) with the backend's outstanding count still
+        held; the caller releases it.
+        """
+        error = None
+        for backend in self.candidates(model):
+            if error is not None:
+                print(f"Ollama pool: failing over to {backend.url} for {model}")
+            backend.outstanding += 1
+            backend.requests += 1
+            held = False
+            try:
+                result = await start(backend)
+                held = True
+                return backend, result
+            except Exception as e:
+                if _is_client_error(e):
+                    raise
+                backend.record_failure(e)
+                error = e
+            finally:
+                # Also gives the slot back when the call is cancelled, e.g. by a timeout
+                if not held:
+                    backend.outstanding -= 1
+        raise error
+
+    async def call(self, model: str, start):
+        """Awaits start(backend) on the best backend for model, failing over on errors."""
+        backend, result = await self._start(model, start)
+        try:
+            backend.record_success()
+            return result
+        finally:
+            backend.outstanding -= 1
+
+    async def chat_stream(self, **kwargs):
+        """Streams a chat, failing over until a backend has produced its first chunk."""
+        async def start(backend):
+            stream = await backend.client.chat(**kwargs)
+            try:
+                return stream, await anext(stream)
+            except StopAsyncIteration:
+                return stream, None
+
+        backend, (stream, first) = await self._start(kwargs["model"], start)
+        try:
+            if first is not None:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            backend.record_success()
+        except Exception as e:
+            backend.record_failure(e)
+            raise
+        finally:
+            backend.outstanding -= 1
+
+    async def check(self, backend: Backend) -> bool:
+        """Health-checks one backend, noting which models it has loaded."""
+        try:
+            response = await asyncio.wait_for(backend.client.ps(), timeout=config.OLLAMA_HEALTH_TIMEOUT_SECONDS)
+        except Exception as e:
+            backend.record_failure(e)
+            return False
+        backend.loaded = [m.model for m in response.models]
+        backend.record_success()
+        return True
+
+    async def run_health_checks(self):
+        """Checks every backend every OLLAMA_HEALTH_INTERVAL_SECONDS."""
+        while True:
+            await asyncio.gather(*(self.check(b) for b in self.backends))
+            await asyncio.sleep(config.OLLAMA_HEALTH_INTERVAL_SECONDS)
+
+    def describe(self) -> str:
+        lines = []
+        for b in self.backends:
+            state = "up" if b.available() else "circuit open"
+            models = ", ".join(sorted(b.models)) or "all models"
+            lines.append(f"{b.url} ({models}): {state}, {b.outstanding} in flight, {b.requests} requests")
+        return "\n".join(lines)
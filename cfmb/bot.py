@@ -6,7 +6,9 @@ import re
 import subprocess
 import sys
 import math
+from contextlib import suppress
 from datetime import date, datetime, time, timezone
+from time import monotonic
 from zoneinfo import ZoneInfo
 
 from discord.ext import tasks
@@ -17,77 +19,106 @@ ACTIVE_FILE = pathlib.Path("/tmp/cfmb_active")
 
 import discord
 
+from cfmb.chunking import ChannelChunker
+from cfmb.compaction import compact_lines
 from cfmb.config import config
 from cfmb.db_manager import DatabaseManager
+from cfmb.digests import load_channel_lines, update_digests
 from cfmb.llm_client import LLMClient
+from cfmb.moderation import Moderator
+from cfmb.newsletter import build_newsletter, clean_content, split_sections, top_up_newsletter
+from cfmb.reactions import ReactionPipeline
+from cfmb.reembed import ReembedWorker
+from cfmb.routing import ModelRouter
+from cfmb.search import hybrid_search, query_cache
+from cfmb.summarize import Summarizer, facts_map_prompt, facts_reduce_prompt, profile_map_prompt, window_tokens
+from cfmb.users import UserDirectory
 from cfmb.webfetch import get_webpage_text, extract_first_url
 
 
-BATCH_THRESHOLD = 512
-BATCH_MAX_CONTENT = 2048
-
-
 class RagBatcher:
-    """Batches messages per channel into rag_chunks rows, updating the latest until full."""
+    """Chunks each channel's messages as they arrive and keeps the rag_chunks rows in step."""
 
     def __init__(self, db_manager_ref, llm_client_ref):
         self.db = db_manager_ref
         self.llm = llm_client_ref
-
-    async def add_message(self, server_id: str, channel_id: str, channel_name: str, message_id: str, username: str, text: str):
-        """Append a formatted message to the latest chunk for this channel, or create a new one."""
-        formatted = f"{username}: {text}"
-        latest = self.db.get_latest_rag_chunk(channel_id)
-
-        if latest and len(latest["content"]) <= BATCH_THRESHOLD:
-            content = (latest["content"] + "\n" + formatted)[:BATCH_MAX_CONTENT]
-            embedding = await self.llm.get_embedding(content, config.OLLAMA_EMBEDDING_MODEL)
-            if embedding:
-                self.db.update_rag_chunk(latest["id"], content, embedding)
-                print(f"RAG batcher: updated chunk {latest['id']} for channel {channel_id} ({len(content)} chars)")
-        else:
-            content = formatted[:BATCH_MAX_CONTENT]
-            embedding = await self.llm.get_embedding(content, config.OLLAMA_EMBEDDING_MODEL)
-            if embedding:
-                self.db.write_rag_chunk(server_id, message_id, channel_id, channel_name, content, embedding)
-                print(f"RAG batcher: new chunk for channel {channel_id} ({len(content)} chars)")
+        self.chunkers = {}
+        self.locks = {}
+
+    def _chunker(self, channel_id):
+        """Returns the channel's chunker, continuing its latest stored chunk after a restart."""
+        if channel_id not in self.chunkers:
+            chunker = ChannelChunker()
+            latest = self.db.get_latest_rag_chunk(channel_id)
+            if latest:
+                chunker.resume(latest["id"], latest["message_id"], latest["content"])
+            self.chunkers[channel_id] = chunker
+        return self.chunkers[channel_id]
+
+    async def add_message(self, server_id: str, channel_id: str, channel_name: str, message_id: str, username: str, text: str, ts_ms: int | None = None, reply_to: str | None = None):
+        """Adds a message to the channel's chunks, storing new chunks and re-embedding grown ones."""
+        async with self.locks.setdefault(channel_id, asyncio.Lock()):
+            for chunk, new in self._chunker(channel_id).add(message_id, username, text, ts_ms, reply_to):
+                content = chunk.content
+                embedding = await self.llm.get_embedding(content, config.OLLAMA_EMBEDDING_MODEL)
+                if not embedding:
+                    continue
+                if chunk.row_id is None:
+                    chunk.row_id = self.db.write_rag_chunk(
+                        server_id, chunk.message_id, channel_id, channel_name, content, embedding, config.OLLAMA_EMBEDDING_MODEL,
+                    )
+                    print(f"RAG batcher: new chunk for channel {channel_id} ({chunk.tokens} tokens)")
+                else:
+                    self.db.update_rag_chunk(chunk.row_id, content, embedding, config.OLLAMA_EMBEDDING_MODEL)
+                    print(f"RAG batcher: updated chunk {chunk.row_id} for channel {channel_id} ({chunk.tokens} tokens)")
 
 
 intents = discord.Intents.default()
 intents.message_content = True
+intents.members = config.DISCORD_MEMBERS_INTENT
 
 client = discord.Client(intents=intents)
 db_manager = DatabaseManager(config.DB_NAME)
 llm_client = LLMClient(config.OLLAMA_MODEL)
 llm_queue = asyncio.Queue()
 llm_worker_task = None
-emoji_queue = asyncio.Queue()
+reactions = ReactionPipeline(llm_client)
 emoji_worker_task = None
 rag_batcher = RagBatcher(db_manager, llm_client)
-
-# Matches common Unicode emoji ranges
-EMOJI_PATTERN = re.compile(
-    "[\U0001F000-\U0001FFFF"
-    "\u2600-\u27BF"
-    "\u2B00-\u2BFF"
-    "]+"
-)
-
+reembed_worker = ReembedWorker(db_manager, llm_client)
+moderator = Moderator(llm_client)
+router = ModelRouter(db_manager)
+reembed_task = None
+health_task = None
+user_directory = UserDirectory(db_manager)
 
 NOON_EASTERN = time(config.NEWSLETTER_HOUR_ET, 0, tzinfo=ZoneInfo("America/New_York"))
+NEWSLETTER_PRECOMPUTE_EASTERN = time(config.NEWSLETTER_PRECOMPUTE_HOUR_ET, 0, tzinfo=ZoneInfo("America/New_York"))
 FOUR_AM_EASTERN = time(4, 0, tzinfo=ZoneInfo("America/New_York"))
 FIVE_AM_EASTERN = time(5, 0, tzinfo=ZoneInfo("America/New_York"))
 
 
 @client.event
 async def on_ready():
-    global llm_worker_task, emoji_worker_task
+    global llm_worker_task, emoji_worker_task, reembed_task, health_task
     db_manager.initialize_db()
+    for guild in client.guilds:
+        user_directory.names(str(guild.id))
     llm_worker_task = client.loop.create_task(llm_worker())
-    emoji_worker_task = client.loop.create_task(emoji_reaction_worker())
+    emoji_worker_task = client.loop.create_task(reactions.run())
+    if not health_task:
+        health_task = client.loop.create_task(llm_client.pool.run_health_checks())
+        client.loop.create_task(llm_client.residency.preload(config.OLLAMA_MODEL))
+        if config.OLLAMA_EMBEDDING_MODEL:
+            client.loop.create_task(llm_client.residency.preload(config.OLLAMA_EMBEDDING_MODEL, embedding=True))
+    if config.OLLAMA_EMBEDDING_MODEL and not reembed_task:
+        reembed_task = client.loop.create_task(reembed_worker.run())
     daily_newsletter.start()
+    daily_newsletter_precompute.start()
     daily_profiles.start()
     daily_summary.start()
+    if config.DIGEST_INTERVAL_MINUTES:
+        rolling_digests.start()
     dev_channel = client.get_channel(config.DEV_CHANNEL_ID)
     if dev_channel:
         await dev_channel.send("Restart success! привет товарищи 🐻")
@@ -101,62 +132,41 @@ async def daily_newsletter():
         print("Daily newsletter: newsletter channel not found.")
         return
     server_id = str(channel.guild.id)
-    await post_newsletter(server_id, channel)
+    await post_newsletter(server_id, channel, max_age_minutes=0)
 
 
-async def generate_summary(server_id):
-    """Generates a key-facts summary for the past 24 hours and returns it as a string."""
-    raw = db_manager.get_raw_messages_24h(server_id)
-    if not raw:
-        return None
+@tasks.loop(time=NEWSLETTER_PRECOMPUTE_EASTERN)
+async def daily_newsletter_precompute():
+    """Builds and stores the newsletter off-peak so the scheduled post only has to top it up."""
+    channel = client.get_channel(config.NEWSLETTER_CHANNEL_ID)
+    if not channel:
+        print("Newsletter precompute: newsletter channel not found.")
+        return
+    server_id = str(channel.guild.id)
+    await refresh_newsletter(server_id, max_age_minutes=0, top_up=False)
 
+
+@tasks.loop(minutes=config.DIGEST_INTERVAL_MINUTES)
+async def rolling_digests():
+    """Digests the channel buckets that closed since the last run."""
+    channel = client.get_channel(config.NEWSLETTER_CHANNEL_ID)
+    if not channel:
+        print("Rolling digests: newsletter channel not found.")
+        return
+    server_id = str(channel.guild.id)
     excluded = set(config.DEV_EXCLUDED_CHANNELS.split(",")) if config.DEV_EXCLUDED_CHANNELS else set()
+    await update_digests(server_id, db_manager, llm_client, excluded)
 
-    channels = {}
-    for m in raw:
-        cid = m["channel_id"] or "unknown"
-        if cid in excluded:
-            continue
-        channels.setdefault(cid, {"name": m["channel_name"] or cid, "messages": []})
-        channels[cid]["messages"].append(m)
 
+async def generate_summary(server_id):
+    """Generates a key-facts summary for the past 24 hours and returns it as a string."""
+    excluded = set(config.DEV_EXCLUDED_CHANNELS.split(",")) if config.DEV_EXCLUDED_CHANNELS else set()
+    channels = load_channel_lines(server_id, db_manager, excluded)
     if not channels:
         return None
 
-    transcript_blocks = []
-    for data in channels.values():
-        ch_name = data["name"]
-        lines = [f"{m['username']}: {m['content']}" for m in data["messages"]]
-        transcript_blocks.append(f"#{ch_name}\n" + "\n".join(lines))
-
-    transcript = "\n---\n".join(transcript_blocks)
-
-    prompt = [
-        {
-            "role": "system",
-            "content": (
-                "You are an analyst for the Cape Fear Makers Guild Discord server. "
-                "You will be given a transcript of the past 24 hours of messages grouped by channel. "
-                "Identify the five most important facts, events, announcements, plans, or pieces of information. "
-                "For each fact, list the users involved and the channel it came from.\n\n"
-                "Return ONLY the facts in this exact format, separated by ---:\n\n"
-                "what: one sentence describing the fact\n"
-                "users: user1, user2\n"
-                "channel: #channel-name\n"
-                "---\n"
-                "what: another fact\n"
-                "users: user3\n"
-                "channel: #other-channel\n\n"
-                "Do not add any other text, headers, or commentary."
-            ),
-        },
-        {
-            "role": "user",
-            "content": transcript,
-        },
-    ]
-
-    return await llm_client.get_completion(prompt)
+    blocks = [(data["name"], data["lines"]) for data in channels.values()]
+    return await Summarizer(llm_client).run(blocks, facts_map_prompt, facts_reduce_prompt, label="summary")
 
 
 @tasks.loop(time=FIVE_AM_EASTERN)
@@ -200,34 +210,69 @@ def _build_profile_prompt(username, transcript):
     ]
 
 
+async def _generate_profile(username, raw, id_to_name, llm=None, priority="batch"):
+    """Generates a profile from a compacted sample of a user's raw messages, map-reducing if it still exceeds the budget."""
+    llm = llm or llm_client
+    lines = [
+        f"[{m['channel_name'] or 'unknown'}] {_resolve_mentions(m['content'], id_to_name)}"
+        for m in raw
+        if m["content"].strip()
+    ]
+    max_tokens = config.PROFILE_TRANSCRIPT_TOKENS or window_tokens(llm)
+    estimate = lambda text: llm.budget.estimate(text, llm.model_name)
+    compacted = compact_lines(lines, max_tokens, estimate)
+    print(
+        f"Profile {username}: compacted {len(lines)} lines ({sum(map(estimate, lines))} tokens) "
+        f"to {len(compacted)} lines ({sum(map(estimate, compacted))} tokens)"
+    )
+    return await Summarizer(llm, priority=priority).run(
+        [(None, compacted)],
+        profile_map_prompt(username),
+        lambda notes: _build_profile_prompt(username, notes),
+        label=f"profile {username}",
+        single_prompt=lambda transcript: _build_profile_prompt(username, transcript),
+    )
+
+
 @tasks.loop(time=FOUR_AM_EASTERN)
 async def daily_profiles():
-    """Generates and persists a profile for every active user from the past week."""
+    """Regenerates profiles for active users with enough new messages since their last profile."""
     channel = client.get_channel(config.NEWSLETTER_CHANNEL_ID)
     if not channel:
         print("Daily profiles: newsletter channel not found.")
         return
     server_id = str(channel.guild.id)
-    users = db_manager.get_active_users_7d(server_id)
-    id_to_name = db_manager.get_user_id_name_map(server_id)
-    id_to_name[str(config.BOT_USER_ID)] = config.BOT_DISPLAY_NAME
-    print(f"Daily profiles: generating profiles for {len(users)} users.")
-    for user in users:
-        user_id = user["user_id"]
-        username = user["username"]
-        raw = db_manager.get_raw_messages_by_user_7d(server_id, user_id)
-        if len(raw) < 20:
-            continue
-        transcript = "\n".join(
-            f"[{m['channel_name'] or 'unknown'}] {_resolve_mentions(m['content'], id_to_name)}"
-            for m in raw
-            if m["content"].strip()
-        )
-        prompt = _build_profile_prompt(username, transcript)
-        profile = await llm_client.get_completion(prompt)
+    t_start = monotonic()
+    activity = db_manager.get_profile_activity_7d(server_id)
+    users = [
+        u for u in activity
+        if u["total"] >= config.PROFILE_MIN_MESSAGES and u["new"] >= config.PROFILE_MIN_NEW_MESSAGES
+    ]
+    skipped = len(activity) - len(users)
+    print(f"Daily profiles: regenerating {len(users)} of {len(activity)} active users ({skipped} skipped).")
+    if not users:
+        return
+    raw_by_user = db_manager.get_raw_messages_by_users_7d(server_id, [u["user_id"] for u in users])
+    id_to_name = user_directory.names(server_id)
+    semaphore = asyncio.Semaphore(config.PROFILE_CONCURRENCY)
+
+    async def regenerate(user):
+        async with semaphore:
+            profile = await _generate_profile(user["username"], raw_by_user.get(user["user_id"], []), id_to_name)
         if profile:
-            db_manager.write_user_profile(server_id, user_id, username, profile)
-            print(f"Daily profiles: saved profile for {username}.")
+            db_manager.write_user_profile(server_id, user["user_id"], user["username"], profile)
+            print(f"Daily profiles: saved profile for {user['username']}.")
+        return bool(profile)
+
+    saved = sum(await asyncio.gather(*(regenerate(u) for u in users)))
+    print(f"Daily profiles: saved {saved} profiles, skipped {skipped}, in {monotonic() - t_start:.2f}s.")
+
+
+@client.event
+async def on_member_update(before, after):
+    """Keeps the user directory's display names current (needs DISCORD_MEMBERS_INTENT)."""
+    if before.display_name != after.display_name:
+        user_directory.rename(str(after.guild.id), after.id, after.display_name)
 
 
 @client.event
@@ -248,11 +293,12 @@ async def on_message(message):
         message.content,
         channel_id=str(message.channel.id),
         channel_name=message.channel.name,
+        reply_to=str(message.reference.message_id) if message.reference else None,
     )
+    user_directory.record(server_id, message.author.id, message.author.display_name)
     excluded = set(config.DEV_EXCLUDED_CHANNELS.split(",")) if config.DEV_EXCLUDED_CHANNELS else set()
     if config.OLLAMA_EMBEDDING_MODEL and message.content and str(message.channel.id) not in excluded:
-        id_to_name = db_manager.get_user_id_name_map(server_id)
-        id_to_name[str(config.BOT_USER_ID)] = config.BOT_DISPLAY_NAME
+        id_to_name = user_directory.names(server_id)
         asyncio.ensure_future(rag_batcher.add_message(
             server_id,
             str(message.channel.id),
@@ -260,6 +306,8 @@ async def on_message(message):
             str(message.id),
             message.author.display_name,
             _resolve_mentions(message.content, id_to_name),
+            ts_ms=int(message.created_at.timestamp() * 1000),
+            reply_to=str(message.reference.message_id) if message.reference else None,
         ))
 
     chain_id = resolve_chain_id(message)
@@ -267,7 +315,7 @@ async def on_message(message):
     if "NVDA" in message.content:
         await message.add_reaction("👀")
 
-    # await emoji_queue.put(message)  # temporarily disabled for debugging
+    reactions.offer(message)
 
     if message.content.startswith("/bugs"):
         await handle_bugs_command(message)
@@ -325,6 +373,10 @@ async def on_message(message):
         await handle_newsletter_command(message, server_id)
         return
 
+    if message.content.startswith("/stats"):
+        await handle_stats_command(message, server_id)
+        return
+
     if message.content.startswith("/debug"):
         message.content = message.content.replace("/debug", "", 1).strip()
         await handle_bot_mention(message, server_id, chain_id, skip_moderation=True, save_thinking=True)
@@ -398,12 +450,11 @@ async def handle_preview_command(message, server_id):
         await message.channel.send("Usage: `/preview <message text>`")
         return
 
-    id_to_name = db_manager.get_user_id_name_map(server_id)
-    id_to_name[str(config.BOT_USER_ID)] = config.BOT_DISPLAY_NAME
+    id_to_name = user_directory.names(server_id)
     async with message.channel.typing():
-        system_prompt = await _build_system_prompt(message, server_id, user_text, id_to_name)
+        system_prompt, metadata = await _build_system_prompt(message, server_id, user_text, id_to_name)
 
-    content = system_prompt["content"]
+    content = f"{system_prompt['content']}\n\n{metadata['content']}"
     chunk_size = 1950
     for i in range(0, len(content), chunk_size):
         await message.channel.send(f"```{content[i:i + chunk_size]}```")
@@ -414,22 +465,17 @@ async def handle_profile_gen_command(message, server_id):
     target = message.mentions[0] if message.mentions else message.author
     username = target.display_name
 
-    raw = db_manager.get_raw_messages_by_user_7d(server_id, target.id)
-    if len(raw) < 20:
-        await message.channel.send(f"Not enough messages to generate a profile for **{username}** (need at least 20 in the past week).")
+    if db_manager.get_user_message_count(server_id, target.id) < config.PROFILE_MIN_MESSAGES:
+        await message.channel.send(
+            f"Not enough messages to generate a profile for **{username}** "
+            f"(need at least {config.PROFILE_MIN_MESSAGES} in the past week)."
+        )
         return
 
-    id_to_name = db_manager.get_user_id_name_map(server_id)
-    id_to_name[str(config.BOT_USER_ID)] = config.BOT_DISPLAY_NAME
-    transcript = "\n".join(
-        f"[{m['channel_name'] or 'unknown'}] {_resolve_mentions(m['content'], id_to_name)}"
-        for m in raw
-        if m["content"].strip()
-    )
-
-    prompt = _build_profile_prompt(username, transcript)
+    raw = db_manager.get_raw_messages_by_user_7d(server_id, target.id)
+    id_to_name = user_directory.names(server_id)
     async with message.channel.typing():
-        profile = await llm_client.get_completion(prompt)
+        profile = await _generate_profile(username, raw, id_to_name, priority="interactive")
 
     if not profile:
         await message.channel.send("Failed to generate profile.")
@@ -453,34 +499,25 @@ async def handle_profile_command(message, server_id):
 
 
 async def handle_guildsearch_command(message, server_id):
-    """Handles the /guildsearch command — finds the 5 most semantically similar RAG chunks."""
-    if not config.OLLAMA_EMBEDDING_MODEL:
-        await message.channel.send("Search is not configured (no `OLLAMA_EMBEDDING_MODEL` set).")
-        return
-
+    """Handles the /guildsearch command — finds the 3 best matches by keyword and meaning."""
     query = message.content.replace("/guildsearch", "", 1).strip()
     if not query:
         await message.channel.send("Usage: `/guildsearch <text>`")
         return
 
-    async with message.channel.typing():
-        embedding = await llm_client.get_embedding(query, config.OLLAMA_EMBEDDING_MODEL)
-
-    if not embedding:
-        await message.channel.send("Failed to generate embedding for your query.")
-        return
-
     excluded = set(config.DEV_EXCLUDED_CHANNELS.split(",")) if config.DEV_EXCLUDED_CHANNELS else None
-    results = db_manager.search_rag_chunks(server_id, embedding, limit=3, exclude_channels=excluded)
+    async with message.channel.typing():
+        results = await hybrid_search(query, server_id, db_manager, llm_client, limit=3, exclude_channels=excluded)
     if not results:
         await message.channel.send("No results found.")
         return
 
     await message.channel.send(f"**Search results for** `{query[:50]}`")
     for r in results:
-        score = f"{1 - r['distance']:.0%}"
+        score = f"{1 - r['distance']:.0%} match" if r["distance"] is not None else "keyword match"
         url = f"https://discord.com/channels/{server_id}/{r['channel_id']}/{r['message_id']}"
-        header = f"Chunk `{r['id']}` · #{r['channel_name'] or 'unknown'} · {score} match · [jump]({url})"
+        label = f"Chunk `{r['id']}`" if r["kind"] == "chunk" else "Message"
+        header = f"{label} · #{r['channel_name'] or 'unknown'} · {score} · [jump]({url})"
         msg = f"{header}\n>>> {r['content']}"
         await message.channel.send(msg[:DISCORD_HARD_LIMIT])
 
@@ -507,8 +544,7 @@ async def handle_websearch_command(message):
 
 async def handle_summary_command(message, server_id):
     """Handles the /_summary command — extracts key facts from the past 24 hours."""
-    raw = db_manager.get_raw_messages_24h(server_id)
-    if not raw:
+    if db_manager.get_last_raw_message_id(server_id) is None:
         await message.channel.send("No messages in the past 24 hours.")
         return
 
@@ -527,144 +563,94 @@ async def handle_summary_command(message, server_id):
 
 
 async def handle_newsletter_command(message, server_id):
-    """Summarizes the past 24 hours of messages per channel."""
-    raw = db_manager.get_raw_messages_24h(server_id)
-    if not raw:
+    """Summarizes the past 24 hours of messages per channel, serving the cached newsletter when fresh."""
+    if db_manager.get_last_raw_message_id(server_id) is None:
         await message.channel.send("No messages in the past 24 hours.")
         return
-    await post_newsletter(server_id, message.channel)
+    await post_newsletter(server_id, message.channel, max_age_minutes=config.NEWSLETTER_CACHE_MAX_AGE_MINUTES)
 
 
-async def post_newsletter(server_id, channel):
-    """Generates and posts per-channel summaries for the past 24 hours."""
-    raw = db_manager.get_raw_messages_24h(server_id)
-    if not raw:
-        await channel.send("No messages in the past 24 hours.")
-        return
+async def refresh_newsletter(server_id, max_age_minutes, top_up=True):
+    """Returns an up-to-date newsletter, or None if there were no messages.
 
-    today = date.today().isoformat()
-    header = f"# {config.NEWSLETTER_TITLE}\n{today}"
-
-    channels = {}
-    for m in raw:
-        cid = m["channel_id"] or "unknown"
-        channels.setdefault(cid, {"name": m["channel_name"] or cid, "messages": []})
-        channels[cid]["messages"].append(m)
-
-    def _clean_content(text):
-        # Remove Discord mention syntax (<@123>, <@!123>, <#123>, <@&123>)
-        text = re.sub(r"<[@#][!&]?\d+>", "", text)
-        # Remove any remaining @ symbols
-        return text.replace("@", "")
+    A stored newsletter younger than max_age_minutes is returned as-is.  One
+    younger than NEWSLETTER_TOP_UP_MAX_AGE_MINUTES is topped up with the
+    messages that arrived since it was built; otherwise the newsletter is
+    built from scratch.  Any newly generated newsletter is stored.
+    """
+    cached = db_manager.get_latest_newsletter(server_id)
+    if cached and cached["age_minutes"] <= max_age_minutes:
+        print(f"Newsletter: serving cached newsletter ({cached['age_minutes']:.0f} min old)")
+        return cached
 
-    # Generate each channel summary and find sources in one pass
+    last_message_id = db_manager.get_last_raw_message_id(server_id)
+    if last_message_id is None:
+        return None
     excluded = set(config.DEV_EXCLUDED_CHANNELS.split(",")) if config.DEV_EXCLUDED_CHANNELS else set()
-    channel_blocks = []
-    for cid, data in channels.items():
-        if cid in excluded:
-            continue
-        ch_name = data["name"]
-        transcript = "\n".join(
-            f"{m['username']}: {_clean_content(m['content'])}" for m in data["messages"]
+
+    if top_up and cached and cached["age_minutes"] <= config.NEWSLETTER_TOP_UP_MAX_AGE_MINUTES:
+        new_raw = db_manager.get_raw_messages_after(server_id, cached["last_message_id"])
+        print(f"Newsletter: topping up cached newsletter with {len(new_raw)} new messages")
+        if not new_raw:
+            return cached
+        newsletter = await top_up_newsletter(server_id, cached, new_raw, db_manager, llm_client, excluded)
+    else:
+        channels = load_channel_lines(
+            server_id, db_manager, excluded,
+            format_message=lambda m: f"{m['username']}: {clean_content(m['content'])}",
         )
-        summary_prompt = [
-            {
-                "role": "system",
-                "content": config.SUMMARY_SYSTEM_PROMPT,
-            },
-            {
-                "role": "user",
-                "content": f"Summarize the following messages from #{ch_name}:\n\n{transcript}",
-            },
-        ]
-        async with channel.typing():
-            summary = await llm_client.get_completion(summary_prompt)
-        if not summary:
-            continue
-
-        # Build channel block: heading then summary
-        block = f"**#{ch_name}**\n{summary.strip()}"
-        channel_blocks.append(block)
-
-    if not channel_blocks:
-        await channel.send(header)
-        return
+        newsletter = await build_newsletter(server_id, None, db_manager, llm_client, excluded, channels=channels)
 
-    # Combine all channel blocks for the curation editor
-    combined = "\n\n".join(channel_blocks)
+    db_manager.write_newsletter(server_id, last_message_id, newsletter["summaries"], newsletter["curated"], newsletter["joke"])
+    return newsletter
 
-    curation_prompt = [
-        {
-            "role": "system",
-            "content": config.CURATION_SYSTEM_PROMPT,
-        },
-        {
-            "role": "user",
-            "content": f"Here are the channel summaries:\n\n{combined}",
-        },
-    ]
 
-    async with channel.typing():
-        curated = await llm_client.get_completion(curation_prompt)
+async def post_newsletter(server_id, channel, max_age_minutes=0):
+    """Posts the newsletter for the past 24 hours, reusing a stored one younger than max_age_minutes."""
+    today = date.today().isoformat()
+    header = f"# {config.NEWSLETTER_TITLE}\n{today}"
 
-    if curated:
-        curated = curated.replace("@", "")
+    async with channel.typing():
+        newsletter = await refresh_newsletter(server_id, max_age_minutes)
+    if not newsletter:
+        await channel.send("No messages in the past 24 hours.")
+        return
 
-        if config.OLLAMA_EMBEDDING_MODEL:
-            curated = await _annotate_with_sources(curated, server_id)
-
-        dad_joke_prompt = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a dad joke generator. "
-                    "Given a newsletter summary, respond with a single one-liner dad joke related to its content. "
-                    "Output only the joke — no explanation, no preamble, no quotation marks."
-                ),
-            },
-            {
-                "role": "user",
-                "content": curated.strip(),
-            },
-        ]
-        async with channel.typing():
-            dad_joke = await llm_client.get_completion(dad_joke_prompt)
-
-        await channel.send(header)
-        sections = [s.strip() for s in re.split(r'(?=\*\*#)', curated.strip()) if s.strip()]
-        if not sections:
-            sections = [curated.strip()]
-        for section in sections:
+    await channel.send(header)
+    if newsletter["curated"]:
+        for section in split_sections(newsletter["curated"]):
             await channel.send(section[: config.DISCORD_MAX_MESSAGE_LENGTH])
-        if dad_joke:
-            await channel.send(f"*{dad_joke.strip()}*")
-    else:
-        await channel.send(header)
-
-
-async def _annotate_with_sources(text: str, server_id: str) -> str:
-    """Splits summary text by punctuation and newlines, finds a source message for each segment
-    with 5+ words, and inserts an inline source link before the closing punctuation."""
-    parts = re.split(r'([.,;:!?\n])', text)
-    result = []
-    counter = 0
-    i = 0
-    while i < len(parts):
-        segment = parts[i]
-        delimiter = parts[i + 1] if i + 1 < len(parts) else ''
-        result.append(segment)
-        if len(segment.split()) >= 5:
-            embedding = await llm_client.get_embedding(segment.strip(), config.OLLAMA_EMBEDDING_MODEL)
-            if embedding:
-                matches = db_manager.search_rag_chunks(server_id, embedding, limit=1, hours=24)
-                if matches and matches[0]['distance'] < 0.408 and matches[0].get('channel_id'):
-                    r = matches[0]
-                    url = f"https://discord.com/channels/{server_id}/{r['channel_id']}/{r['message_id']}"
-                    counter += 1
-                    result.append(f" [[{counter}]]({url})")
-        result.append(delimiter)
-        i += 2
-    return ''.join(result)
+        if newsletter["joke"]:
+            await channel.send(f"*{newsletter['joke']}*")
+
+
+async def handle_stats_command(message, server_id):
+    """Handles /stats — shows 24h and 7d activity from the hourly rollups plus search cache stats."""
+    lines = []
+    for label, hours in (("24h", 24), ("7d", 7 * 24)):
+        stats = db_manager.get_activity_stats(server_id, hours)
+        lines.append(f"**Past {label}:** {stats['messages']} messages from {stats['users']} users")
+        if stats["channels"]:
+            lines.append("Channels: " + ", ".join(f"#{name or 'unknown'} ({n})" for name, n in stats["channels"]))
+        if stats["top_users"]:
+            lines.append("Users: " + ", ".join(f"{name} ({n})" for name, n in stats["top_users"]))
+    if config.OLLAMA_EMBEDDING_MODEL:
+        models = db_manager.get_rag_embedding_models(server_id)
+        done = models.get(config.OLLAMA_EMBEDDING_MODEL, 0)
+        if done < sum(models.values()):
+            lines.append(f"**Re-embedding:** {done}/{sum(models.values())} chunks on `{config.OLLAMA_EMBEDDING_MODEL}`")
+    cache = query_cache.stats()
+    lines.append(
+        f"**Search cache:** {cache['hits']}/{cache['lookups']} hits ({cache['hit_ratio']:.0%}), "
+        f"{cache['entries']} entries"
+    )
+    if llm_client.prefill:
+        lines.append("**Prefill:** " + llm_client.describe_prefill())
+    if llm_client.residency.stats:
+        lines.append("**Model loads:** " + llm_client.residency.describe())
+    if len(llm_client.pool.backends) > 1:
+        lines.append("**Ollama backends:**\n" + llm_client.pool.describe())
+    await message.channel.send("\n".join(lines)[: config.DISCORD_MAX_MESSAGE_LENGTH])
 
 
 async def handle_bugs_command(message):
@@ -682,30 +668,35 @@ async def handle_bugs_command(message):
 
 
 async def handle_cfmb_set_command(message):
-    """Handles /cfmb-set <fast|slow> — switch between fast and slow mode."""
+    """Handles /cfmb-set <fast|slow|auto> [me] — pin this channel (or just you) to a model, or go back to automatic routing."""
+    server_id = str(message.guild.id)
+    channel_id, user_id = str(message.channel.id), str(message.author.id)
     parts = message.content.split()
+    usage = "Usage: `/cfmb-set fast|slow|auto` for this channel, or `/cfmb-set fast|slow|auto me` for just you"
     if len(parts) < 2:
-        mode = "fast" if not llm_client.think else "slow"
-        await message.channel.send(f"Current mode: **{mode}** (`{llm_client.model_name}`)\nUsage: `/cfmb-set fast` or `/cfmb-set slow`")
+        overrides = db_manager.get_model_overrides(server_id, channel_id, user_id)
+        await message.channel.send(
+            f"Channel: **{overrides.get('channel', 'auto')}**, you: **{overrides.get('user', 'auto')}** "
+            f"(fast `{config.OLLAMA_FAST_MODEL or 'not configured'}`, slow `{config.OLLAMA_MODEL}`)\n{usage}"
+        )
         return
 
     mode = parts[1].lower()
+    scope, target_id, who = ("user", user_id, "you") if parts[2:] == ["me"] else ("channel", channel_id, "this channel")
+    if mode not in ("fast", "slow", "auto") or len(parts) > 3 or (len(parts) == 3 and scope != "user"):
+        await message.channel.send(usage)
+        return
+    if mode == "fast" and not config.OLLAMA_FAST_MODEL:
+        await message.channel.send("No fast model configured. Set `OLLAMA_FAST_MODEL` in config.")
+        return
 
-    if mode == "fast":
-        if not config.OLLAMA_FAST_MODEL:
-            await message.channel.send("No fast model configured. Set `OLLAMA_FAST_MODEL` in config.")
-            return
-        llm_client.model_name = config.OLLAMA_FAST_MODEL
-        llm_client.think = False
-        await message.channel.send(f"Switched to **fast** mode (`{config.OLLAMA_FAST_MODEL}`, thinking off)")
-
-    elif mode == "slow":
-        llm_client.model_name = config.OLLAMA_MODEL
-        llm_client.think = True
-        await message.channel.send(f"Switched to **slow** mode (`{config.OLLAMA_MODEL}`, thinking on)")
-
+    db_manager.set_model_override(server_id, scope, target_id, None if mode == "auto" else mode)
+    if mode == "auto":
+        await message.channel.send(f"Automatic model routing for {who}")
+    elif mode == "fast":
+        await message.channel.send(f"Switched {who} to **fast** mode (`{config.OLLAMA_FAST_MODEL}`, thinking off)")
     else:
-        await message.channel.send("Usage: `/cfmb-set fast` or `/cfmb-set slow`")
+        await message.channel.send(f"Switched {who} to **slow** mode (`{config.OLLAMA_MODEL}`, thinking on)")
 
 
 async def handle_help_command(message):
@@ -713,14 +704,15 @@ async def handle_help_command(message):
         """
     /system :: Print the system prompt
 /set_system <text> :: Set the system prompt
-/guildsearch <text> :: Semantic search — find the 3 most relevant conversation chunks
+/guildsearch <text> :: Keyword and semantic search — find the 3 most relevant conversations
 /summary :: Summarize the past 24 hours of messages by channel
+/stats :: Show message activity for the past day and week
 /context :: Show recent conversation chains
 /preview <text> :: Show full system prompt without calling the LLM
 /profile :: Show your saved user profile
 /profile_gen :: Generate a new user profile
 /debug <text> :: Call LLM with debug output enabled
-/cfmb-set <fast|slow> :: Switch between fast and slow mode
+/cfmb-set <fast|slow|auto> [me] :: Pin this channel (or just you) to the fast or slow model, or route automatically
 @CFMB <text> :: Mention @CFMB to trigger the CFMB LLM; alternatively reply to a message from CFMB to trigger
     """
     )
@@ -748,49 +740,6 @@ async def llm_worker():
             llm_queue.task_done()
 
 
-async def emoji_reaction_worker():
-    """Processes emoji reaction requests from the queue one at a time."""
-    while True:
-        message = await emoji_queue.get()
-        print(f"Emoji queue: processing (size: {emoji_queue.qsize()})")
-        try:
-            await process_emoji_reaction(message)
-        except Exception as e:
-            print(f"Error in emoji reaction worker: {e}")
-        finally:
-            emoji_queue.task_done()
-
-
-
-async def process_emoji_reaction(message):
-    """Asks the LLM to pick an emoji reaction (~1% of the time) or skip."""
-    prompt_messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a Discord bot that reacts to messages with a single emoji. "
-                "About 1% of the time respond with exactly one emoji character that fits the message. "
-                "If the user seems excited, increase the odds of reacting to 10%. "
-                "The other times respond with exactly the word 'next'. "
-                "Prefer emojis like 🐻🛠️⚙️🏭🛰️✊ as communist symbols, but choose whichever fits best. "
-                "Output only the emoji or the word 'next' — nothing else."
-            ),
-        },
-        {"role": "user", "content": message.content},
-    ]
-    response = await llm_client.get_completion(prompt_messages)
-    if not response:
-        return
-    match = EMOJI_PATTERN.search(response)
-    if match:
-        emoji = match.group(0)[0]
-        try:
-            await message.add_reaction(emoji)
-            print(f"Emoji reaction: reacted with {emoji}")
-        except Exception as e:
-            print(f"Emoji reaction: failed to add reaction: {e}")
-
-
 def resolve_chain_id(message):
     """Returns the chain_id for a message by traversing its reply chain."""
     if message.reference is None:
@@ -818,33 +767,55 @@ def _resolve_mentions(text, id_to_name):
     return re.sub(r"<@!?(\d+)>", replace, text)
 
 
+def _rounded_now(tz):
+    """The current time floored to PROMPT_TIME_GRANULARITY_MINUTES, so repeated prompts stay identical."""
+    now = datetime.now(tz=tz)
+    granularity = max(config.PROMPT_TIME_GRANULARITY_MINUTES, 1)
+    return now.replace(minute=now.minute - now.minute % granularity, second=0, microsecond=0)
+
+
 async def _build_system_prompt(message, server_id, user_content, id_to_name=None):
-    """Constructs the full system prompt for a message, including RAG, profile, and metadata."""
-    system_prompt = db_manager.get_system_prompt(server_id)
+    """Constructs the system prompt for a message and the metadata message that goes with it.
+
+    Returns (system_prompt, metadata).  The system prompt only holds what
+    stays the same from one request to the next — the server prompt, then
+    the channel, then the user and their profile — so Ollama can reuse its
+    cached prefill.  The current time and the user's last activity change on
+    every request and go in the metadata message, which belongs just before
+    the new user message.
+    """
+    system_prompt, prev_ts, profile_row = await asyncio.gather(
+        asyncio.to_thread(db_manager.get_system_prompt, server_id),
+        asyncio.to_thread(db_manager.get_previous_message_timestamp, server_id, message.author.id, str(message.id)),
+        asyncio.to_thread(db_manager.get_latest_user_profile, server_id, message.author.id),
+    )
 
     now_utc = datetime.now(tz=timezone.utc)
-    now_eastern = datetime.now(tz=ZoneInfo("America/New_York"))
+    now_eastern = _rounded_now(ZoneInfo("America/New_York"))
 
-    prev_ts = db_manager.get_previous_message_timestamp(server_id, message.author.id, str(message.id))
     prev_age = _format_age((now_utc - datetime.fromisoformat(prev_ts).replace(tzinfo=timezone.utc)).total_seconds()) if prev_ts else "inactive user"
 
-    profile_row = db_manager.get_latest_user_profile(server_id, message.author.id)
-    profile_age = _format_age((now_utc - datetime.fromisoformat(profile_row["created_at"]).replace(tzinfo=timezone.utc)).total_seconds()) if profile_row else "still learning"
-
     system_prompt["content"] += (
-        f"\n\n## Metadata"
+        f"\n\n## Conversation"
         f"\n- Channel name: #{message.channel.name}"
         f"\n- User name: {message.author.display_name}"
-        f"\n- Current time: {now_eastern.strftime('%Y-%m-%dT%H:%M:%S')}"
-        f"\n- User last active: {prev_age}"
     )
 
     if profile_row:
-        system_prompt["content"] += f"\n\n## User profile\n{profile_row['profile']}"
+        profile = llm_client.budget.trim(profile_row["profile"], "profile")
+        system_prompt["content"] += f"\n\n## User profile\n{profile}"
     else:
         system_prompt["content"] += "\n\n## User profile\nThis user has not been active recently and no profile is available."
 
-    return system_prompt
+    metadata = {
+        "role": "system",
+        "content": (
+            f"## Metadata"
+            f"\n- Current time: {now_eastern.strftime('%Y-%m-%dT%H:%M')}"
+            f"\n- User last active: {prev_age}"
+        ),
+    }
+    return system_prompt, metadata
 
 
 
@@ -913,9 +884,13 @@ THINKING_STATUS_MESSAGES = [
 ]
 
 
-async def _stream_llm(message, context_messages, tools=None, tool_handler=None, debug=False):
+async def _stream_llm(message, context_messages, tools=None, tool_handler=None, debug=False, started=None, route=None):
     """Streams LLM response. When debug=True, sends thinking chunks and tool call info to Discord.
 
+    started is the monotonic time the request began; the time to the first
+    streamed token is logged from it.  route picks the model and thinking
+    setting; without one the client's defaults are used.
+
     Returns (thinking_text, content_text, trace_parts) where trace_parts is a
     list of (type, text) tuples capturing thinking and tool calls in order.
     """
@@ -958,9 +933,20 @@ async def _stream_llm(message, context_messages, tools=None, tool_handler=None,
 
     last_thinking_len = 0
     last_content_len = 0
+    t_stream = monotonic()
+    first_token = False
+
+    def note_first_token():
+        nonlocal first_token
+        if not first_token:
+            first_token = True
+            now = monotonic()
+            since_start = f", {now - started:.2f}s since request" if started is not None else ""
+            print(f"TTFT: {now - t_stream:.2f}s after LLM call{since_start}")
 
     async def on_thinking_cb(thinking_so_far):
         nonlocal last_thinking_len
+        note_first_token()
         if debug:
             nonlocal buffer
             new_text = thinking_so_far[last_thinking_len:]
@@ -970,6 +956,7 @@ async def _stream_llm(message, context_messages, tools=None, tool_handler=None,
 
     async def on_content_cb(content_so_far):
         nonlocal last_content_len
+        note_first_token()
         if debug:
             pass  # content goes in the final reply, not debug stream
         last_content_len = len(content_so_far)
@@ -990,7 +977,8 @@ async def _stream_llm(message, context_messages, tools=None, tool_handler=None,
 
     thinking_text, content_text = await llm_client.get_completion_streaming(
         context_messages, on_thinking=on_thinking_cb, on_content=on_content_cb,
-        tools=tools, tool_handler=tool_handler, on_tool_call=on_tool_call_cb,
+        tools=tools, tool_handler=tool_handler, on_tool_call=on_tool_call_cb, label="chat",
+        model=route.model if route else None, think=route.think if route else None,
     )
 
     if thinking_text:
@@ -1005,48 +993,111 @@ async def _stream_llm(message, context_messages, tools=None, tool_handler=None,
 
 
 
+async def _read_image(attachment):
+    """Downloads an image attachment, converting the first frame of a GIF to PNG."""
+    data = await attachment.read()
+    if attachment.content_type == "image/gif":
+        def first_frame():
+            frame = Image.open(io.BytesIO(data))
+            frame.seek(0)
+            buf = io.BytesIO()
+            frame.convert("RGB").save(buf, format="PNG")
+            return buf.getvalue()
+        data = await asyncio.to_thread(first_frame)
+    return data
+
+
+async def _timed(timings, name, awaitable):
+    """Awaits a preparation stage and records how long it took."""
+    t_start = monotonic()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = monotonic() - t_start
+
+
+async def _discard(future):
+    """Cancels a future and waits for it, retrieving its outcome so a failure is not reported as unhandled."""
+    future.cancel()
+    with suppress(asyncio.CancelledError, Exception):
+        await future
+
+
+async def _fetch_web_text(url):
+    if not url:
+        return None
+    print("Pulling web text...")
+    return await asyncio.to_thread(get_webpage_text, url)
+
+
 async def process_llm_request(message, server_id, chain_id, skip_moderation=True, save_thinking=False):
-    """Processes a single LLM request."""
+    """Processes a single LLM request.
+
+    Moderation, attachment downloads, the web fetch, the chat history and the
+    system prompt are all started at once; the LLM call only waits for them
+    and for an allow verdict.  The user message is stored once moderation
+    passes, so the history is read without it and the message appended.
+    """
+    t_start = monotonic()
     print("Fetching context...")
-    id_to_name = db_manager.get_user_id_name_map(server_id)
-    id_to_name[str(config.BOT_USER_ID)] = config.BOT_DISPLAY_NAME
+    id_to_name = user_directory.names(server_id)
     user_content = _resolve_mentions(message.content, id_to_name)
+    timings = {}
 
+    moderation_task = None
     if not skip_moderation:
         print("Moderating message...")
-        mod_response = await llm_client.moderate(user_content)
-        if mod_response and re.search(r"\bblock\b", mod_response, re.IGNORECASE):
-            print(f"Moderation: blocked message from {message.author.display_name}")
-            await message.add_reaction("⚠️")
-            return
-
-    db_manager.write_message(server_id, chain_id, "user", user_content, username=message.author.display_name, message_id=str(message.id), channel_id=str(message.channel.id), channel_name=message.channel.name, user_id=str(message.author.id))
-
-    image_bytes_list = []
-    for attachment in message.attachments:
-        if attachment.content_type and attachment.content_type.startswith("image/"):
-            data = await attachment.read()
-            if attachment.content_type == "image/gif":
-                frame = Image.open(io.BytesIO(data))
-                frame.seek(0)
-                buf = io.BytesIO()
-                frame.convert("RGB").save(buf, format="PNG")
-                data = buf.getvalue()
-            image_bytes_list.append(data)
+        moderation_task = asyncio.create_task(_timed(timings, "moderation", moderator.check(user_content)))
+
+    images = [a for a in message.attachments if a.content_type and a.content_type.startswith("image/")]
+    prepare = asyncio.gather(
+        _timed(timings, "attachments", asyncio.gather(*(_read_image(a) for a in images))),
+        _timed(timings, "web", _fetch_web_text(extract_first_url(user_content))),
+        _timed(timings, "history", asyncio.to_thread(
+            db_manager.get_recent_messages, server_id, chain_id, max(config.NUM_CLOSEST_MESSAGES - 1, 0),
+        )),
+        _timed(timings, "prompt", _build_system_prompt(message, server_id, user_content, id_to_name)),
+    )
 
-    context_messages = db_manager.get_recent_messages(server_id, chain_id, config.NUM_CLOSEST_MESSAGES)
+    try:
+        if moderation_task:
+            moderation = await moderation_task
+            if moderation["verdict"] == "block":
+                await _discard(prepare)
+                print(f"Moderation: blocked message from {message.author.display_name}")
+                await message.add_reaction("⚠️")
+                return
+
+        image_bytes_list, url_text, context_messages, (system_prompt, metadata) = await prepare
+    finally:
+        # Nothing is left running if the other side raised
+        if moderation_task and not moderation_task.done():
+            await _discard(moderation_task)
+        if not prepare.done():
+            await _discard(prepare)
+    prepared_seconds = monotonic() - t_start
+    print("Prepare: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+          + f"; wall {prepared_seconds:.2f}s (sequential {sum(timings.values()):.2f}s)")
 
-    system_prompt = await _build_system_prompt(message, server_id, user_content, id_to_name)
+    db_manager.write_message(server_id, chain_id, "user", user_content, username=message.author.display_name, message_id=str(message.id), channel_id=str(message.channel.id), channel_name=message.channel.name, user_id=str(message.author.id))
+    context_messages.append(metadata)
+    context_messages.append({
+        "role": "user", "content": user_content, "username": message.author.display_name,
+        "channel_id": str(message.channel.id), "channel_name": message.channel.name,
+    })
 
     context_messages.insert(0, system_prompt)
 
     if image_bytes_list:
-        context_messages[-1]["images"] = image_bytes_list
+        context_messages[-1]["images"] = list(image_bytes_list)
 
-    if url := extract_first_url(user_content):
-        print("Pulling web text...")
-        url_text = get_webpage_text(url)
-        context_messages.append({"role": "tool", "content": url_text})
+    if url_text is not None:
+        context_messages.append({"role": "tool", "content": url_text, "section": "web"})
+
+    route = router.route(
+        server_id, str(message.channel.id), str(message.author.id), user_content,
+        images=bool(image_bytes_list), url=url_text is not None, debug=save_thinking,
+    )
 
     print("Running llm...")
 
@@ -1084,10 +1135,11 @@ async def process_llm_request(message, server_id, chain_id, skip_moderation=True
         async with asyncio.timeout(config.LLM_TIMEOUT_SECONDS):
             _, bot_response_content, _ = await _stream_llm(
                 message, context_messages, tools=tools, tool_handler=tool_handler,
-                debug=save_thinking,
+                debug=save_thinking, started=t_start, route=route,
             )
     except TimeoutError:
         print(f"LLM request timed out after {config.LLM_TIMEOUT_SECONDS}s", file=sys.stderr, flush=True)
+        router.record(route, monotonic() - t_start, timed_out=True)
         done.set()
         await status_task
         try:
@@ -1105,6 +1157,7 @@ async def process_llm_request(message, server_id, chain_id, skip_moderation=True
     except Exception as e:
         print(f"Error deleting status message: {e}", file=sys.stderr, flush=True)
 
+    router.record(route, monotonic() - t_start)
     if bot_response_content:
         reply = await message.reply(bot_response_content[: config.DISCORD_MAX_MESSAGE_LENGTH])
     else:
@@ -0,0 +1,171 @@
+"""Conversation chunking for RAG.
+
+A channel's messages are packed into chunks of up to RAG_CHUNK_TOKENS
+estimated tokens.  A chunk also ends once the channel has been quiet for
+RAG_CHUNK_GAP_MINUTES, unless the new message replies to one in the chunk.
+A chunk that ends because it is full hands its last RAG_CHUNK_OVERLAP_TOKENS
+worth of lines to the next one, so a conversation crossing the boundary can
+be found from either side, and a reply to a message outside its chunk
+carries a short quote of the parent.  Messages longer than a chunk are split
+on word boundaries instead of being truncated.  The live batcher and the
+backfill both use this, so they produce the same chunks.
+"""
+from collections import OrderedDict
+
+from cfmb.config import config
+from cfmb.context_budget import DEFAULT_CHARS_PER_TOKEN, estimate_tokens
+
+QUOTE_MAX_CHARS = 160
+REPLY_MEMORY = 256
+
+
+def split_text(text: str, max_tokens: int) -> list[str]:
+    """Splits text into pieces of at most max_tokens estimated tokens, on whitespace where possible."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    max_chars = max(int((max_tokens - 1) * DEFAULT_CHARS_PER_TOKEN), 1)
+    pieces, current = [], ""
+    for word in text.split():
+        while len(word) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) > max_chars:
+            pieces.append(current)
+            candidate = word
+        current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class Chunk:
+    """One chunk: its lines, the messages they came from and, once stored, its rag_chunks row id."""
+
+    def __init__(self, message_id):
+        self.message_id = message_id
+        self.lines = []
+        self.line_ids = []
+        self.tokens = 0
+        self.messages = 0
+        self.last_raw_id = None
+        self.row_id = None
+
+    @property
+    def content(self) -> str:
+        return "\n".join(self.lines)
+
+    def contains(self, message_id) -> bool:
+        return message_id in self.line_ids
+
+    def append(self, line, message_id):
+        self.lines.append(line)
+        self.line_ids.append(message_id)
+        self.tokens += estimate_tokens(line)
+
+
+class ChannelChunker:
+    """Chunks one channel's messages as they arrive, in order."""
+
+    def __init__(self, max_tokens=None, overlap_tokens=None, gap_minutes=None):
+        self.max_tokens = max_tokens or config.RAG_CHUNK_TOKENS
+        self.overlap_tokens = config.RAG_CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        gap_minutes = config.RAG_CHUNK_GAP_MINUTES if gap_minutes is None else gap_minutes
+        self.gap_ms = gap_minutes * 60_000 if gap_minutes else None
+        self.current = None
+        self.last_ms = None
+        self._recent = OrderedDict()
+
+    def resume(self, row_id, message_id, content):
+        """Continues an already stored chunk, e.g. the channel's latest one after a restart."""
+        self.current = Chunk(message_id)
+        for line in content.split("\n"):
+            self.current.append(line, None)
+        self.current.messages = len(self.current.lines)
+        self.current.row_id = row_id
+
+    def _start(self, message_id, overlap):
+        previous = self.current
+        self.current = Chunk(message_id)
+        if overlap and previous and self.overlap_tokens:
+            carried, tokens = [], 0
+            for line, line_id in zip(reversed(previous.lines), reversed(previous.line_ids)):
+                tokens += estimate_tokens(line)
+                if tokens > self.overlap_tokens:
+                    break
+                carried.append((line, line_id))
+            for line, line_id in reversed(carried):
+                self.current.append(line, line_id)
+        return self.current
+
+    def _make_room(self, tokens):
+        """Drops carried-over lines from the front of a fresh chunk until `tokens` more fit."""
+        chunk = self.current
+        while chunk.lines and chunk.messages == 0 and chunk.tokens + tokens > self.max_tokens:
+            chunk.tokens -= estimate_tokens(chunk.lines.pop(0))
+            chunk.line_ids.pop(0)
+
+    def _quote(self, reply_to):
+        parent = self._recent.get(reply_to)
+        if parent is None:
+            return None
+        return "> " + (parent if len(parent) <= QUOTE_MAX_CHARS else parent[:QUOTE_MAX_CHARS - 1] + "…")
+
+    def add(self, message_id, username, text, ts_ms=None, reply_to=None, raw_id=None) -> list[tuple[Chunk, bool]]:
+        """Adds a message and returns the chunks it touched as (chunk, is_new), in order.
+
+        A chunk that is not new has grown and needs its stored copy updated.
+        """
+        line = f"{username}: {text}"
+        replies_here = reply_to is not None and self.current is not None and self.current.contains(reply_to)
+        quiet = self.gap_ms is not None and ts_ms is not None and self.last_ms is not None and ts_ms - self.last_ms > self.gap_ms
+        quote = self._quote(reply_to) if reply_to is not None and not replies_here else None
+        touched = []
+
+        for i, piece in enumerate(split_text(line, self.max_tokens)):
+            cost = estimate_tokens(piece) + (estimate_tokens(quote) if quote and i == 0 else 0)
+            if self.current is None or (i == 0 and quiet and not replies_here):
+                touched.append((self._start(message_id, overlap=False), True))
+            elif self.current.tokens + cost > self.max_tokens:
+                touched.append((self._start(message_id, overlap=True), True))
+                self._make_room(cost)
+            chunk = self.current
+            if quote and i == 0 and cost <= self.max_tokens:
+                chunk.append(quote, reply_to)
+            chunk.append(piece, message_id)
+            if i == 0:
+                chunk.messages += 1
+            if raw_id is not None:
+                chunk.last_raw_id = raw_id
+            if not any(c is chunk for c, _ in touched):
+                touched.append((chunk, False))
+
+        self.last_ms = ts_ms if ts_ms is not None else self.last_ms
+        self._recent[message_id] = line
+        if len(self._recent) > REPLY_MEMORY:
+            self._recent.popitem(last=False)
+        return touched
+
+
+def chunk_messages(messages, **kwargs) -> list[Chunk]:
+    """Chunks one channel's messages (objects or dicts with message_id, username, content and
+    optionally ts_ms, reply_to and id) and returns the finished chunks in order."""
+    chunker = ChannelChunker(**kwargs)
+    chunks = []
+    for m in messages:
+        for chunk, new in chunker.add(
+            m["message_id"], m["username"], m["content"], _get(m, "ts_ms"), _get(m, "reply_to"), _get(m, "id"),
+        ):
+            if new:
+                chunks.append(chunk)
+    return chunks
+
+
+def _get(message, key):
+    try:
+        return message[key]
+    except (KeyError, AttributeError):
+        return None
@@ -0,0 +1,93 @@
+"""Transcript compaction.
+
+Picks a representative sample of a user's messages that fits a token budget:
+low-content lines ("lol", bare links) and near-duplicates are dropped, each
+remaining line is scored by how much uncommon vocabulary it carries, and lines
+are selected greedily, trading score against similarity to what has already
+been picked so that every topic the user talks about gets represented.  The
+sample is returned in the original order.
+"""
+import math
+import re
+
+MIN_CONTENT_WORDS = 2
+DUPLICATE_SIMILARITY = 0.8
+
+STOPWORDS = frozenset(
+    "the and for are but not you your yours all any can had her was one our out has have him his how its "
+    "let may who did get got yes yeah yep nope lol lmao haha just like that this with from they them then "
+    "than there their what when where which while will would could should about been into more some such "
+    "also very really too much well okay thanks thank sure know think going gonna want need dont ive "
+    "thats here she".split()
+)
+
+_TAG_RE = re.compile(r"^\[[^\]]*\]\s*")
+_URL_RE = re.compile(r"https?://\S+")
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def content_words(line: str) -> frozenset:
+    """Returns the set of meaningful words in a line, ignoring a leading [channel] tag, links,
+    stopwords and very short words."""
+    text = _URL_RE.sub(" ", _TAG_RE.sub("", line.lower()))
+    return frozenset(
+        w for w in (w.strip("'") for w in _WORD_RE.findall(text))
+        if (len(w) >= 3 or w.isdigit()) and w not in STOPWORDS
+    )
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def compact_lines(lines: list[str], max_tokens: int, estimate) -> list[str]:
+    """Returns a diverse, information-dense subset of lines whose total size is at most max_tokens.
+
+    Lines are kept in their original order.  If no line has enough content
+    to pass the filter, the most recent lines that fit the budget are kept
+    instead so there is always something to work with.
+    """
+    candidates = []
+    seen = set()
+    for i, line in enumerate(lines):
+        words = content_words(line)
+        if len(words) < MIN_CONTENT_WORDS or words in seen:
+            continue
+        seen.add(words)
+        candidates.append((i, line, words))
+
+    if not candidates:
+        kept, size = [], 0
+        for line in reversed(lines):
+            size += estimate(line)
+            if size > max_tokens:
+                break
+            kept.append(line)
+        return kept[::-1]
+
+    df = {}
+    for _, _, words in candidates:
+        for w in words:
+            df[w] = df.get(w, 0) + 1
+    n = len(candidates)
+    scores = [sum(math.log(1 + n / df[w]) for w in words) for _, _, words in candidates]
+    sizes = [estimate(line) for _, line, _ in candidates]
+
+    max_sim = [0.0] * n
+    remaining = set(range(n))
+    selected = []
+    budget = max_tokens
+    while remaining:
+        best = max(remaining, key=lambda j: scores[j] * (1 - max_sim[j]))
+        remaining.discard(best)
+        if sizes[best] > budget or max_sim[best] >= DUPLICATE_SIMILARITY:
+            continue
+        selected.append(best)
+        budget -= sizes[best]
+        words = candidates[best][2]
+        for j in remaining:
+            max_sim[j] = max(max_sim[j], _similarity(words, candidates[j][2]))
+
+    return [candidates[j][1] for j in sorted(selected)]
@@ -19,6 +19,10 @@ class Config(BaseSettings):
     OLLAMA_EMBEDDING_MODEL: Optional[str] = None
     NEWSLETTER_CHANNEL_ID: int
     NEWSLETTER_HOUR_ET: int = 10
+    NEWSLETTER_CONCURRENCY: int = 4
+    NEWSLETTER_PRECOMPUTE_HOUR_ET: int = 6
+    NEWSLETTER_CACHE_MAX_AGE_MINUTES: int = 60
+    NEWSLETTER_TOP_UP_MAX_AGE_MINUTES: int = 360
     BOT_DISPLAY_NAME: str = "Bot"
     NEWSLETTER_TITLE: str = "Daily Newsletter"
     MEETUP_URL: Optional[str] = None
@@ -26,6 +30,7 @@ class Config(BaseSettings):
     CURATION_SYSTEM_PROMPT: str
     DEV_CHANNEL_ID: int
     DEV_EXCLUDED_CHANNELS: str = ""
+    DISCORD_MEMBERS_INTENT: bool = False
     BRAVE_SEARCH_API_KEY: str
     LLM_TEMPERATURE: float
     LLM_TOP_P: float
@@ -34,7 +39,63 @@ class Config(BaseSettings):
     LLM_PRESENCE_PENALTY: float
     LLM_REPEAT_PENALTY: float
     OLLAMA_FAST_MODEL: str = ""
+    # Comma-separated Ollama hosts, each optionally "=model|model" for the models it serves; empty uses the default host.
+    OLLAMA_HOSTS: str = ""
+    OLLAMA_FAILURE_THRESHOLD: int = 3
+    OLLAMA_COOLDOWN_SECONDS: float = 30.0
+    OLLAMA_HEALTH_INTERVAL_SECONDS: int = 30
+    OLLAMA_HEALTH_TIMEOUT_SECONDS: float = 5.0
+    # keep_alive for the chat and embedding models, for other models, and per-model overrides ("model=30m, other=-1").
+    OLLAMA_KEEP_ALIVE_RESIDENT: str = "-1"
+    OLLAMA_KEEP_ALIVE: str = "5m"
+    OLLAMA_KEEP_ALIVE_MODELS: str = ""
+    OLLAMA_BATCH_GROUP_SECONDS: float = 60.0
+    # Prompts up to this many estimated tokens may go to the fast model.
+    ROUTE_FAST_MAX_TOKENS: int = 48
     LLM_TIMEOUT_SECONDS: int = 300
+    LLM_NUM_CTX: int = 8192
+    LLM_CONTEXT_RESERVE: int = 1024
+    # The current time in chat prompts is rounded down to this many minutes.
+    PROMPT_TIME_GRANULARITY_MINUTES: int = 15
+    LLM_BATCH_CONCURRENCY: int = 2
+    LLM_BACKGROUND_CONCURRENCY: int = 1
+    SUMMARY_WINDOW_TOKENS: int = 0
+    DIGEST_INTERVAL_MINUTES: int = 60
+    DIGEST_BUCKET_MESSAGES: int = 200
+    DIGEST_LOOKBACK_HOURS: int = 48
+    PROFILE_MIN_MESSAGES: int = 20
+    PROFILE_MIN_NEW_MESSAGES: int = 10
+    PROFILE_CONCURRENCY: int = 4
+    PROFILE_TRANSCRIPT_TOKENS: int = 0
+    SEARCH_EMBED_TIMEOUT_SECONDS: float = 2.0
+    SEARCH_EMBED_MAX_PENDING: int = 4
+    RAG_ROUTE_CHANNELS: int = 0
+    RAG_ROUTE_WEEKLY: bool = False
+    SEARCH_CACHE_SIZE: int = 256
+    SEARCH_CACHE_SIMILARITY: float = 0.97
+    SEARCH_CACHE_TTL_SECONDS: int = 600
+    MODERATION_CLASSIFIER: bool = True
+    MODERATION_KNN: int = 2
+    MODERATION_MARGIN: float = 0.05
+    # Wider than MODERATION_MARGIN: a wrong allow is worse than a wrong block. Tune with etc/benchmark_moderation.py.
+    MODERATION_ALLOW_MARGIN: float = 0.15
+    MODERATION_CACHE_SIZE: int = 1024
+    # Share of messages that get an emoji reaction, rising to REACTION_EXCITED_RATE for excited ones.
+    REACTION_RATE: float = 0.01
+    REACTION_EXCITED_RATE: float = 0.10
+    REACTION_QUEUE_SIZE: int = 8
+    REACTION_EMBED_MIN_SIMILARITY: float = 0.5
+    REACTION_LLM: bool = True
+    RAG_CHUNK_TOKENS: int = 192
+    RAG_CHUNK_OVERLAP_TOKENS: int = 32
+    RAG_CHUNK_GAP_MINUTES: int = 30
+    RAG_BACKFILL_HOURS: int = 7 * 24
+    RAG_BACKFILL_BATCH_SIZE: int = 32
+    RAG_BACKFILL_CONCURRENCY: int = 4
+    # Model that produced embeddings stored before they were tagged; defaults to OLLAMA_EMBEDDING_MODEL.
+    EMBEDDING_LEGACY_MODEL: Optional[str] = None
+    EMBEDDING_MIGRATION_BATCH_SIZE: int = 16
+    EMBEDDING_MIGRATION_PAUSE_SECONDS: float = 2.0
     LLM_TIMEOUT_MESSAGE: str = "Comrade, our computational resources have been temporarily diverted to the greater good. Please try again later. 🐻"
 
 
@@ -0,0 +1,198 @@
+"""Token budgeting for prompts sent to Ollama.
+
+Prompts are split into named sections (system, profile, history, tools, web).
+Each section gets a share of the model context window; sections that need less
+than their share donate the remainder to sections that need more, and anything
+still over budget is trimmed according to the section's policy.
+"""
+
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+SECTION_SHARES = {
+    "system": 0.15,
+    "profile": 0.10,
+    "history": 0.45,
+    "tools": 0.15,
+    "web": 0.15,
+}
+
+# head: keep the start of the text, drop the end (documents, prompts)
+# tail: keep the end of the text, drop the oldest lines (transcripts, history)
+# middle: keep the start and end, drop the middle (tool output)
+SECTION_POLICIES = {
+    "system": "head",
+    "profile": "head",
+    "history": "tail",
+    "tools": "middle",
+    "web": "head",
+}
+
+ROLE_SECTIONS = {
+    "system": "system",
+    "user": "history",
+    "assistant": "history",
+    "tool": "tools",
+}
+
+TRIM_MARKER = "\n[…]\n"
+
+
+def estimate_tokens(text: str, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> int:
+    """Estimates the token count of a string from its length."""
+    if not text:
+        return 0
+    return int(len(text) / chars_per_token) + 1
+
+
+def trim_text(text: str, max_chars: int, policy: str) -> str:
+    """Trims text to at most max_chars characters using the given policy."""
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= len(TRIM_MARKER):
+        return ""
+    keep = max_chars - len(TRIM_MARKER)
+    if policy == "head":
+        head = text[:keep]
+        cut = head.rfind("\n")
+        return (head[:cut] if cut > keep // 2 else head) + TRIM_MARKER
+    if policy == "tail":
+        tail = text[-keep:]
+        cut = tail.find("\n")
+        return TRIM_MARKER + (tail[cut + 1:] if 0 <= cut < keep // 2 else tail)
+    if policy == "middle":
+        return text[:keep // 2] + TRIM_MARKER + text[-(keep - keep // 2):]
+    raise ValueError(f"Unknown trim policy: {policy}")
+
+
+def section_of(message: dict) -> str:
+    """Returns the budget section a chat message belongs to."""
+    return message.get("section") or ROLE_SECTIONS.get(message.get("role"), "history")
+
+
+class ContextBudget:
+    """Allocates a model's context window across prompt sections."""
+
+    def __init__(self, num_ctx: int, reserve_tokens: int = 1024, shares: dict[str, float] | None = None):
+        self.num_ctx = num_ctx
+        self.reserve_tokens = reserve_tokens
+        self.shares = shares or SECTION_SHARES
+        self.chars_per_token = {}
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Tokens available for the prompt once the reply reserve is set aside."""
+        return max(self.num_ctx - self.reserve_tokens, 0)
+
+    def ratio(self, model: str | None = None) -> float:
+        return self.chars_per_token.get(model, DEFAULT_CHARS_PER_TOKEN)
+
+    def calibrate(self, model: str, chars: int, prompt_eval_count: int | None):
+        """Updates the chars-per-token estimate for a model from Ollama's reported prompt size.
+
+        Ollama reports prompt_eval_count=0 (or omits it) when the whole prompt came
+        from its cache, so only full evaluations of a reasonable size are used.
+        """
+        if not prompt_eval_count or prompt_eval_count < 64 or not chars:
+            return
+        if prompt_eval_count < 0.5 * chars / self.ratio(model):
+            return  # mostly served from the prompt cache
+        observed = min(max(chars / prompt_eval_count, 1.5), 8.0)
+        self.chars_per_token[model] = 0.8 * self.ratio(model) + 0.2 * observed
+
+    def estimate(self, text: str, model: str | None = None) -> int:
+        return estimate_tokens(text, self.ratio(model))
+
+    def section_limit(self, section: str) -> int:
+        """Token limit for a section when every section is full."""
+        return int(self.prompt_tokens * self.shares.get(section, 0))
+
+    def allocate(self, needs: dict[str, int]) -> dict[str, int]:
+        """Splits the prompt budget across sections given how many tokens each one needs.
+
+        Sections needing less than their share keep what they need; the surplus
+        is handed to the oversubscribed sections in proportion to their shares.
+        """
+        total = self.prompt_tokens
+        if sum(needs.values()) <= total:
+            return dict(needs)
+        alloc = {}
+        pending = dict(needs)
+        remaining = total
+        while pending:
+            weight = sum(self.shares.get(s, 0.05) for s in pending)
+            fits = {
+                s: n for s, n in pending.items()
+                if n <= remaining * self.shares.get(s, 0.05) / weight
+            }
+            if not fits:
+                for s in pending:
+                    alloc[s] = int(remaining * self.shares.get(s, 0.05) / weight)
+                break
+            for s, n in fits.items():
+                alloc[s] = n
+                remaining -= n
+                del pending[s]
+        return alloc
+
+    def trim(self, text: str, section: str, max_tokens: int | None = None, model: str | None = None) -> str:
+        """Trims text to a section's token limit using the section's policy."""
+        if max_tokens is None:
+            max_tokens = self.section_limit(section)
+        max_chars = int(max_tokens * self.ratio(model))
+        return trim_text(text, max_chars, SECTION_POLICIES.get(section, "head"))
+
+    def fit(self, messages: list[dict], model: str | None = None) -> tuple[list[dict], dict]:
+        """Trims a chat message list to fit the context window.
+
+        Messages may carry a "section" key to override the role-based section;
+        it is removed from the returned copies.  Within the history section the
+        oldest messages are dropped before any message is cut.  Returns the
+        fitted messages and a usage report of {section: (used, needed)} tokens.
+        """
+        needs = {}
+        for m in messages:
+            s = section_of(m)
+            needs[s] = needs.get(s, 0) + self.estimate(m.get("content") or "", model)
+        alloc = self.allocate(needs)
+
+        fitted = [{k: v for k, v in m.items() if k != "section"} for m in messages]
+        sections = [section_of(m) for m in messages]
+        for s, limit in alloc.items():
+            if needs[s] <= limit:
+                continue
+            indexes = [i for i, sec in enumerate(sections) if sec == s]
+            if SECTION_POLICIES.get(s) == "tail":
+                # Keep the newest messages whole; cut the oldest one that straddles the limit
+                budget = limit
+                for i in reversed(indexes):
+                    size = self.estimate(fitted[i].get("content") or "", model)
+                    if size <= budget:
+                        budget -= size
+                        continue
+                    fitted[i]["content"] = self.trim(fitted[i].get("content") or "", s, budget, model)
+                    budget = 0
+            else:
+                per_message = limit // len(indexes)
+                for i in indexes:
+                    fitted[i]["content"] = self.trim(fitted[i].get("content") or "", s, per_message, model)
+
+        # Drop messages whose content was trimmed away entirely, but never the last one
+        kept = [
+            (m, s) for i, (m, s) in enumerate(zip(fitted, sections))
+            if i == len(fitted) - 1 or m.get("content") or m.get("images") or m.get("tool_calls")
+        ]
+        used = {}
+        for m, s in kept:
+            used[s] = used.get(s, 0) + self.estimate(m.get("content") or "", model)
+        report = {s: (used.get(s, 0), needs[s]) for s in needs}
+        return [m for m, _ in kept], report
+
+
+def format_usage(label: str, report: dict, num_ctx: int) -> str:
+    """Formats a fit() usage report as a single log line, marking trimmed sections."""
+    parts = " ".join(
+        f"{s}={used}" + (f"(trimmed from {needed})" if used < needed else "")
+        for s, (used, needed) in report.items()
+    )
+    total = sum(used for used, _ in report.values())
+    return f"Context budget [{label}]: {parts} total={total}/{num_ctx}"
@@ -1,9 +1,112 @@
 from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import groupby
+import json
 import sqlite3
 import struct
+import time
 
 import sqlite_vec
 
+# Full-text indexes over the content column of these tables, kept in sync by triggers.
+FTS_TABLES = {"raw_messages_fts": "raw_messages", "rag_chunks_fts": "rag_chunks"}
+
+# Indexed integer epoch-millisecond copies of text timestamp columns: table -> (text column, ms column).
+EPOCH_COLUMNS = {
+    "raw_messages": ("timestamp", "ts_ms"),
+    "rag_chunks": ("timestamp", "ts_ms"),
+    "summaries": ("timestamp", "ts_ms"),
+    "user_profiles": ("created_at", "created_ms"),
+}
+
+
+def _epoch_ms_sql(expr):
+    return f"CAST(ROUND((julianday({expr}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def _ms_ago(hours):
+    """Epoch milliseconds `hours` hours before now."""
+    return int(time.time() * 1000) - int(hours * 3_600_000)
+
+
+def _hour_ms_ago(hours):
+    """Epoch milliseconds of the start of the hour `hours` hours before now."""
+    return _ms_ago(hours) // 3_600_000 * 3_600_000
+
+
+def _to_ms(value):
+    """Epoch milliseconds for a datetime or ISO/SQLite timestamp string (naive values are UTC)."""
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _since(table, alias=None):
+    """SQL condition keeping rows of table with ts_ms >= ?; bind the cutoff twice.
+
+    The first row id at or after the cutoff is looked up through the ts_ms index
+    so the outer query can range-scan the primary key; the ts_ms test keeps the
+    result exact if rows were ever inserted out of time order.
+    """
+    prefix = f"{alias}." if alias else ""
+    return f"{prefix}id >= (SELECT MIN(id) FROM {table} INDEXED BY idx_{table}_ts_ms WHERE ts_ms >= ?) AND {prefix}ts_ms >= ?"
+
+
+def _embedding_filter(dim, model=None, include_untagged=False):
+    """SQL condition and params restricting rag_chunks to one embedding dimension and, optionally, model."""
+    if model is None:
+        return "AND embedding_dim = ?", [dim]
+    untagged = " OR embedding_model IS NULL" if include_untagged else ""
+    return f"AND embedding_dim = ? AND (embedding_model = ?{untagged})", [dim, model]
+
+
+RAW_FETCH_BATCH = 1000
+
+
+class RawMessage:
+    """A raw message row from a streaming read.
+
+    Fields are attributes, and can also be read by key like the dicts the
+    list-returning reads produce.
+    """
+
+    __slots__ = ("id", "message_id", "username", "content", "channel_id", "channel_name", "ts_ms", "reply_to")
+
+    def __init__(self, id, message_id, username, content, channel_id, channel_name, ts_ms, reply_to):
+        self.id = id
+        self.message_id = message_id
+        self.username = username
+        self.content = content
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.ts_ms = ts_ms
+        self.reply_to = reply_to
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+def iter_channels(messages, excluded=()):
+    """Groups a stream of messages ordered by channel into (channel_id, name, messages) on the fly.
+
+    messages is consumed lazily; each channel's messages iterator must be used
+    before advancing to the next channel.  Excluded channels are skipped.
+    """
+    for cid, group in groupby(messages, key=lambda m: m["channel_id"] or "unknown"):
+        if cid in excluded:
+            continue
+        first = next(group)
+        yield cid, first["channel_name"] or cid, _chain_first(first, group)
+
+
+def _chain_first(first, rest):
+    yield first
+    yield from rest
+
 
 class DatabaseManager:
     def __init__(self, db_name):
@@ -102,6 +205,11 @@ class DatabaseManager:
                     cursor.execute("ALTER TABLE raw_messages ADD COLUMN channel_name TEXT")
                 except sqlite3.OperationalError:
                     pass  # column already exists
+                try:
+                    cursor.execute("ALTER TABLE raw_messages ADD COLUMN reply_to TEXT")
+                except sqlite3.OperationalError:
+                    pass  # column already exists
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_raw_messages_server_user ON raw_messages (server_id, user_id)")
                 cursor.execute(
                     """
                     CREATE TABLE IF NOT EXISTS user_profiles (
@@ -123,6 +231,39 @@ class DatabaseManager:
                     )
                     """
                 )
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS newsletters (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        server_id TEXT,
+                        last_message_id INTEGER,
+                        summaries TEXT,
+                        curated TEXT,
+                        joke TEXT,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS digests (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        server_id TEXT,
+                        channel_id TEXT,
+                        channel_name TEXT,
+                        level TEXT,
+                        bucket_start DATETIME,
+                        first_message_id INTEGER,
+                        last_message_id INTEGER,
+                        message_count INTEGER,
+                        content TEXT,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_digests_server_level_bucket ON digests (server_id, level, bucket_start)"
+                )
                 cursor.execute(
                     """
                     CREATE TABLE IF NOT EXISTS rag_chunks (
@@ -137,9 +278,308 @@ class DatabaseManager:
                     )
                     """
                 )
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_rag_chunks_server_channel ON rag_chunks (server_id, channel_id)"
+                )
+                self._add_embedding_tags(cursor)
+                for fts, table in FTS_TABLES.items():
+                    self._create_fts_index(cursor, fts, table)
+                self._create_rag_centroids(cursor)
+                self._create_rag_versions(cursor)
+                cursor.execute("UPDATE summaries SET timestamp = datetime(timestamp) WHERE timestamp LIKE '%T%'")
+                for table, (source, column) in EPOCH_COLUMNS.items():
+                    self._add_epoch_column(cursor, table, source, column)
+                self._create_users(cursor)
+                self._create_activity_hourly(cursor)
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS rag_backfill_checkpoints (
+                        server_id TEXT NOT NULL,
+                        channel_id TEXT NOT NULL,
+                        last_raw_id INTEGER NOT NULL,
+                        chunk_count INTEGER NOT NULL DEFAULT 0,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (server_id, channel_id)
+                    )
+                    """
+                )
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS model_overrides (
+                        server_id TEXT NOT NULL,
+                        scope TEXT NOT NULL,
+                        target_id TEXT NOT NULL,
+                        mode TEXT NOT NULL,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (server_id, scope, target_id)
+                    )
+                    """
+                )
         except sqlite3.Error as e:
             print(f"Database initialization error: {e}")
 
+    @staticmethod
+    def _create_users(cursor):
+        """Creates the users directory, maintained from raw_messages inserts by a trigger.
+
+        Each row holds a user's latest display name, their last message (id and
+        epoch ms), when they posted before that and how many messages they have
+        posted.  A newly created table is filled from the existing messages.
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'").fetchone()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                server_id TEXT,
+                user_id TEXT,
+                username TEXT,
+                last_seen_ms INTEGER,
+                message_count INTEGER,
+                PRIMARY KEY (server_id, user_id)
+            )
+            """
+        )
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(users)")}
+        for column in ("last_message_id", "previous_seen_ms"):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE users ADD COLUMN {column} INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_server_last_seen ON users (server_id, last_seen_ms)")
+        cursor.executescript(
+            f"""
+            DROP TRIGGER IF EXISTS users_ai;
+            CREATE TRIGGER users_ai AFTER INSERT ON raw_messages WHEN new.user_id IS NOT NULL BEGIN
+                INSERT INTO users (server_id, user_id, username, last_seen_ms, message_count, last_message_id)
+                VALUES (new.server_id, new.user_id, new.username, {_epoch_ms_sql("new.timestamp")}, 1, new.id)
+                ON CONFLICT DO UPDATE SET
+                    username = excluded.username,
+                    previous_seen_ms = last_seen_ms,
+                    last_seen_ms = MAX(last_seen_ms, excluded.last_seen_ms),
+                    last_message_id = excluded.last_message_id,
+                    message_count = message_count + 1;
+            END;
+            """
+        )
+        if not exists:
+            cursor.execute(
+                f"""
+                INSERT INTO users (server_id, user_id, username, last_seen_ms, message_count, last_message_id)
+                SELECT server_id, user_id, username, {_epoch_ms_sql("timestamp")}, COUNT(*), id
+                FROM raw_messages
+                WHERE user_id IS NOT NULL
+                GROUP BY server_id, user_id
+                HAVING MAX(id)
+                """
+            )
+
+    @staticmethod
+    def _create_activity_hourly(cursor):
+        """Creates the hourly activity rollup, maintained from raw_messages by triggers.
+
+        Each row counts one user's messages in one channel during one hour
+        (hour_ms, the epoch ms of the start of the hour).  Slash commands are not
+        counted.  A newly created table is filled from the existing messages.
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='activity_hourly'").fetchone()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS activity_hourly (
+                server_id TEXT,
+                hour_ms INTEGER,
+                channel_id TEXT,
+                user_id TEXT,
+                channel_name TEXT,
+                message_count INTEGER,
+                PRIMARY KEY (server_id, hour_ms, channel_id, user_id)
+            )
+            """
+        )
+        hour = f"({_epoch_ms_sql('{row}.timestamp')} / 3600000 * 3600000)"
+        add = f"""
+            INSERT INTO activity_hourly (server_id, hour_ms, channel_id, user_id, channel_name, message_count)
+            VALUES (new.server_id, {hour.format(row="new")}, COALESCE(new.channel_id, ''), new.user_id, new.channel_name, 1)
+            ON CONFLICT DO UPDATE SET message_count = message_count + 1, channel_name = excluded.channel_name;
+        """
+        remove = f"""
+            UPDATE activity_hourly SET message_count = message_count - 1
+            WHERE server_id = old.server_id AND hour_ms = {hour.format(row="old")}
+              AND channel_id = COALESCE(old.channel_id, '') AND user_id = old.user_id;
+        """
+        counted = "{row}.user_id IS NOT NULL AND {row}.content NOT LIKE '/%'"
+        cursor.executescript(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS activity_hourly_ai AFTER INSERT ON raw_messages
+            WHEN {counted.format(row="new")} BEGIN {add} END;
+            CREATE TRIGGER IF NOT EXISTS activity_hourly_au AFTER UPDATE OF timestamp ON raw_messages
+            WHEN {counted.format(row="new")} BEGIN {remove} {add} END;
+            """
+        )
+        if not exists:
+            cursor.execute(
+                f"""
+                INSERT INTO activity_hourly (server_id, hour_ms, channel_id, user_id, channel_name, message_count)
+                SELECT server_id, {hour.format(row="raw_messages")}, COALESCE(channel_id, ''), user_id, MAX(channel_name), COUNT(*)
+                FROM raw_messages
+                WHERE {counted.format(row="raw_messages")}
+                GROUP BY 1, 2, 3, 4
+                """
+            )
+
+    @staticmethod
+    def _add_epoch_column(cursor, table, source, column):
+        """Adds an indexed epoch-ms column mirroring a text timestamp, filled by triggers and backfilled."""
+        if column not in {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+        cursor.execute(f"UPDATE {table} SET {column} = {_epoch_ms_sql(source)} WHERE {column} IS NULL")
+        cursor.executescript(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_{column}_ai AFTER INSERT ON {table} BEGIN
+                UPDATE {table} SET {column} = {_epoch_ms_sql(f"new.{source}")} WHERE id = new.id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS {table}_{column}_au AFTER UPDATE OF {source} ON {table} BEGIN
+                UPDATE {table} SET {column} = {_epoch_ms_sql(f"new.{source}")} WHERE id = new.id;
+            END;
+            """
+        )
+
+    @staticmethod
+    def _add_embedding_tags(cursor):
+        """Adds the embedding_model and embedding_dim columns to rag_chunks, filling in the dimension of existing rows.
+
+        Rows written before the columns existed keep a NULL model until the
+        re-embedding worker tags them.
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(rag_chunks)")}
+        if "embedding_model" not in columns:
+            cursor.execute("ALTER TABLE rag_chunks ADD COLUMN embedding_model TEXT")
+        if "embedding_dim" not in columns:
+            cursor.execute("ALTER TABLE rag_chunks ADD COLUMN embedding_dim INTEGER")
+        cursor.execute("UPDATE rag_chunks SET embedding_dim = length(embedding) / 4 WHERE embedding_dim IS NULL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rag_chunks_embedding_model ON rag_chunks (embedding_model)")
+
+    @staticmethod
+    def _create_rag_centroids(cursor):
+        """Creates the rag_centroids table and the triggers that keep it in step with rag_chunks.
+
+        Each row holds the sum of the chunk embeddings of one channel, either over
+        all time (week '') or for one week ('%Y-%W'), per embedding dimension.
+        Cosine distance ignores scale, so the sum ranks like the mean.  A newly
+        created table is filled from the existing chunks.
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='rag_centroids'").fetchone()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rag_centroids (
+                server_id TEXT,
+                channel_id TEXT,
+                week TEXT,
+                dim INTEGER,
+                chunk_count INTEGER,
+                embedding BLOB NOT NULL,
+                PRIMARY KEY (server_id, channel_id, week, dim)
+            )
+            """
+        )
+        add = """
+            INSERT INTO rag_centroids (server_id, channel_id, week, dim, chunk_count, embedding)
+            VALUES ({row}.server_id, {row}.channel_id, {week}, vec_length({row}.embedding), 1, {row}.embedding)
+            ON CONFLICT DO UPDATE SET chunk_count = chunk_count + 1, embedding = vec_add(embedding, excluded.embedding);
+        """
+        remove = """
+            UPDATE rag_centroids SET chunk_count = chunk_count - 1, embedding = vec_sub(embedding, {row}.embedding)
+            WHERE server_id = {row}.server_id AND channel_id = {row}.channel_id
+              AND week = {week} AND dim = vec_length({row}.embedding);
+            DELETE FROM rag_centroids
+            WHERE server_id = {row}.server_id AND channel_id = {row}.channel_id AND chunk_count <= 0;
+        """
+        def both(template, row):
+            return "".join(template.format(row=row, week=week) for week in ("''", f"strftime('%Y-%W', {row}.timestamp)"))
+        cursor.executescript(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS rag_centroids_ai AFTER INSERT ON rag_chunks BEGIN
+                {both(add, "new")}
+            END;
+            CREATE TRIGGER IF NOT EXISTS rag_centroids_ad AFTER DELETE ON rag_chunks BEGIN
+                {both(remove, "old")}
+            END;
+            CREATE TRIGGER IF NOT EXISTS rag_centroids_au AFTER UPDATE OF embedding ON rag_chunks BEGIN
+                {both(remove, "old")}
+                {both(add, "new")}
+            END;
+            """
+        )
+        if not exists:
+            rows = cursor.execute("SELECT server_id, channel_id, timestamp, embedding FROM rag_chunks").fetchall()
+            for server_id, channel_id, timestamp, embedding in rows:
+                for week in ("", None):
+                    cursor.execute(
+                        """
+                        INSERT INTO rag_centroids (server_id, channel_id, week, dim, chunk_count, embedding)
+                        VALUES (?, ?, COALESCE(?, strftime('%Y-%W', ?)), vec_length(?), 1, ?)
+                        ON CONFLICT DO UPDATE SET chunk_count = chunk_count + 1, embedding = vec_add(embedding, excluded.embedding)
+                        """,
+                        (server_id, channel_id, week, timestamp, embedding, embedding),
+                    )
+
+    @staticmethod
+    def _create_rag_versions(cursor):
+        """Creates per-channel counters that triggers bump when rag_chunks rows are added or removed.
+
+        Updates, which happen on every message while the open chunk grows, do
+        not bump them; cached searches see those once their TTL runs out.
+        Replaces the earlier per-server rag_versions counter.
+        """
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rag_channel_versions (
+                server_id TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (server_id, channel_id)
+            )
+            """
+        )
+        bump = """
+            INSERT INTO rag_channel_versions (server_id, channel_id, version)
+            VALUES ({row}.server_id, COALESCE({row}.channel_id, ''), 1)
+            ON CONFLICT DO UPDATE SET version = version + 1;
+        """
+        cursor.executescript(
+            f"""
+            DROP TRIGGER IF EXISTS rag_versions_ai;
+            DROP TRIGGER IF EXISTS rag_versions_ad;
+            DROP TRIGGER IF EXISTS rag_versions_au;
+            DROP TABLE IF EXISTS rag_versions;
+            CREATE TRIGGER IF NOT EXISTS rag_channel_versions_ai AFTER INSERT ON rag_chunks BEGIN {bump.format(row="new")} END;
+            CREATE TRIGGER IF NOT EXISTS rag_channel_versions_ad AFTER DELETE ON rag_chunks BEGIN {bump.format(row="old")} END;
+            """
+        )
+
+    @staticmethod
+    def _create_fts_index(cursor, fts, table):
+        """Creates an external-content FTS5 index over table.content with sync triggers.
+
+        A newly created index is built from the existing rows.
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts,)).fetchone()
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(content, content='{table}', content_rowid='id')")
+        cursor.executescript(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF content ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content);
+            END;
+            """
+        )
+        if not exists:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
     def write_message(self, server_id, chain_id, role, content, username=None, message_id=None, channel_id=None, channel_name=None, user_id=None):
         """Writes a message to the database."""
         try:
@@ -243,14 +683,14 @@ class DatabaseManager:
             print(f"Database read error: {e}")
             return default
 
-    def write_raw_message(self, server_id, message_id, user_id, username, content, channel_id=None, channel_name=None):
-        """Records every incoming message to the raw_messages table."""
+    def write_raw_message(self, server_id, message_id, user_id, username, content, channel_id=None, channel_name=None, reply_to=None):
+        """Records every incoming message to the raw_messages table; reply_to is the id of the message it replies to."""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    "INSERT INTO raw_messages (server_id, message_id, user_id, username, content, channel_id, channel_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (server_id, message_id, user_id, username, content, channel_id, channel_name),
+                    "INSERT INTO raw_messages (server_id, message_id, user_id, username, content, channel_id, channel_name, reply_to) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (server_id, message_id, user_id, username, content, channel_id, channel_name, reply_to),
                 )
         except sqlite3.Error as e:
             print(f"Database write error: {e}")
@@ -277,73 +717,100 @@ class DatabaseManager:
             print(f"Database read error: {e}")
             return []
 
-    def get_raw_messages_24h(self, server_id):
-        """Retrieves all raw messages from the past 24 hours, ordered by channel then time."""
+    def iter_raw_messages(self, server_id, start_ms, end_ms=None, batch_size=RAW_FETCH_BATCH, after_id=None, exclude_channels=None):
+        """Yields RawMessage records with start_ms <= ts_ms (< end_ms, if given), ordered by channel then time.
+
+        after_id, if given, further limits the rows to those with a higher row
+        id, and channels in exclude_channels are left out.  Rows are fetched
+        `batch_size` at a time, so only one batch is held in memory; the
+        connection stays open until the generator is exhausted or closed.
+        """
+        params = [server_id, start_ms, start_ms]
+        filters = ""
+        if end_ms is not None:
+            filters += " AND ts_ms < ?"
+            params.append(end_ms)
+        if after_id is not None:
+            filters += " AND id > ?"
+            params.append(after_id)
+        if exclude_channels:
+            filters += f" AND COALESCE(channel_id, 'unknown') NOT IN ({','.join('?' * len(exclude_channels))})"
+            params.extend(exclude_channels)
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
+                cursor.row_factory = None
                 cursor.execute(
-                    """
-                    SELECT username, content, channel_id, channel_name FROM raw_messages
+                    f"""
+                    SELECT id, message_id, username, content, channel_id, channel_name, ts_ms, reply_to FROM raw_messages
                     WHERE server_id = ?
-                      AND timestamp >= datetime('now', '-24 hours')
+                      AND {_since('raw_messages')}
+                      {filters}
                       AND channel_name IS NOT NULL
                       AND content NOT LIKE '/%'
-                    ORDER BY channel_id, timestamp ASC
+                    ORDER BY channel_id, ts_ms ASC, id ASC
                     """,
-                    (server_id,),
+                    params,
                 )
-                rows = cursor.fetchall()
-            return [
-                {"username": username, "content": content, "channel_id": channel_id, "channel_name": channel_name}
-                for username, content, channel_id, channel_name in rows
-            ]
+                while rows := cursor.fetchmany(batch_size):
+                    for row in rows:
+                        yield RawMessage(*row)
         except sqlite3.Error as e:
             print(f"Database read error: {e}")
-            return []
+
+    def iter_raw_messages_24h(self, server_id, batch_size=RAW_FETCH_BATCH):
+        """Streams the raw messages from the past 24 hours, ordered by channel then time."""
+        return self.iter_raw_messages(server_id, _ms_ago(24), batch_size=batch_size)
+
+    def iter_raw_messages_date_range(self, server_id, start_iso, end_iso, batch_size=RAW_FETCH_BATCH):
+        """Streams the raw messages between two ISO timestamps, ordered by channel then time."""
+        return self.iter_raw_messages(server_id, _to_ms(start_iso), _to_ms(end_iso), batch_size=batch_size)
+
+    def get_raw_messages_24h(self, server_id):
+        """Retrieves all raw messages from the past 24 hours, ordered by channel then time."""
+        return [m.to_dict() for m in self.iter_raw_messages_24h(server_id)]
 
     def get_raw_messages_date_range(self, server_id, start_iso, end_iso):
         """Retrieves raw messages between two ISO timestamps, ordered by channel then time."""
+        return [m.to_dict() for m in self.iter_raw_messages_date_range(server_id, start_iso, end_iso)]
+
+    def get_last_raw_message_id(self, server_id, hours=24):
+        """Returns the highest row id among the past `hours` hours of summarizable raw messages, or None."""
+        cutoff = _ms_ago(hours)
         try:
             with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    SELECT username, content, channel_id, channel_name FROM raw_messages
+                row = conn.execute(
+                    f"""
+                    SELECT MAX(id) FROM raw_messages
                     WHERE server_id = ?
-                      AND timestamp >= ?
-                      AND timestamp < ?
+                      AND {_since('raw_messages')}
                       AND channel_name IS NOT NULL
                       AND content NOT LIKE '/%'
-                    ORDER BY channel_id, timestamp ASC
                     """,
-                    (server_id, start_iso, end_iso),
-                )
-                rows = cursor.fetchall()
-            return [
-                {"username": username, "content": content, "channel_id": channel_id, "channel_name": channel_name}
-                for username, content, channel_id, channel_name in rows
-            ]
+                    (server_id, cutoff, cutoff),
+                ).fetchone()
+            return row[0]
         except sqlite3.Error as e:
             print(f"Database read error: {e}")
-            return []
+            return None
 
     def get_raw_messages_by_user_7d(self, server_id, user_id, limit=500):
         """Retrieves up to `limit` raw messages from a specific user in the past 7 days."""
+        cutoff = _ms_ago(7 * 24)
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    """
+                    f"""
                     SELECT username, content, channel_name FROM raw_messages
                     WHERE server_id = ?
                       AND user_id = ?
-                      AND timestamp >= datetime('now', '-7 days')
+                      AND {_since('raw_messages')}
                       AND content NOT LIKE '/%'
-                    ORDER BY timestamp ASC
+                    ORDER BY ts_ms ASC, id ASC
                     LIMIT ?
                     """,
-                    (server_id, str(user_id), limit),
+                    (server_id, str(user_id), cutoff, cutoff, limit),
                 )
                 rows = cursor.fetchall()
             return [
@@ -354,38 +821,93 @@ class DatabaseManager:
             print(f"Database read error: {e}")
             return []
 
-    def get_user_id_name_map(self, server_id):
-        """Returns a dict of user_id -> most recent display name for active users in the past week."""
+    def get_raw_messages_by_users_7d(self, server_id, user_ids, limit=500):
+        """Retrieves up to `limit` raw messages per user in the past 7 days in one query.
+
+        Returns {user_id: [{"username", "content", "channel_name"}]} in time order.
+        """
+        user_ids = [str(u) for u in user_ids]
+        if not user_ids:
+            return {}
+        placeholders = ",".join("?" * len(user_ids))
+        cutoff = _ms_ago(7 * 24)
         try:
             with self._get_connection() as conn:
                 rows = conn.execute(
-                    """
-                    SELECT user_id, username FROM raw_messages
-                    WHERE server_id = ?
-                      AND timestamp >= datetime('now', '-7 days')
-                      AND user_id IS NOT NULL
-                    GROUP BY user_id
-                    HAVING MAX(timestamp)
+                    f"""
+                    SELECT user_id, username, content, channel_name FROM (
+                        SELECT user_id, username, content, channel_name,
+                               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY ts_ms ASC, id ASC) AS n
+                        FROM raw_messages
+                        WHERE server_id = ?
+                          AND user_id IN ({placeholders})
+                          AND {_since('raw_messages')}
+                          AND content NOT LIKE '/%'
+                    )
+                    WHERE n <= ?
+                    ORDER BY user_id, n ASC
                     """,
-                    (server_id,),
+                    (server_id, *user_ids, cutoff, cutoff, limit),
+                ).fetchall()
+            by_user = {}
+            for user_id, username, content, channel_name in rows:
+                by_user.setdefault(user_id, []).append(
+                    {"username": username, "content": content, "channel_name": channel_name}
+                )
+            return by_user
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return {}
+
+    def get_user_id_name_map(self, server_id, days=7):
+        """Returns a dict of user_id -> most recent display name for users seen in the past `days` days.
+
+        With days=None every known user is returned.
+        """
+        time_filter = "AND last_seen_ms >= ?" if days is not None else ""
+        params = [server_id] + ([_ms_ago(days * 24)] if days is not None else [])
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    f"SELECT user_id, username FROM users WHERE server_id = ? {time_filter}",
+                    params,
                 ).fetchall()
             return {user_id: username for user_id, username in rows}
         except sqlite3.Error as e:
             print(f"Database read error: {e}")
             return {}
 
+    def update_user_name(self, server_id, user_id, username):
+        """Records a display name change for a known user without counting a message."""
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "UPDATE users SET username = ? WHERE server_id = ? AND user_id = ?",
+                    (username, server_id, str(user_id)),
+                )
+        except sqlite3.Error as e:
+            print(f"Database write error: {e}")
+
     def get_previous_message_timestamp(self, server_id, user_id, current_message_id):
-        """Returns the timestamp of the user's most recent message before the current one, within 7 days."""
+        """Returns the timestamp of the user's most recent message before the current one, within 7 days.
+
+        "Before" is by row id, so messages the user posted after the current
+        one (while it waited in the queue) are not counted.
+        """
+        cutoff = _ms_ago(7 * 24)
         try:
             with self._get_connection() as conn:
                 row = conn.execute(
                     """
-                    SELECT timestamp FROM raw_messages
-                    WHERE server_id = ? AND user_id = ? AND message_id != ?
-                      AND timestamp >= datetime('now', '-7 days')
-                    ORDER BY timestamp DESC LIMIT 1
+                    SELECT timestamp FROM raw_messages INDEXED BY idx_raw_messages_server_user
+                    WHERE server_id = ?1 AND user_id = ?2 AND message_id != ?3 AND ts_ms >= ?4
+                      AND id < COALESCE((
+                          SELECT MAX(id) FROM raw_messages INDEXED BY idx_raw_messages_server_user
+                          WHERE server_id = ?1 AND user_id = ?2 AND message_id = ?3
+                      ), 9223372036854775807)
+                    ORDER BY id DESC LIMIT 1
                     """,
-                    (server_id, str(user_id), str(current_message_id)),
+                    (server_id, str(user_id), str(current_message_id), cutoff),
                 ).fetchone()
             return row[0] if row else None
         except sqlite3.Error as e:
@@ -410,25 +932,108 @@ class DatabaseManager:
             return []
 
     def get_active_users_7d(self, server_id):
-        """Returns distinct users who posted in the past 7 days, excluding slash commands."""
+        """Returns distinct users who posted in the past 7 days (to the hour), excluding slash commands."""
         try:
             with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
+                rows = conn.execute(
                     """
-                    SELECT DISTINCT user_id, username FROM raw_messages
-                    WHERE server_id = ?
-                      AND timestamp >= datetime('now', '-7 days')
-                      AND content NOT LIKE '/%'
+                    SELECT a.user_id, u.username FROM activity_hourly a
+                    JOIN users u ON u.server_id = a.server_id AND u.user_id = a.user_id
+                    WHERE a.server_id = ? AND a.hour_ms >= ?
+                    GROUP BY a.user_id
+                    HAVING SUM(a.message_count) > 0
                     """,
-                    (server_id,),
-                )
-                rows = cursor.fetchall()
+                    (server_id, _hour_ms_ago(7 * 24)),
+                ).fetchall()
             return [{"user_id": user_id, "username": username} for user_id, username in rows]
         except sqlite3.Error as e:
             print(f"Database read error: {e}")
             return []
 
+    def get_profile_activity_7d(self, server_id):
+        """Returns per-user message counts for the past 7 days alongside their last profile time.
+
+        Each row is {"user_id", "username" (most recent display name), "total",
+        "new" (messages since the user's latest profile, or all if none)}.
+        Counts come from the hourly rollup, so "new" includes the rest of the hour
+        the profile was written in.  Slash commands are excluded.
+        """
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    """
+                    WITH last_profile AS (
+                        SELECT user_id, MAX(created_ms) AS profiled_ms FROM user_profiles
+                        WHERE server_id = ?
+                        GROUP BY user_id
+                    )
+                    SELECT a.user_id, u.username, SUM(a.message_count),
+                           SUM(CASE WHEN lp.profiled_ms IS NULL OR a.hour_ms >= lp.profiled_ms / 3600000 * 3600000
+                                    THEN a.message_count ELSE 0 END)
+                    FROM activity_hourly a
+                    JOIN users u ON u.server_id = a.server_id AND u.user_id = a.user_id
+                    LEFT JOIN last_profile lp ON lp.user_id = a.user_id
+                    WHERE a.server_id = ? AND a.hour_ms >= ?
+                    GROUP BY a.user_id
+                    HAVING SUM(a.message_count) > 0
+                    """,
+                    (server_id, server_id, _hour_ms_ago(7 * 24)),
+                ).fetchall()
+            return [
+                {"user_id": user_id, "username": username, "total": total, "new": new}
+                for user_id, username, total, new in rows
+            ]
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return []
+
+    def get_user_message_count(self, server_id, user_id, hours=7 * 24):
+        """Returns how many messages (excluding slash commands) a user posted in the past `hours` hours, to the hour."""
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    "SELECT SUM(message_count) FROM activity_hourly WHERE server_id = ? AND user_id = ? AND hour_ms >= ?",
+                    (server_id, str(user_id), _hour_ms_ago(hours)),
+                ).fetchone()
+            return row[0] or 0
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return 0
+
+    def get_activity_stats(self, server_id, hours, limit=5):
+        """Summarizes activity over the past `hours` hours from the hourly rollup.
+
+        Returns {"messages", "users", "channels": [(channel_name, count)],
+        "top_users": [(username, count)]}, busiest first.
+        """
+        params = (server_id, _hour_ms_ago(hours))
+        window = "FROM activity_hourly a WHERE a.server_id = ? AND a.hour_ms >= ?"
+        try:
+            with self._get_connection() as conn:
+                messages, users = conn.execute(f"SELECT SUM(message_count), COUNT(DISTINCT user_id) {window}", params).fetchone()
+                channels = conn.execute(
+                    f"SELECT MAX(channel_name), SUM(message_count) AS n {window} GROUP BY channel_id ORDER BY n DESC LIMIT ?",
+                    params + (limit,),
+                ).fetchall()
+                top_users = conn.execute(
+                    """
+                    SELECT u.username, SUM(a.message_count) AS n
+                    FROM activity_hourly a JOIN users u ON u.server_id = a.server_id AND u.user_id = a.user_id
+                    WHERE a.server_id = ? AND a.hour_ms >= ?
+                    GROUP BY a.user_id ORDER BY n DESC LIMIT ?
+                    """,
+                    params + (limit,),
+                ).fetchall()
+            return {
+                "messages": messages or 0,
+                "users": users,
+                "channels": [(name, n) for name, n in channels if n],
+                "top_users": [(name, n) for name, n in top_users if n],
+            }
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return {"messages": 0, "users": 0, "channels": [], "top_users": []}
+
     def get_latest_user_profile(self, server_id, user_id):
         """Returns the most recently saved profile for a user, or None if not found."""
         try:
@@ -457,17 +1062,21 @@ class DatabaseManager:
         except sqlite3.Error as e:
             print(f"Database write error: {e}")
 
-    def write_rag_chunk(self, server_id: str, message_id: str, channel_id: str, channel_name: str, content: str, embedding: list[float]):
-        """Stores a batched RAG chunk with its embedding."""
+    def write_rag_chunk(self, server_id: str, message_id: str, channel_id: str, channel_name: str, content: str, embedding: list[float], model: str | None = None) -> int | None:
+        """Stores a batched RAG chunk with its embedding and the model that produced it. Returns the row id."""
         blob = struct.pack(f"{len(embedding)}f", *embedding)
         try:
             with self._get_connection() as conn:
-                conn.execute(
-                    "INSERT INTO rag_chunks (server_id, message_id, channel_id, channel_name, content, embedding) VALUES (?, ?, ?, ?, ?, ?)",
-                    (server_id, message_id, channel_id, channel_name, content, blob),
-                )
+                return conn.execute(
+                    """
+                    INSERT INTO rag_chunks (server_id, message_id, channel_id, channel_name, content, embedding, embedding_model, embedding_dim)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (server_id, message_id, channel_id, channel_name, content, blob, model, len(embedding)),
+                ).lastrowid
         except sqlite3.Error as e:
             print(f"RAG chunk write error: {e}")
+            return None
 
     def get_latest_rag_chunk(self, channel_id: str) -> dict | None:
         """Returns the most recent rag_chunk for a channel, or None."""
@@ -482,30 +1091,154 @@ class DatabaseManager:
             print(f"RAG chunk read error: {e}")
             return None
 
-    def update_rag_chunk(self, chunk_id: int, content: str, embedding: list[float]):
-        """Updates content and embedding for an existing rag_chunk row."""
+    def update_rag_chunk(self, chunk_id: int, content: str, embedding: list[float], model: str | None = None):
+        """Updates content and embedding (and its model tag) for an existing rag_chunk row."""
         blob = struct.pack(f"{len(embedding)}f", *embedding)
         try:
             with self._get_connection() as conn:
                 conn.execute(
-                    "UPDATE rag_chunks SET content = ?, embedding = ? WHERE id = ?",
-                    (content, blob, chunk_id),
+                    "UPDATE rag_chunks SET content = ?, embedding = ?, embedding_model = ?, embedding_dim = ? WHERE id = ?",
+                    (content, blob, model, len(embedding), chunk_id),
                 )
         except sqlite3.Error as e:
             print(f"RAG chunk update error: {e}")
 
-    def search_rag_chunks(self, server_id: str, embedding: list[float], limit: int = 5, hours: int | None = None, exclude_channels: set[str] | None = None) -> list[dict]:
+    def write_rag_chunks(self, chunks: list[dict]) -> bool:
+        """Stores many RAG chunks in one transaction and advances each channel's backfill checkpoint.
+
+        Each chunk is a dict with server_id, message_id, channel_id, channel_name,
+        content, embedding and last_raw_id (the raw_messages id of its last
+        message), and optionally model.  Returns False if nothing was written.
+        """
+        checkpoints = {}
+        for c in chunks:
+            key = (c["server_id"], c["channel_id"])
+            last_raw_id, count = checkpoints.get(key, (0, 0))
+            checkpoints[key] = (max(last_raw_id, c["last_raw_id"]), count + 1)
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(
+                    """
+                    INSERT INTO rag_chunks (server_id, message_id, channel_id, channel_name, content, embedding, embedding_model, embedding_dim)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (c["server_id"], c["message_id"], c["channel_id"], c["channel_name"], c["content"],
+                         struct.pack(f"{len(c['embedding'])}f", *c["embedding"]), c.get("model"), len(c["embedding"]))
+                        for c in chunks
+                    ],
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO rag_backfill_checkpoints (server_id, channel_id, last_raw_id, chunk_count) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (server_id, channel_id) DO UPDATE SET
+                        last_raw_id = MAX(last_raw_id, excluded.last_raw_id),
+                        chunk_count = chunk_count + excluded.chunk_count,
+                        updated_at = CURRENT_TIMESTAMP
+                    """,
+                    [(server_id, channel_id, last_raw_id, count) for (server_id, channel_id), (last_raw_id, count) in checkpoints.items()],
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"RAG chunk write error: {e}")
+            return False
+
+    def get_rag_backfill_checkpoints(self, server_id: str) -> dict:
+        """Returns {channel_id: last backfilled raw_messages id} for a server."""
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT channel_id, last_raw_id FROM rag_backfill_checkpoints WHERE server_id = ?", (server_id,)
+                ).fetchall()
+            return {channel_id: last_raw_id for channel_id, last_raw_id in rows}
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return {}
+
+    def clear_rag_backfill_checkpoints(self, server_id: str):
+        """Forgets a server's backfill progress so the next backfill starts from the beginning of its window."""
+        try:
+            with self._get_connection() as conn:
+                conn.execute("DELETE FROM rag_backfill_checkpoints WHERE server_id = ?", (server_id,))
+        except sqlite3.Error as e:
+            print(f"Database write error: {e}")
+
+    def set_model_override(self, server_id: str, scope: str, target_id: str, mode: str | None):
+        """Pins a channel or user (scope "channel" or "user") to the fast or slow model; mode None clears it."""
+        try:
+            with self._get_connection() as conn:
+                if mode is None:
+                    conn.execute(
+                        "DELETE FROM model_overrides WHERE server_id = ? AND scope = ? AND target_id = ?",
+                        (server_id, scope, str(target_id)),
+                    )
+                else:
+                    conn.execute(
+                        """
+                        INSERT INTO model_overrides (server_id, scope, target_id, mode) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(server_id, scope, target_id) DO UPDATE SET mode = excluded.mode, updated_at = CURRENT_TIMESTAMP
+                        """,
+                        (server_id, scope, str(target_id), mode),
+                    )
+        except sqlite3.Error as e:
+            print(f"Database write error: {e}")
+
+    def get_model_overrides(self, server_id: str, channel_id: str, user_id: str) -> dict:
+        """Returns {"channel": mode, "user": mode} for whichever of the two is pinned."""
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT scope, mode FROM model_overrides
+                    WHERE server_id = ? AND ((scope = 'channel' AND target_id = ?) OR (scope = 'user' AND target_id = ?))
+                    """,
+                    (server_id, str(channel_id), str(user_id)),
+                ).fetchall()
+            return {scope: mode for scope, mode in rows}
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return {}
+
+    def search_rag_chunks(self, server_id: str, embedding: list[float], limit: int = 5, hours: int | None = None, exclude_channels: set[str] | None = None, route_channels: int = 0, route_weekly: bool = False, model: str | None = None, include_untagged: bool = False) -> list[dict]:
         """Returns the closest RAG chunks to the given embedding vector, scoped to a server.
-        Optionally restrict to chunks from the past `hours` hours and exclude specific channel IDs."""
+        Optionally restrict to chunks from the past `hours` hours and exclude specific channel IDs.
+
+        With route_channels > 0 the search is two-stage: the route_channels
+        channel centroids (or channel-week centroids with route_weekly) closest
+        to the query are picked first and only their chunks are scored.
+
+        Only chunks whose embedding has the query's dimension are scored.  With
+        model, only chunks embedded by that model are (plus untagged chunks if
+        include_untagged).
+        """
         blob = struct.pack(f"{len(embedding)}f", *embedding)
-        time_filter = "AND timestamp >= datetime('now', ?)" if hours is not None else ""
-        params = [blob, server_id] + ([f"-{hours} hours"] if hours is not None else [])
+        cutoff = _ms_ago(hours) if hours is not None else None
+        time_filter = f"AND {_since('rag_chunks')}" if hours is not None else ""
+        time_params = [cutoff, cutoff] if hours is not None else []
         if exclude_channels:
             placeholders = ",".join("?" * len(exclude_channels))
             channel_filter = f"AND channel_id NOT IN ({placeholders})"
-            params.extend(exclude_channels)
         else:
             channel_filter = ""
+        channel_params = list(exclude_channels or ())
+        model_filter, model_params = _embedding_filter(len(embedding), model, include_untagged)
+        params = [blob, server_id] + model_params + time_params + channel_params
+        route_filter = ""
+        if route_channels > 0:
+            week_filter = "week != ''" if route_weekly else "week = ''"
+            if route_weekly and hours is not None:
+                week_filter += " AND week >= ?"
+            route_filter = f"""
+                    AND {"(channel_id, strftime('%Y-%W', timestamp))" if route_weekly else "channel_id"} IN (
+                        SELECT {"channel_id, week" if route_weekly else "channel_id"} FROM rag_centroids
+                        WHERE server_id = ? AND dim = ? AND {week_filter}
+                        {channel_filter}
+                        ORDER BY vec_distance_cosine(embedding, ?)
+                        LIMIT ?
+                    )"""
+            week_params = [datetime.fromtimestamp(cutoff / 1000, timezone.utc).strftime("%Y-%W")] if route_weekly and hours is not None else []
+            params += [server_id, len(embedding)] + week_params + channel_params
+            params += [blob, route_channels]
         params.append(limit)
         try:
             with self._get_connection() as conn:
@@ -515,8 +1248,10 @@ class DatabaseManager:
                            vec_distance_cosine(embedding, ?) AS distance
                     FROM rag_chunks
                     WHERE server_id = ?
+                    {model_filter}
                     {time_filter}
                     {channel_filter}
+                    {route_filter}
                     ORDER BY distance ASC
                     LIMIT ?
                     """,
@@ -531,6 +1266,166 @@ class DatabaseManager:
             print(f"RAG chunk search error: {e}")
             return []
 
+    def get_rag_versions(self, server_id: str) -> dict:
+        """Returns {channel_id: counter} for a server; a channel's counter changes whenever chunks are added to or removed from it."""
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT channel_id, version FROM rag_channel_versions WHERE server_id = ?", (server_id,)
+                ).fetchall()
+            return {channel_id: version for channel_id, version in rows}
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return {}
+
+    def get_rag_embedding_models(self, server_id: str | None = None) -> dict:
+        """Returns {embedding model: chunk count} for a server (or all servers); untagged chunks count under None."""
+        where, params = ("WHERE server_id = ?", (server_id,)) if server_id is not None else ("", ())
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    f"SELECT embedding_model, COUNT(*) FROM rag_chunks {where} GROUP BY embedding_model", params
+                ).fetchall()
+            return {model: count for model, count in rows}
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return {}
+
+    def tag_rag_embeddings(self, model: str) -> int:
+        """Records `model` as the embedding model of every untagged chunk. Returns the number tagged."""
+        try:
+            with self._get_connection() as conn:
+                return conn.execute("UPDATE rag_chunks SET embedding_model = ? WHERE embedding_model IS NULL", (model,)).rowcount
+        except sqlite3.Error as e:
+            print(f"Database write error: {e}")
+            return 0
+
+    def get_rag_chunks_to_reembed(self, model: str, limit: int) -> list[dict]:
+        """Returns up to `limit` chunks not yet embedded with `model` as {"id", "content"}, newest first."""
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, content FROM rag_chunks WHERE embedding_model IS NOT ? ORDER BY id DESC LIMIT ?",
+                    (model, limit),
+                ).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return []
+
+    def update_rag_embeddings(self, updates: list[tuple[int, str, list[float]]], model: str) -> int:
+        """Replaces the embeddings of several chunks in one transaction.
+
+        updates holds (chunk id, content the embedding was made from, embedding);
+        a chunk whose content has changed since is left for the next pass.
+        Returns the number of chunks updated.
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.executemany(
+                    "UPDATE rag_chunks SET embedding = ?, embedding_model = ?, embedding_dim = ? WHERE id = ? AND content = ?",
+                    [
+                        (struct.pack(f"{len(embedding)}f", *embedding), model, len(embedding), chunk_id, content)
+                        for chunk_id, content, embedding in updates
+                    ],
+                )
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"RAG chunk update error: {e}")
+            return 0
+
+    def search_rag_chunks_top1(self, server_id: str, embeddings: list[list[float]], hours: int | None = None, model: str | None = None, include_untagged: bool = False) -> list[dict | None]:
+        """Returns the closest RAG chunk to each of several embedding vectors in one query.
+
+        The candidate chunks are read once and scored against every vector, so
+        this is equivalent to calling search_rag_chunks(limit=1) per vector.
+        The vectors must share one dimension.  The result has one entry per
+        vector, None where nothing matched.
+        """
+        if not embeddings:
+            return []
+        blobs = [struct.pack(f"{len(e)}f", *e) for e in embeddings]
+        values = ",".join("(?, ?)" for _ in blobs)
+        cutoff = _ms_ago(hours) if hours is not None else None
+        time_filter = f"AND {_since('rag_chunks')}" if hours is not None else ""
+        model_filter, model_params = _embedding_filter(len(embeddings[0]), model, include_untagged)
+        params = [p for i, blob in enumerate(blobs) for p in (i, blob)]
+        params += [server_id] + model_params + ([cutoff, cutoff] if hours is not None else [])
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    f"""
+                    WITH queries(idx, embedding) AS (VALUES {values}),
+                    candidates AS MATERIALIZED (
+                        SELECT id, content, channel_id, channel_name, message_id, embedding
+                        FROM rag_chunks
+                        WHERE server_id = ?
+                        {model_filter}
+                        {time_filter}
+                    )
+                    SELECT q.idx, c.id, c.content, c.channel_id, c.channel_name, c.message_id,
+                           MIN(vec_distance_cosine(c.embedding, q.embedding)) AS distance
+                    FROM queries q CROSS JOIN candidates c
+                    GROUP BY q.idx
+                    """,
+                    params,
+                ).fetchall()
+            results = [None] * len(blobs)
+            for idx, chunk_id, content, channel_id, channel_name, message_id, distance in rows:
+                results[idx] = {"id": chunk_id, "content": content, "channel_id": channel_id,
+                                "channel_name": channel_name, "message_id": message_id, "distance": distance}
+            return results
+        except sqlite3.Error as e:
+            print(f"RAG chunk search error: {e}")
+            return [None] * len(blobs)
+
+    def search_rag_chunks_fts(self, server_id: str, query: str, limit: int = 5, hours: int | None = None, exclude_channels: set[str] | None = None) -> list[dict]:
+        """Returns the RAG chunks best matching an FTS5 query, ranked by BM25 (lower rank is better)."""
+        return self._search_fts(
+            "rag_chunks", "t.id, t.content, t.channel_id, t.channel_name, t.message_id",
+            server_id, query, limit, hours, exclude_channels,
+        )
+
+    def search_raw_messages_fts(self, server_id: str, query: str, limit: int = 5, hours: int | None = None, exclude_channels: set[str] | None = None) -> list[dict]:
+        """Returns the raw messages best matching an FTS5 query, ranked by BM25. Slash commands are skipped."""
+        return self._search_fts(
+            "raw_messages", "t.id, t.username, t.content, t.channel_id, t.channel_name, t.message_id",
+            server_id, query, limit, hours, exclude_channels, "AND t.content NOT LIKE '/%'",
+        )
+
+    def _search_fts(self, table, columns, server_id, query, limit, hours, exclude_channels, extra_filter=""):
+        fts = f"{table}_fts"
+        cutoff = _ms_ago(hours) if hours is not None else None
+        time_filter = f"AND {_since(table, 't')}" if hours is not None else ""
+        params = [query, server_id] + ([cutoff, cutoff] if hours is not None else [])
+        if exclude_channels:
+            placeholders = ",".join("?" * len(exclude_channels))
+            channel_filter = f"AND t.channel_id NOT IN ({placeholders})"
+            params.extend(exclude_channels)
+        else:
+            channel_filter = ""
+        params.append(limit)
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT {columns}, {fts}.rank AS rank
+                    FROM {fts} JOIN {table} t ON t.id = {fts}.rowid
+                    WHERE {fts} MATCH ?
+                      AND t.server_id = ?
+                    {time_filter}
+                    {channel_filter}
+                    {extra_filter}
+                    ORDER BY rank
+                    LIMIT ?
+                    """,
+                    params,
+                ).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Full-text search error: {e}")
+            return []
+
     def write_summary(self, content):
         """Saves a generated daily summary to the summaries table."""
         try:
@@ -555,6 +1450,132 @@ class DatabaseManager:
             print(f"Summary read error: {e}")
             return []
 
+    def write_newsletter(self, server_id, last_message_id, summaries, curated, joke):
+        """Saves a generated newsletter; last_message_id is the newest raw_messages id it covers."""
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "INSERT INTO newsletters (server_id, last_message_id, summaries, curated, joke) VALUES (?, ?, ?, ?, ?)",
+                    (server_id, last_message_id, json.dumps(summaries), curated, joke),
+                )
+        except sqlite3.Error as e:
+            print(f"Newsletter write error: {e}")
+
+    def get_latest_newsletter(self, server_id):
+        """Returns the most recent newsletter for a server with its age in minutes, or None."""
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    """
+                    SELECT last_message_id, summaries, curated, joke, created_at,
+                           (julianday('now') - julianday(created_at)) * 1440 AS age_minutes
+                    FROM newsletters
+                    WHERE server_id = ?
+                    ORDER BY id DESC LIMIT 1
+                    """,
+                    (server_id,),
+                ).fetchone()
+            if not row:
+                return None
+            return {
+                "last_message_id": row["last_message_id"],
+                "summaries": [tuple(s) for s in json.loads(row["summaries"])],
+                "curated": row["curated"],
+                "joke": row["joke"],
+                "created_at": row["created_at"],
+                "age_minutes": row["age_minutes"],
+            }
+        except sqlite3.Error as e:
+            print(f"Newsletter read error: {e}")
+            return None
+
+    def get_raw_messages_after(self, server_id, after_id, before=None):
+        """Retrieves raw messages with row id > after_id (and timestamp < before, if given), in id order."""
+        before_filter = "AND ts_ms < ?" if before else ""
+        params = [server_id, after_id] + ([_to_ms(before)] if before else [])
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT id, username, content, channel_id, channel_name, timestamp FROM raw_messages
+                    WHERE server_id = ?
+                      AND id > ?
+                      {before_filter}
+                      AND channel_name IS NOT NULL
+                      AND content NOT LIKE '/%'
+                    ORDER BY id ASC
+                    """,
+                    params,
+                ).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return []
+
+    def get_first_raw_message_id_since(self, server_id, hours):
+        """Returns the lowest raw_messages id from the past `hours` hours, or None."""
+        cutoff = _ms_ago(hours)
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    f"SELECT MIN(id) FROM raw_messages WHERE server_id = ? AND {_since('raw_messages')}",
+                    (server_id, cutoff, cutoff),
+                ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Database read error: {e}")
+            return None
+
+    def write_digest(self, server_id, channel_id, channel_name, level, bucket_start, first_message_id, last_message_id, message_count, content):
+        """Stores a channel digest for one bucket ('hour') or one rolled-up day ('day')."""
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO digests (server_id, channel_id, channel_name, level, bucket_start,
+                                         first_message_id, last_message_id, message_count, content)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (server_id, channel_id, channel_name, level, bucket_start, first_message_id, last_message_id, message_count, content),
+                )
+        except sqlite3.Error as e:
+            print(f"Digest write error: {e}")
+
+    def get_digests(self, server_id, level, start, end=None):
+        """Returns digests of a level with start <= bucket_start < end, ordered by channel then time."""
+        end_filter = "AND bucket_start < ?" if end else ""
+        params = [server_id, level, start] + ([end] if end else [])
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT channel_id, channel_name, bucket_start, first_message_id, last_message_id,
+                           message_count, content
+                    FROM digests
+                    WHERE server_id = ? AND level = ? AND bucket_start >= ?
+                    {end_filter}
+                    ORDER BY channel_id, bucket_start, id
+                    """,
+                    params,
+                ).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Digest read error: {e}")
+            return []
+
+    def get_digest_watermark(self, server_id):
+        """Returns the newest raw_messages id covered by an hourly digest, or None if there are none."""
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    "SELECT MAX(last_message_id) FROM digests WHERE server_id = ? AND level = 'hour'",
+                    (server_id,),
+                ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Digest read error: {e}")
+            return None
+
     def add_member_points(self, member_id, points):
         """Adds points to a member in the database."""
         try:
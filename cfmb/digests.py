@@ -0,0 +1,191 @@
+"""Rolling per-channel digests.
+
+Raw messages are summarized into hourly buckets (split further every
+DIGEST_BUCKET_MESSAGES messages) once each hour has closed, and completed
+days are rolled up into one digest per channel.  Summary paths then read a
+few dozen digests plus the not-yet-digested tail of raw messages instead of
+re-reading the whole day.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from cfmb.config import config
+from cfmb.db_manager import iter_channels
+from cfmb.newsletter import clean_content
+from cfmb.summarize import Summarizer
+
+SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DIGEST_SYSTEM_PROMPT = (
+    "You are a note taker for the Cape Fear Makers Guild Discord server. "
+    "Write concise notes on the following messages from one channel: topics discussed, decisions, "
+    "plans, announcements, questions, and who was involved. Keep names and concrete details. "
+    "Output only the notes."
+)
+
+
+def _digest_prompt(ch_name, body):
+    return [
+        {"role": "system", "content": DIGEST_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Messages from #{ch_name}:\n\n{body}"},
+    ]
+
+
+def _day_reduce_prompt(ch_name):
+    def build(partials):
+        return [
+            {"role": "system", "content": DIGEST_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": (
+                    f"The following are notes on consecutive hours of messages from #{ch_name}, separated "
+                    f"by =====. Combine them into one set of notes for the day:\n\n{partials}"
+                ),
+            },
+        ]
+    return build
+
+
+def _hour_of(timestamp):
+    """Returns the start of the hour bucket for a SQLite timestamp string."""
+    return timestamp.replace("T", " ")[:13] + ":00:00"
+
+
+def _buckets(rows, excluded):
+    """Groups raw rows into {hour: {channel_id: [parts of at most DIGEST_BUCKET_MESSAGES rows]}}."""
+    buckets = {}
+    for r in rows:
+        if r["channel_id"] in excluded:
+            continue
+        parts = buckets.setdefault(_hour_of(r["timestamp"]), {}).setdefault(r["channel_id"], [[]])
+        if len(parts[-1]) >= config.DIGEST_BUCKET_MESSAGES:
+            parts.append([])
+        parts[-1].append(r)
+    return buckets
+
+
+async def update_digests(server_id, db_manager, llm_client, excluded=()) -> int:
+    """Digests every closed hour bucket since the last run and rolls up completed days.
+
+    Hours are processed oldest first; an hour is stored only if all of its
+    buckets were summarized, and processing stops at the first hour that
+    fails so its messages are retried on the next run.  Returns the number
+    of hour digests written.
+    """
+    now = datetime.now(timezone.utc)
+    open_hour = now.replace(minute=0, second=0, microsecond=0)
+
+    watermark = db_manager.get_digest_watermark(server_id)
+    if watermark is None:
+        first_id = db_manager.get_first_raw_message_id_since(server_id, config.DIGEST_LOOKBACK_HOURS)
+        if first_id is None:
+            return 0
+        watermark = first_id - 1
+
+    rows = db_manager.get_raw_messages_after(server_id, watermark, open_hour.strftime(SQLITE_FORMAT))
+    written = 0
+    for hour, channels in sorted(_buckets(rows, set(excluded)).items()):
+        jobs = [(cid, part) for cid, parts in channels.items() for part in parts]
+        results = await asyncio.gather(*(
+            llm_client.get_completion(
+                _digest_prompt(part[0]["channel_name"], "\n".join(f"{m['username']}: {clean_content(m['content'])}" for m in part)),
+                label=f"digest #{part[0]['channel_name']} {hour}", priority="batch",
+            )
+            for _, part in jobs
+        ))
+        if not all(results):
+            print(f"Digests: failed to digest {hour}, will retry next run")
+            break
+        for (cid, part), content in zip(jobs, results):
+            db_manager.write_digest(
+                server_id, cid, part[0]["channel_name"], "hour", hour,
+                part[0]["id"], part[-1]["id"], len(part), content.strip(),
+            )
+        written += len(jobs)
+    if written:
+        print(f"Digests: wrote {written} hour digests for server {server_id}")
+
+    await roll_up_days(server_id, db_manager, llm_client, now)
+    return written
+
+
+async def roll_up_days(server_id, db_manager, llm_client, now=None):
+    """Reduces each completed UTC day's hour digests into one day digest per channel."""
+    now = now or datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    summarizer = Summarizer(llm_client)
+    for days_ago in range(max(config.DIGEST_LOOKBACK_HOURS // 24, 1), 0, -1):
+        day_start = today - timedelta(days=days_ago)
+        start, end = day_start.strftime(SQLITE_FORMAT), (day_start + timedelta(days=1)).strftime(SQLITE_FORMAT)
+        if db_manager.get_digests(server_id, "day", start, end):
+            continue
+        by_channel = {}
+        for d in db_manager.get_digests(server_id, "hour", start, end):
+            by_channel.setdefault(d["channel_id"], []).append(d)
+        if not by_channel:
+            continue
+
+        async def roll_up(digests):
+            ch_name = digests[0]["channel_name"]
+            content = await summarizer.reduce(
+                [d["content"] for d in digests], _day_reduce_prompt(ch_name), label=f"day digest #{ch_name}",
+            )
+            return digests, content
+
+        for digests, content in await asyncio.gather(*(roll_up(d) for d in by_channel.values())):
+            if content:
+                db_manager.write_digest(
+                    server_id, digests[0]["channel_id"], digests[0]["channel_name"], "day", start,
+                    digests[0]["first_message_id"], digests[-1]["last_message_id"],
+                    sum(d["message_count"] for d in digests), content,
+                )
+        print(f"Digests: rolled up {start[:10]} for {len(by_channel)} channels")
+
+
+def load_channel_lines(server_id, db_manager, excluded=(), format_message=None, hours=24) -> dict:
+    """Returns {channel_id: {"name", "lines"}} covering the past `hours` hours.
+
+    Each channel's lines are its hour digests in time order followed by the raw
+    messages newer than the digest watermark, formatted with format_message
+    (default "username: content").  With no digests this is every raw message.
+    """
+    format_message = format_message or (lambda m: f"{m['username']}: {m['content']}")
+    start = datetime.now(timezone.utc) - timedelta(hours=hours)
+    since = start.replace(minute=0, second=0, microsecond=0)
+    watermark = db_manager.get_digest_watermark(server_id)
+    digests = db_manager.get_digests(server_id, "hour", since.strftime(SQLITE_FORMAT)) if watermark else []
+    channels = {}
+    for d in digests:
+        if d["channel_id"] in excluded:
+            continue
+        channels.setdefault(d["channel_id"], {"name": d["channel_name"], "lines": []})
+        channels[d["channel_id"]]["lines"].append(d["content"])
+
+    # Streamed by channel and bounded in SQL, so a stale watermark never loads more than the window
+    tail = db_manager.iter_raw_messages(
+        server_id, int((since if watermark else start).timestamp() * 1000), after_id=watermark, exclude_channels=excluded,
+    )
+    raw_count = 0
+    for cid, name, messages in iter_channels(tail):
+        lines = [format_message(m) for m in messages]
+        channels.setdefault(cid, {"name": name, "lines": []})["lines"].extend(lines)
+        raw_count += len(lines)
+    if digests:
+        print(f"Digests: loaded {len(digests)} digests and {raw_count} raw messages for server {server_id}")
+    return channels
+
+
+def load_day_blocks(server_id, db_manager, start, end, excluded=()):
+    """Returns [(channel_name, lines)] for a past day from day digests, falling back to hour digests.
+
+    Returns None when the day has no digests so callers can fall back to raw messages.
+    """
+    digests = db_manager.get_digests(server_id, "day", start, end) or db_manager.get_digests(server_id, "hour", start, end)
+    if not digests:
+        return None
+    channels = {}
+    for d in digests:
+        if d["channel_id"] in excluded:
+            continue
+        channels.setdefault(d["channel_id"], (d["channel_name"], []))[1].append(d["content"])
+    return list(channels.values())
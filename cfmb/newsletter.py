@@ -0,0 +1,199 @@
+"""Daily newsletter generation.
+
+The newsletter is built as a dependency graph: channel summaries run
+concurrently, curation waits for all of them, and source annotation and the
+dad joke both start as soon as the curated text exists.  A newsletter built
+earlier in the day can be topped up with only the messages that arrived since.
+"""
+import asyncio
+import re
+import time
+
+from cfmb.config import config
+from cfmb.pipeline import run_dag
+from cfmb.reembed import untagged_model
+from cfmb.summarize import Summarizer, channel_map_prompt, channel_reduce_prompt
+
+DAD_JOKE_SYSTEM_PROMPT = (
+    "You are a dad joke generator. "
+    "Given a newsletter summary, respond with a single one-liner dad joke related to its content. "
+    "Output only the joke — no explanation, no preamble, no quotation marks."
+)
+
+SOURCE_MAX_DISTANCE = 0.408
+
+
+def clean_content(text):
+    # Remove Discord mention syntax (<@123>, <@!123>, <#123>, <@&123>)
+    text = re.sub(r"<[@#][!&]?\d+>", "", text)
+    # Remove any remaining @ symbols
+    return text.replace("@", "")
+
+
+def group_by_channel(raw, excluded=()):
+    """Groups raw messages into {channel_id: {"name", "messages"}}, skipping excluded channels."""
+    channels = {}
+    for m in raw:
+        cid = m["channel_id"] or "unknown"
+        if cid in excluded:
+            continue
+        channels.setdefault(cid, {"name": m["channel_name"] or cid, "messages": []})
+        channels[cid]["messages"].append(m)
+    return channels
+
+
+def split_sections(curated):
+    """Splits curated newsletter text into per-channel sections for posting."""
+    sections = [s.strip() for s in re.split(r'(?=\*\*#)', curated.strip()) if s.strip()]
+    return sections or [curated.strip()]
+
+
+async def summarize_channels(channels, llm_client, concurrency=None):
+    """Summarizes each channel concurrently. Returns [(channel_id, name, summary)] in channel order."""
+    semaphore = asyncio.Semaphore(concurrency or config.NEWSLETTER_CONCURRENCY)
+    summarizer = Summarizer(llm_client)
+
+    async def summarize(cid, data):
+        ch_name = data["name"]
+        lines = data.get("lines") or [f"{m['username']}: {clean_content(m['content'])}" for m in data["messages"]]
+        async with semaphore:
+            t_start = time.monotonic()
+            summary = await summarizer.run(
+                [(None, lines)], channel_map_prompt(ch_name), channel_reduce_prompt(ch_name),
+                label=f"newsletter #{ch_name}",
+            )
+        print(f"Newsletter: #{ch_name} ({len(lines)} messages) summarized in {time.monotonic() - t_start:.2f}s")
+        return cid, ch_name, summary.strip() if summary else None
+
+    results = await asyncio.gather(*(summarize(cid, data) for cid, data in channels.items()))
+    return [r for r in results if r[2]]
+
+
+async def curate(summaries, llm_client):
+    """Runs the curation editor over the channel summaries."""
+    if not summaries:
+        return None
+    combined = "\n\n".join(f"**#{ch_name}**\n{summary}" for _, ch_name, summary in summaries)
+    curation_prompt = [
+        {
+            "role": "system",
+            "content": config.CURATION_SYSTEM_PROMPT,
+        },
+        {
+            "role": "user",
+            "content": f"Here are the channel summaries:\n\n{combined}",
+        },
+    ]
+    curated = await llm_client.get_completion(curation_prompt, label="curation", priority="batch")
+    return curated.replace("@", "") if curated else None
+
+
+async def dad_joke(curated, llm_client):
+    """Generates a one-liner dad joke about the curated newsletter."""
+    if not curated:
+        return None
+    prompt = [
+        {"role": "system", "content": DAD_JOKE_SYSTEM_PROMPT},
+        {"role": "user", "content": curated.strip()},
+    ]
+    joke = await llm_client.get_completion(prompt, label="dad joke", priority="batch")
+    return joke.strip() if joke else None
+
+
+async def annotate_with_sources(text: str, server_id: str, db_manager, llm_client) -> str:
+    """Splits summary text by punctuation and newlines, finds a source message for each segment
+    with 5+ words, and inserts an inline source link before the closing punctuation.
+
+    All segments are embedded in one request and matched against the past day's
+    chunks in one query.
+    """
+    if not text or not config.OLLAMA_EMBEDDING_MODEL:
+        return text
+    parts = re.split(r'([.,;:!?\n])', text)
+    segments = [i for i in range(0, len(parts), 2) if len(parts[i].split()) >= 5]
+    embeddings = await llm_client.get_embeddings([parts[i].strip() for i in segments], config.OLLAMA_EMBEDDING_MODEL)
+    model = config.OLLAMA_EMBEDDING_MODEL
+    matches = db_manager.search_rag_chunks_top1(
+        server_id, embeddings, hours=24, model=model, include_untagged=model == untagged_model(),
+    ) if embeddings else []
+    sources = dict(zip(segments, matches))
+    result = []
+    counter = 0
+    for i in range(0, len(parts), 2):
+        result.append(parts[i])
+        r = sources.get(i)
+        if r and r['distance'] < SOURCE_MAX_DISTANCE and r.get('channel_id'):
+            url = f"https://discord.com/channels/{server_id}/{r['channel_id']}/{r['message_id']}"
+            counter += 1
+            result.append(f" [[{counter}]]({url})")
+        result.append(parts[i + 1] if i + 1 < len(parts) else '')
+    return ''.join(result)
+
+
+async def merge_channel_summaries(previous, updates, llm_client):
+    """Merges top-up summaries of new messages into the previous channel summaries.
+
+    previous and updates are [(channel_id, name, summary)] lists.  Channels in
+    both are reduced into one summary; new channels are appended in order.
+    """
+    summarizer = Summarizer(llm_client)
+    updated = {cid: (name, summary) for cid, name, summary in updates}
+
+    async def merge(cid, name, summary):
+        if cid not in updated:
+            return cid, name, summary
+        merged = await summarizer.reduce(
+            [summary, updated[cid][1]], channel_reduce_prompt(name), label=f"newsletter #{name} top-up",
+        )
+        return cid, name, merged or summary
+
+    merged = await asyncio.gather(*(merge(*s) for s in previous))
+    known = {cid for cid, _, _ in previous}
+    return list(merged) + [s for s in updates if s[0] not in known]
+
+
+async def _build(server_id, summaries_fn, db_manager, llm_client, label) -> dict:
+    stages = {
+        "channel summaries": ((), summaries_fn),
+        "curation": (("channel summaries",), lambda summaries: curate(summaries, llm_client)),
+        "source annotation": (("curation",), lambda curated: annotate_with_sources(curated, server_id, db_manager, llm_client)),
+        "dad joke": (("curation",), lambda curated: dad_joke(curated, llm_client)),
+    }
+    results = await run_dag(stages, label)
+    return {
+        "summaries": results["channel summaries"],
+        "curated": results["source annotation"],
+        "joke": results["dad joke"],
+    }
+
+
+async def build_newsletter(server_id, raw, db_manager, llm_client, excluded=(), channels=None) -> dict:
+    """Builds the newsletter for a day of raw messages.
+
+    channels, if given, replaces raw with prebuilt {channel_id: {"name", "lines"}}
+    transcripts (e.g. from rolling digests).  Returns {"summaries":
+    [(channel_id, name, summary)], "curated": annotated text or None, "joke": str or None}.
+    """
+    channels = channels if channels is not None else group_by_channel(raw, excluded)
+    return await _build(
+        server_id, lambda: summarize_channels(channels, llm_client), db_manager, llm_client,
+        f"newsletter {server_id}",
+    )
+
+
+async def top_up_newsletter(server_id, cached, new_raw, db_manager, llm_client, excluded=()) -> dict:
+    """Updates a precomputed newsletter with messages that arrived after it was built.
+
+    Only channels with new messages are summarized again (just the new messages,
+    merged into the cached summary); curation, sources and the joke are redone
+    only if anything changed.
+    """
+    channels = group_by_channel(new_raw, excluded)
+    if not channels:
+        return cached
+
+    async def summaries():
+        updates = await summarize_channels(channels, llm_client)
+        return await merge_channel_summaries(cached["summaries"], updates, llm_client)
+
+    return await _build(server_id, summaries, db_manager, llm_client, f"newsletter top-up {server_id}")
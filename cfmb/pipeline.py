@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+
+async def run_dag(stages: dict, label: str) -> dict:
+    """Runs async stages as a dependency graph and logs when each one starts and finishes.
+
+    stages maps name -> (dependency names, async fn).  Each fn is called with the
+    results of its dependencies, in order, as soon as they are all available;
+    independent stages run concurrently.  Returns {name: result}.  If a stage
+    raises, the remaining stages are cancelled and the exception propagates.
+    """
+    t_start = time.monotonic()
+    tasks = {}
+
+    async def run(name):
+        deps, fn = stages[name]
+        inputs = [await tasks[d] for d in deps]
+        t_stage = time.monotonic()
+        result = await fn(*inputs)
+        t_end = time.monotonic()
+        print(f"Pipeline [{label}]: {name} took {t_end - t_stage:.2f}s "
+              f"(+{t_stage - t_start:.2f}s to +{t_end - t_start:.2f}s)")
+        return result
+
+    for name in stages:
+        tasks[name] = asyncio.ensure_future(run(name))
+    try:
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    print(f"Pipeline [{label}]: finished in {time.monotonic() - t_start:.2f}s")
+    return dict(zip(tasks, results))
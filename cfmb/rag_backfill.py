@@ -0,0 +1,103 @@
+"""Bulk RAG chunk backfill.
+
+Each channel's messages are first folded into their final chunks in memory,
+with the same chunker as the live batcher, so no chunk is embedded more than
+once.  The chunks are then embedded in batches with several requests in
+flight and written in one transaction per batch.  Every write advances a
+per-channel checkpoint so an interrupted backfill picks up where it stopped.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from cfmb.chunking import ChannelChunker
+from cfmb.config import config
+from cfmb.db_manager import iter_channels
+
+
+def build_chunks(server_id, messages, checkpoints=None) -> list[dict]:
+    """Chunks a channel-ordered message stream, skipping messages before each channel's checkpoint.
+
+    Returns chunk dicts with server_id, message_id (of the first message),
+    channel_id, channel_name, content, last_raw_id and messages (the number of
+    messages the chunk adds; lines carried over as overlap are not counted).
+    """
+    checkpoints = checkpoints or {}
+    chunks = []
+    for cid, name, channel_messages in iter_channels(messages):
+        after = checkpoints.get(cid, 0)
+        chunker = ChannelChunker()
+        channel_chunks = []
+        for m in channel_messages:
+            if m.id <= after or not m.content.strip():
+                continue
+            for chunk, new in chunker.add(m.message_id, m.username, m.content, m.ts_ms, m.reply_to, m.id):
+                if new:
+                    channel_chunks.append(chunk)
+        chunks += [
+            {
+                "server_id": server_id, "message_id": c.message_id, "channel_id": cid, "channel_name": name,
+                "content": c.content, "last_raw_id": c.last_raw_id, "messages": c.messages,
+            }
+            for c in channel_chunks
+        ]
+    return chunks
+
+
+async def embed_and_store(chunks, db_manager, llm_client, batch_size=None, concurrency=None, on_commit=None) -> dict:
+    """Embeds chunks `batch_size` per request with up to `concurrency` requests in flight and stores them.
+
+    Batches are written in order.  Once a batch fails, later chunks from the
+    channels it touched are not written either, so each channel's checkpoint
+    only ever covers a complete prefix of its chunks.  on_commit(messages,
+    chunks) is called after each write.  Returns {"chunks", "messages", "failed"}.
+    """
+    batch_size = batch_size or config.RAG_BACKFILL_BATCH_SIZE
+    concurrency = concurrency or config.RAG_BACKFILL_CONCURRENCY
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    failed_channels = set()
+    stats = {"chunks": 0, "messages": 0, "failed": 0}
+
+    for start in range(0, len(batches), concurrency):
+        window = batches[start:start + concurrency]
+        results = await asyncio.gather(*(
+            llm_client.get_embeddings([c["content"] for c in batch], config.OLLAMA_EMBEDDING_MODEL) for batch in window
+        ))
+        for batch, embeddings in zip(window, results):
+            if not embeddings or len(embeddings) != len(batch):
+                failed_channels.update(c["channel_id"] for c in batch)
+                stats["failed"] += len(batch)
+                continue
+            rows = [
+                {**c, "embedding": e, "model": config.OLLAMA_EMBEDDING_MODEL}
+                for c, e in zip(batch, embeddings) if c["channel_id"] not in failed_channels
+            ]
+            stats["failed"] += len(batch) - len(rows)
+            if rows and not db_manager.write_rag_chunks(rows):
+                failed_channels.update(c["channel_id"] for c in rows)
+                stats["failed"] += len(rows)
+                continue
+            messages = sum(c["messages"] for c in rows)
+            stats["chunks"] += len(rows)
+            stats["messages"] += messages
+            if on_commit:
+                on_commit(messages, len(rows))
+    return stats
+
+
+async def backfill_server(server_id, db_manager, llm_client, hours=None, batch_size=None, concurrency=None, on_build=None, on_commit=None) -> dict:
+    """Backfills a server's chunks for the past `hours` hours (default RAG_BACKFILL_HOURS; 0 for all history).
+
+    on_build(messages, chunks) is called once the chunks are built, before any
+    embedding.  Returns the embed_and_store stats plus "seconds".
+    """
+    hours = config.RAG_BACKFILL_HOURS if hours is None else hours
+    start_ms = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp() * 1000) if hours else 0
+    t_start = time.monotonic()
+    checkpoints = db_manager.get_rag_backfill_checkpoints(server_id)
+    chunks = build_chunks(server_id, db_manager.iter_raw_messages(server_id, start_ms), checkpoints)
+    if on_build:
+        on_build(sum(c["messages"] for c in chunks), len(chunks))
+    stats = await embed_and_store(chunks, db_manager, llm_client, batch_size, concurrency, on_commit)
+    stats["seconds"] = time.monotonic() - t_start
+    return stats
@@ -0,0 +1,165 @@
+"""Emoji reactions.
+
+Most messages never reach a model.  A gate on the event loop lets through
+about REACTION_RATE of messages, rising towards REACTION_EXCITED_RATE the
+more excited a message looks (exclamation marks, shouting, emoji, hype
+words).  Messages that pass wait on a small bounded queue that drops new
+arrivals when full.  The worker then picks the emoji whose description is
+nearest to the message by embedding, and only asks the LLM when nothing is
+close enough.
+"""
+import asyncio
+import random
+import re
+
+from cfmb.config import config
+from cfmb.vectors import FixedEmbeddings, cosine
+
+# Matches common Unicode emoji ranges
+EMOJI_PATTERN = re.compile(
+    "[\U0001F000-\U0001FFFF"
+    "\u2600-\u27BF"
+    "\u2B00-\u2BFF"
+    "]+"
+)
+
+_EMOJI_CHAR = "[\U0001F000-\U0001FFFF\u2600-\u27BF\u2B00-\u2BFF]"
+# Variation selector, skin tones, subdivision-flag tags and the keycap mark
+_EMOJI_MODIFIERS = "[\uFE0F\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F\u20E3]*"
+
+# Matches one whole emoji: a flag (two regional indicators) or a base character
+# with its modifiers, joined to more by zero-width joiners (👩🏽‍🔧, 🏳️‍🌈).
+EMOJI_SEQUENCE = re.compile(
+    f"[\U0001F1E6-\U0001F1FF]{{2}}|{_EMOJI_CHAR}{_EMOJI_MODIFIERS}(?:\u200D{_EMOJI_CHAR}{_EMOJI_MODIFIERS})*"
+)
+
+# Candidate reactions and what they suit; the descriptions are what gets embedded.
+REACTION_EMOJI = {
+    "🐻": "strength, solidarity, the bear, comrades sticking together",
+    "🛠️": "building, fixing, repairing, tools, making something in the shop",
+    "⚙️": "machines, mechanisms, gears, engineering, how something works",
+    "🏭": "production, manufacturing, work, factories, getting things done",
+    "🛰️": "space, satellites, rockets, radio, electronics, science",
+    "✊": "standing together, victory, we did it, pride, the collective",
+    "🎉": "celebration, congratulations, finished project, good news, birthday",
+    "🔥": "impressive, amazing, looks great, hot, awesome work",
+    "😂": "funny, joke, laughing, hilarious",
+    "👀": "interesting, curious, suspicious, look at this, tell me more",
+}
+
+_HYPE_RE = re.compile(
+    r"\b(let'?s go+|hell yes|woo+|yay+|omg|awesome|amazing|incredible|congrat\w*|finally|hype|nailed it|it works)\b",
+    re.IGNORECASE,
+)
+
+
+def excitement(text: str) -> float:
+    """Scores how excited a message looks, from 0 (calm) to 1."""
+    if not text:
+        return 0.0
+    score = 0.0
+    score += min(text.count("!"), 3) * 0.2
+    letters = [c for c in text if c.isalpha()]
+    if len(letters) >= 8 and sum(c.isupper() for c in letters) / len(letters) > 0.6:
+        score += 0.4
+    emoji = sum(len(m) for m in EMOJI_PATTERN.findall(text))
+    if emoji:
+        score += min(emoji / max(len(text.split()), 1), 1.0) * 0.5
+    if _HYPE_RE.search(text):
+        score += 0.4
+    return min(score, 1.0)
+
+
+class ReactionPipeline:
+    """Decides which messages get an emoji reaction and picks the emoji, cheapest step first."""
+
+    def __init__(self, llm_client, rate=None, excited_rate=None, queue_size=None, rng=None):
+        self.llm = llm_client
+        self.rate = config.REACTION_RATE if rate is None else rate
+        self.excited_rate = config.REACTION_EXCITED_RATE if excited_rate is None else excited_rate
+        self.queue = asyncio.Queue(maxsize=config.REACTION_QUEUE_SIZE if queue_size is None else queue_size)
+        self.rng = rng or random.Random()
+        self.emoji_embeddings = FixedEmbeddings(llm_client, REACTION_EMOJI.values())
+        self.counts = {"seen": 0, "queued": 0, "dropped": 0, "embedding": 0, "llm": 0, "skipped": 0}
+
+    def gate(self, text: str) -> bool:
+        """Draws whether to react, more often the more excited the message looks."""
+        chance = self.rate + (self.excited_rate - self.rate) * excitement(text)
+        return self.rng.random() < chance
+
+    def offer(self, message) -> bool:
+        """Queues a message if it passes the gate and there is room; never waits."""
+        self.counts["seen"] += 1
+        if not message.content or message.content.startswith("/") or not self.gate(message.content):
+            return False
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.counts["dropped"] += 1
+            print(f"Reactions: queue full, dropped message (dropped {self.counts['dropped']})")
+            return False
+        self.counts["queued"] += 1
+        return True
+
+    async def pick_nearest(self, text: str) -> str | None:
+        """Returns the candidate emoji nearest to the message, if it is similar enough."""
+        if not config.OLLAMA_EMBEDDING_MODEL:
+            return None
+        vectors = await self.emoji_embeddings.vectors()
+        embedding = await self.llm.get_embedding(text, config.OLLAMA_EMBEDDING_MODEL)
+        if not vectors or not embedding:
+            return None
+        similarity, emoji = max((cosine(embedding, v), e) for e, v in zip(REACTION_EMOJI, vectors))
+        return emoji if similarity >= config.REACTION_EMBED_MIN_SIMILARITY else None
+
+    async def pick_llm(self, text: str) -> str | None:
+        """Asks the LLM for one emoji, at background priority."""
+        prompt_messages = [
+            {
+                "role": "system",
+                "content": (
+                    "You are a Discord bot that reacts to messages with a single emoji. "
+                    "Respond with exactly one emoji character that fits the message. "
+                    "Prefer emojis like 🐻🛠️⚙️🏭🛰️✊ as communist symbols, but choose whichever fits best. "
+                    "Output only the emoji — nothing else."
+                ),
+            },
+            {"role": "user", "content": text},
+        ]
+        response = await self.llm.get_completion(prompt_messages, label="reaction", priority="background")
+        match = EMOJI_SEQUENCE.search(response or "")
+        return match.group(0) if match else None
+
+    async def pick(self, text: str) -> tuple[str | None, str]:
+        """Returns (emoji or None, source) trying the embedding picker before the LLM."""
+        emoji = await self.pick_nearest(text)
+        if emoji:
+            return emoji, "embedding"
+        if config.REACTION_LLM:
+            emoji = await self.pick_llm(text)
+            if emoji:
+                return emoji, "llm"
+        return None, "skipped"
+
+    async def react(self, message):
+        emoji, source = await self.pick(message.content)
+        self.counts[source] += 1
+        if not emoji:
+            return
+        try:
+            await message.add_reaction(emoji)
+            print(f"Reactions: reacted with {emoji} via {source} "
+                  f"(seen {self.counts['seen']}, queued {self.counts['queued']}, dropped {self.counts['dropped']})")
+        except Exception as e:
+            print(f"Reactions: failed to add reaction: {e}")
+
+    async def run(self):
+        """Reacts to queued messages one at a time."""
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.react(message)
+            except Exception as e:
+                print(f"Error in emoji reaction worker: {e}")
+            finally:
+                self.queue.task_done()
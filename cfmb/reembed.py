@@ -0,0 +1,114 @@
+"""Background re-embedding after an embedding model change.
+
+Every rag_chunks row records the model and dimension of its embedding.  When
+OLLAMA_EMBEDDING_MODEL changes, the worker re-embeds the chunks tagged with
+any other model in place, newest first, a small batch at a time at the
+scheduler's background priority (so only while no chat or batch work is in
+flight), pausing between batches.  Until it is done, search embeds the query
+once per model still present and scores each model's chunks with the
+matching query vector.  Once the worker has converted every chunk, search
+stops looking up which models are present.
+"""
+import asyncio
+import time
+
+from cfmb.config import config
+
+# The model every chunk was last found converted to; set by ReembedWorker when it finishes.
+_migrated_to = None
+
+
+def untagged_model() -> str | None:
+    """Returns the model assumed to have produced chunks stored before embeddings were tagged."""
+    return config.EMBEDDING_LEGACY_MODEL or config.OLLAMA_EMBEDDING_MODEL
+
+
+def search_models(server_id, db_manager) -> list[str]:
+    """Returns the embedding models a search should query for a server: the configured one first,
+    then any others its chunks still use."""
+    target = config.OLLAMA_EMBEDDING_MODEL
+    if not target:
+        return []
+    if _migrated_to == target:
+        return [target]
+    models = [target]
+    for model in db_manager.get_rag_embedding_models(server_id):
+        model = model or untagged_model()
+        if model not in models:
+            models.append(model)
+    return models
+
+
+class ReembedWorker:
+    """Converts every chunk to the configured embedding model, tracking progress."""
+
+    def __init__(self, db_manager, llm_client, model=None, batch_size=None, pause=None):
+        self.db = db_manager
+        self.llm = llm_client
+        self.model = model or config.OLLAMA_EMBEDDING_MODEL
+        self.batch_size = batch_size or config.EMBEDDING_MIGRATION_BATCH_SIZE
+        self.pause = config.EMBEDDING_MIGRATION_PAUSE_SECONDS if pause is None else pause
+        self.converted = 0
+        self.failed_batches = 0
+        self.started = None
+
+    def progress(self) -> dict:
+        """Returns {"model", "done", "total", "remaining", "rate"} (rate in chunks/s for this run)."""
+        counts = self.db.get_rag_embedding_models()
+        total = sum(counts.values())
+        done = counts.get(self.model, 0)
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            "model": self.model, "done": done, "total": total, "remaining": total - done,
+            "rate": self.converted / elapsed if elapsed else 0.0,
+        }
+
+    async def step(self) -> int | None:
+        """Re-embeds one batch. Returns the number of chunks converted, 0 when none are left, None on failure."""
+        rows = self.db.get_rag_chunks_to_reembed(self.model, self.batch_size)
+        if not rows:
+            return 0
+        embeddings = await self.llm.get_embeddings([r["content"] for r in rows], self.model, priority="background")
+        if not embeddings or len(embeddings) != len(rows):
+            self.failed_batches += 1
+            return None
+        converted = self.db.update_rag_embeddings(
+            [(r["id"], r["content"], e) for r, e in zip(rows, embeddings)], self.model,
+        )
+        self.converted += converted
+        return converted
+
+    async def run(self):
+        """Tags legacy chunks, then re-embeds until every chunk uses the configured model."""
+        if not self.model:
+            return
+        tagged = self.db.tag_rag_embeddings(untagged_model())
+        if tagged:
+            print(f"Re-embed: tagged {tagged} legacy chunks as {untagged_model()}")
+        progress = self.progress()
+        if not progress["remaining"]:
+            self._finish()
+            return
+        print(f"Re-embed: converting {progress['remaining']} of {progress['total']} chunks to {self.model}")
+        self.started = time.monotonic()
+        batches = 0
+        while True:
+            converted = await self.step()
+            if converted == 0 and not self.progress()["remaining"]:
+                break
+            batches += 1
+            if converted is None:
+                print(f"Re-embed: batch failed, backing off ({self.failed_batches} failures so far)")
+                await asyncio.sleep(self.pause * 10)
+                continue
+            if batches % 10 == 0:
+                p = self.progress()
+                print(f"Re-embed: {p['done']}/{p['total']} chunks on {self.model} ({p['rate']:.1f} chunks/s)")
+            await asyncio.sleep(self.pause)
+        print(f"Re-embed: done, {self.converted} chunks converted in {time.monotonic() - self.started:.0f}s")
+        self._finish()
+
+    def _finish(self):
+        """New chunks are always written with the configured model, so search need not look again."""
+        global _migrated_to
+        _migrated_to = self.model
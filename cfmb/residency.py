@@ -0,0 +1,128 @@
+"""Model residency.
+
+Every call names how long Ollama should keep its model loaded afterwards
+(keep_alive): OLLAMA_KEEP_ALIVE_RESIDENT for the chat and embedding models,
+which are needed for every message, OLLAMA_KEEP_ALIVE for anything else, and
+per-model overrides from OLLAMA_KEEP_ALIVE_MODELS ("model=30m, other=-1").
+
+Batch and background calls are grouped by model: while one model's batch
+work is running, batch work for another model waits, so a daily job does
+not swap models on every call.  A group stops admitting new calls once
+another model has waited OLLAMA_BATCH_GROUP_SECONDS.  Interactive calls are
+never held back.
+
+Ollama reports how long each call spent loading its model; calls that had to
+load it count as load events, which are logged with their cold-start time.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from cfmb.config import config
+
+# A call whose load_duration exceeds this had to load the model rather than find it resident.
+COLD_LOAD_SECONDS = 0.25
+
+
+def _duration(value: str):
+    """Ollama accepts keep_alive as a duration string or a number of seconds (-1 keeps the model forever)."""
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class ResidencyManager:
+    """Chooses keep_alive per model, groups batch work by model and tracks model loads."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.overrides = {}
+        for entry in config.OLLAMA_KEEP_ALIVE_MODELS.split(","):
+            model, _, value = entry.partition("=")
+            if model.strip() and value.strip():
+                self.overrides[model.strip()] = _duration(value)
+        self.stats = {}
+        self._group = None
+        self._previous = None
+        self._active = 0
+        self._waiting = {}
+        self._waiting_since = {}
+        self._changed = asyncio.Condition()
+
+    def keep_alive(self, model: str):
+        if model in self.overrides:
+            return self.overrides[model]
+        if model in (config.OLLAMA_MODEL, config.OLLAMA_FAST_MODEL, config.OLLAMA_EMBEDDING_MODEL):
+            return _duration(config.OLLAMA_KEEP_ALIVE_RESIDENT)
+        return _duration(config.OLLAMA_KEEP_ALIVE)
+
+    def observe(self, model: str, response):
+        """Records one call's load time from an Ollama response (or its final streamed chunk)."""
+        stats = self.stats.setdefault(model, {"calls": 0, "loads": 0, "load_seconds": 0.0, "max_load_seconds": 0.0})
+        stats["calls"] += 1
+        try:
+            load_seconds = (response.get("load_duration") or 0) / 1e9
+        except AttributeError:
+            return
+        if load_seconds < COLD_LOAD_SECONDS:
+            return
+        stats["loads"] += 1
+        stats["load_seconds"] += load_seconds
+        stats["max_load_seconds"] = max(stats["max_load_seconds"], load_seconds)
+        print(f"Residency: {model} loaded in {load_seconds:.2f}s "
+              f"(load {stats['loads']} in {stats['calls']} calls, avg {stats['load_seconds'] / stats['loads']:.2f}s)")
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"`{model}` {s['loads']} loads/{s['calls']} calls"
+            + (f" (avg {s['load_seconds'] / s['loads']:.1f}s)" if s["loads"] else "")
+            for model, s in sorted(self.stats.items())
+        )
+
+    def _may_enter(self, model) -> bool:
+        others = [self._waiting_since[m] for m, n in self._waiting.items() if m != model and n]
+        if self._group is None:
+            return model != self._previous or not others
+        if self._group != model:
+            return False
+        return not others or time.monotonic() - min(others) < config.OLLAMA_BATCH_GROUP_SECONDS
+
+    @asynccontextmanager
+    async def group(self, model: str):
+        """Holds a place in model's batch group, waiting while another model's group runs."""
+        async with self._changed:
+            if not self._waiting.get(model):
+                self._waiting_since[model] = time.monotonic()
+            self._waiting[model] = self._waiting.get(model, 0) + 1
+            try:
+                await self._changed.wait_for(lambda: self._may_enter(model))
+            finally:
+                self._waiting[model] -= 1
+                self._changed.notify_all()
+            self._group = model
+            self._active += 1
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self._active -= 1
+                if not self._active:
+                    self._previous, self._group = self._group, None
+                self._changed.notify_all()
+
+    async def preload(self, model: str, embedding: bool = False):
+        """Loads a model ahead of its first request."""
+        t_start = time.monotonic()
+        keep_alive = self.keep_alive(model)
+        try:
+            if embedding:
+                response = await self.pool.call(model, lambda b: b.client.embed(model=model, input="", keep_alive=keep_alive))
+            else:
+                response = await self.pool.call(model, lambda b: b.client.generate(model=model, keep_alive=keep_alive))
+        except Exception as e:
+            print(f"Residency: failed to preload {model}: {e}")
+            return
+        self.observe(model, response)
+        print(f"Residency: preloaded {model} in {time.monotonic() - t_start:.2f}s (keep_alive {keep_alive})")
@@ -0,0 +1,91 @@
+"""Per-request model routing.
+
+Each chat request picks its own model instead of switching the shared
+client: short, simple prompts go to OLLAMA_FAST_MODEL with thinking off,
+anything long, multi-part, code-like or asking for reasoning goes to
+OLLAMA_MODEL with thinking on.  A user's override (set with /cfmb-set ...
+me) beats their channel's, which beats the heuristics.  Without a fast
+model everything goes to the slow one.
+"""
+import re
+
+from cfmb.config import config
+from cfmb.context_budget import estimate_tokens
+
+MODES = ("fast", "slow")
+
+_COMPLEX_RE = re.compile(
+    r"\b(why|explain|how does|how do|how would|compare|analy[sz]e|design|plan|debug|prove|derive|calculate|"
+    r"step by step|pros and cons|trade-?offs?|summari[sz]e|write (?:a|an|me) (?:essay|story|program|script|function|poem))\b",
+    re.IGNORECASE,
+)
+
+
+class Route:
+    """The model and thinking setting chosen for one request, and why."""
+
+    __slots__ = ("mode", "model", "think", "reason")
+
+    def __init__(self, mode, reason):
+        self.mode = mode
+        self.model = config.OLLAMA_FAST_MODEL if mode == "fast" else config.OLLAMA_MODEL
+        self.think = mode == "slow"
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.mode}, {self.model}, think={self.think}, {self.reason})"
+
+
+def classify(text: str, images: bool = False, url: bool = False) -> tuple[str, str]:
+    """Returns ("fast" | "slow", reason) for a prompt from cheap heuristics."""
+    tokens = estimate_tokens(text)
+    if images:
+        return "slow", "image attached"
+    if url:
+        return "slow", "web page"
+    if tokens > config.ROUTE_FAST_MAX_TOKENS:
+        return "slow", f"{tokens} tokens"
+    if "```" in text:
+        return "slow", "code"
+    if text.count("?") > 1:
+        return "slow", "several questions"
+    if match := _COMPLEX_RE.search(text):
+        return "slow", f"asks to {match.group(0).lower()}"
+    return "fast", f"short ({tokens} tokens)"
+
+
+class ModelRouter:
+    """Chooses a Route per request and keeps latency and timeouts per mode."""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self.stats = {mode: {"count": 0, "seconds": 0.0, "timeouts": 0} for mode in MODES}
+
+    def route(self, server_id, channel_id, user_id, text, images=False, url=False, debug=False) -> Route:
+        if not config.OLLAMA_FAST_MODEL:
+            route = Route("slow", "no fast model")
+        elif debug:
+            route = Route("slow", "debug shows thinking")
+        else:
+            overrides = self.db.get_model_overrides(server_id, channel_id, user_id)
+            if "user" in overrides:
+                route = Route(overrides["user"], "user override")
+            elif "channel" in overrides:
+                route = Route(overrides["channel"], "channel override")
+            else:
+                route = Route(*classify(text, images, url))
+        print(f"Route: {route.mode} ({route.model}, think {'on' if route.think else 'off'}) — {route.reason}")
+        return route
+
+    def record(self, route: Route, seconds: float, timed_out: bool = False):
+        """Logs a finished or timed-out request's latency along with the running fast/slow split."""
+        stats = self.stats[route.mode]
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        stats["timeouts"] += timed_out
+        split = ", ".join(
+            f"{mode} {s['count']} (avg {s['seconds'] / s['count']:.1f}s, {s['timeouts']} timed out)" if s["count"] else f"{mode} 0"
+            for mode, s in self.stats.items()
+        )
+        outcome = "timed out after" if timed_out else "took"
+        print(f"Route: {route.mode} request {outcome} {seconds:.2f}s; split {split}")
@@ -0,0 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+PRIORITIES = ("interactive", "batch", "background")
+
+
+class LLMScheduler:
+    """Limits concurrent model calls per priority class.
+
+    interactive: chat replies; unlimited unless a limit is given.
+    batch: daily jobs and other bulk work, bounded so it cannot starve chat.
+    background: migrations and maintenance; only runs while nothing else is in flight.
+    """
+
+    def __init__(self, limits: dict[str, int] | None = None):
+        limits = limits or {}
+        self._semaphores = {
+            p: asyncio.Semaphore(limits[p]) for p in PRIORITIES if limits.get(p)
+        }
+        self.active = {p: 0 for p in PRIORITIES}
+        self._idle = asyncio.Condition()
+
+    def busy(self, priority: str) -> bool:
+        """True if any work of the given class is in flight."""
+        return self.active[priority] > 0
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        """Holds a concurrency slot for one model call of the given priority."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if priority == "background":
+            async with self._idle:
+                await self._idle.wait_for(lambda: not self.active["interactive"] and not self.active["batch"])
+        semaphore = self._semaphores.get(priority)
+        if semaphore:
+            await semaphore.acquire()
+        self.active[priority] += 1
+        try:
+            yield
+        finally:
+            self.active[priority] -= 1
+            if semaphore:
+                semaphore.release()
+            async with self._idle:
+                self._idle.notify_all()
@@ -0,0 +1,215 @@
+"""Hybrid guild search.
+
+A query is matched lexically against the FTS5 indexes (BM25 over RAG chunks
+and raw messages) and semantically against the chunk embeddings, and the
+ranked lists are merged with reciprocal-rank fusion.  Embedding the query is
+skipped when the embedding model is unconfigured, busy or slow, in which case
+the lexical results are returned on their own.  While chunks are being
+re-embedded with a new model, the query is embedded once per model and each
+model's chunks are scored with the matching vector.  Vector results are
+cached for near-identical queries until chunks are added to or removed from
+a channel they came from, or for at most SEARCH_CACHE_TTL_SECONDS.
+"""
+import asyncio
+import random
+import re
+import time
+from collections import OrderedDict
+
+from cfmb.config import config
+from cfmb.reembed import search_models, untagged_model
+from cfmb.vectors import cosine
+
+RRF_K = 60
+MIN_CANDIDATES = 20
+
+
+def fts_query(text: str) -> str | None:
+    """Turns free text into an FTS5 query matching any of its words, or None if it has none."""
+    terms = dict.fromkeys(re.findall(r"\w+", text.lower()))
+    return " OR ".join(f'"{t}"' for t in terms) or None
+
+
+def reciprocal_rank_fusion(ranked_lists, k: int = RRF_K) -> list:
+    """Merges ranked lists of keys into one list ordered by summed 1 / (k + rank)."""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, key in enumerate(ranked, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class QueryCache:
+    """Caches vector search results for near-identical query embeddings.
+
+    Entries are grouped by the search filters and a locality-sensitive hash of
+    the query (the signs of its projections onto `bits` random hyperplanes), and
+    an entry is reused only if its query has cosine similarity of at least
+    `similarity` with the new one.  Each entry remembers the chunk version
+    ({channel_id: counter}) of the channels its results came from, and is
+    stale once any of those has moved on (chunks were added to or removed
+    from the channel) or it is older than `ttl` seconds.  Chunks added to
+    other channels show up once entries expire, so one busy channel does not
+    empty the whole cache.
+    """
+
+    def __init__(self, max_entries=256, similarity=0.97, ttl=600, bits=12):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.ttl = ttl
+        self.bits = bits
+        self._planes = {}
+        self._buckets = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _signature(self, embedding):
+        dim = len(embedding)
+        if dim not in self._planes:
+            rng = random.Random(dim)
+            self._planes[dim] = [[rng.gauss(0, 1) for _ in range(dim)] for _ in range(self.bits)]
+        return sum(
+            1 << i for i, plane in enumerate(self._planes[dim])
+            if sum(p * x for p, x in zip(plane, embedding)) >= 0
+        )
+
+    def _current(self, entry, versions, now):
+        _, _, seen, stored = entry
+        return now - stored <= self.ttl and all(versions.get(channel, 0) == v for channel, v in seen.items())
+
+    def get(self, key, embedding, versions):
+        """Returns cached results for a similar query under the same key whose channels are unchanged, or None."""
+        bucket = (key, self._signature(embedding))
+        entries = self._buckets.get(bucket, [])
+        now = time.monotonic()
+        fresh = [e for e in entries if self._current(e, versions, now)]
+        if len(fresh) != len(entries):
+            self.invalidations += len(entries) - len(fresh)
+            self._size -= len(entries) - len(fresh)
+            if fresh:
+                self._buckets[bucket] = fresh
+            else:
+                del self._buckets[bucket]
+            entries = fresh
+        for cached, results, _, _ in entries:
+            if len(cached) == len(embedding) and cosine(cached, embedding) >= self.similarity:
+                self.hits += 1
+                self._buckets.move_to_end(bucket)
+                return [dict(r) for r in results]
+        self.misses += 1
+        return None
+
+    def put(self, key, embedding, versions, results):
+        """Caches results along with the current versions of the channels they came from."""
+        bucket = (key, self._signature(embedding))
+        seen = {r.get("channel_id") or "": versions.get(r.get("channel_id") or "", 0) for r in results}
+        self._buckets.setdefault(bucket, []).append((list(embedding), [dict(r) for r in results], seen, time.monotonic()))
+        self._buckets.move_to_end(bucket)
+        self._size += 1
+        while self._size > self.max_entries and self._buckets:
+            _, evicted = self._buckets.popitem(last=False)
+            self._size -= len(evicted)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counts, the hit ratio, vector scans avoided and the current size."""
+        lookups = self.hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "avoided_scans": self.hits,
+            "invalidations": self.invalidations,
+            "entries": self._size,
+        }
+
+
+query_cache = QueryCache(config.SEARCH_CACHE_SIZE, config.SEARCH_CACHE_SIMILARITY, config.SEARCH_CACHE_TTL_SECONDS)
+
+
+async def _embed_query(query, llm_client, model):
+    if llm_client.pending_embeddings >= config.SEARCH_EMBED_MAX_PENDING:
+        print(f"Guild search: {llm_client.pending_embeddings} embeddings pending, skipping vector search")
+        return None
+    try:
+        return await asyncio.wait_for(llm_client.get_embedding(query, model), config.SEARCH_EMBED_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"Guild search: embedding took over {config.SEARCH_EMBED_TIMEOUT_SECONDS}s, skipping vector search")
+        return None
+
+
+async def hybrid_search(query, server_id, db_manager, llm_client, limit=3, hours=None, exclude_channels=None) -> list[dict]:
+    """Returns up to `limit` results for a query, best first.
+
+    Each result has "kind" ("chunk" or "message"), "id", "content", "channel_id",
+    "channel_name", "message_id" and "distance" (cosine distance, or None if the
+    result was only found lexically).  Raw messages already contained in a
+    returned chunk are left out.
+    """
+    models = search_models(server_id, db_manager)
+    embed_tasks = {model: asyncio.ensure_future(_embed_query(query, llm_client, model)) for model in models}
+    depth = max(limit * 4, MIN_CANDIDATES)
+    match = fts_query(query)
+    items = {}
+    lexical_chunks, lexical_messages, vector_chunks = [], [], []
+    if match:
+        for r in db_manager.search_rag_chunks_fts(server_id, match, depth, hours, exclude_channels):
+            items[("chunk", r["id"])] = {**r, "kind": "chunk", "distance": None}
+            lexical_chunks.append(("chunk", r["id"]))
+        for r in db_manager.search_raw_messages_fts(server_id, match, depth, hours, exclude_channels):
+            items[("message", r["id"])] = {
+                "kind": "message", "id": r["id"], "content": f"{r['username']}: {r['content']}",
+                "channel_id": r["channel_id"], "channel_name": r["channel_name"],
+                "message_id": r["message_id"], "distance": None, "raw": r["content"],
+            }
+            lexical_messages.append(("message", r["id"]))
+
+    # Centroids mix models mid-migration, so routing waits until there is one model.
+    route_channels = config.RAG_ROUTE_CHANNELS if len(models) == 1 else 0
+    vector = []
+    embedded = False
+    for model, task in embed_tasks.items():
+        embedding = await task
+        if not embedding:
+            continue
+        embedded = True
+        key = (server_id, model, depth, hours, frozenset(exclude_channels or ()), route_channels, config.RAG_ROUTE_WEEKLY)
+        versions = db_manager.get_rag_versions(server_id)
+        results = query_cache.get(key, embedding, versions) if config.SEARCH_CACHE_SIZE else None
+        if results is None:
+            results = db_manager.search_rag_chunks(
+                server_id, embedding, limit=depth, hours=hours, exclude_channels=exclude_channels,
+                route_channels=route_channels, route_weekly=config.RAG_ROUTE_WEEKLY,
+                model=model, include_untagged=model == untagged_model(),
+            )
+            if config.SEARCH_CACHE_SIZE:
+                query_cache.put(key, embedding, versions, results)
+        else:
+            stats = query_cache.stats()
+            print(f"Guild search: cache hit ({stats['hit_ratio']:.0%} of {stats['lookups']} lookups, "
+                  f"{stats['avoided_scans']} scans avoided)")
+        vector += results
+    for r in sorted(vector, key=lambda r: r["distance"])[:depth]:
+        items.setdefault(("chunk", r["id"]), {**r, "kind": "chunk"})["distance"] = r["distance"]
+        vector_chunks.append(("chunk", r["id"]))
+    print(
+        f"Guild search: {len(vector_chunks)} vector, {len(lexical_chunks)} chunk and "
+        f"{len(lexical_messages)} message lexical hits{'' if embedded else ' (lexical only)'}"
+    )
+
+    results = []
+    for key in reciprocal_rank_fusion([vector_chunks, lexical_chunks, lexical_messages]):
+        item = items[key]
+        if item["kind"] == "message" and any(
+            r["kind"] == "chunk" and r["channel_id"] == item["channel_id"] and item["raw"] in r["content"]
+            for r in results
+        ):
+            continue
+        results.append(item)
+        if len(results) == limit:
+            break
+    for item in results:
+        item.pop("raw", None)
+    return results
@@ -0,0 +1,214 @@
+"""Map-reduce summarization for transcripts too large for one prompt.
+
+A transcript is a list of (heading, lines) blocks, e.g. one block per channel
+with lines in time order.  It is packed into windows that fit the token
+budget, each window is summarized concurrently (bounded by the scheduler's
+batch class), and the partial summaries are reduced hierarchically until a
+single result remains.
+"""
+import asyncio
+import time
+
+from cfmb.config import config
+
+FACTS_SYSTEM_PROMPT = (
+    "You are an analyst for the Cape Fear Makers Guild Discord server. "
+    "You will be given a transcript of messages, or notes on them, grouped by channel. "
+    "Identify the five most important facts, events, announcements, plans, or pieces of information. "
+    "For each fact, list the users involved and the channel it came from.\n\n"
+    "Return ONLY the facts in this exact format, separated by ---:\n\n"
+    "what: one sentence describing the fact\n"
+    "users: user1, user2\n"
+    "channel: #channel-name\n"
+    "---\n"
+    "what: another fact\n"
+    "users: user3\n"
+    "channel: #other-channel\n\n"
+    "Do not add any other text, headers, or commentary."
+)
+
+FACTS_REDUCE_PROMPT = (
+    "You are an analyst for the Cape Fear Makers Guild Discord server. "
+    "You will be given several lists of facts, each extracted from a consecutive part of the same transcript. "
+    "Merge duplicates and select the five most important facts overall, keeping the users and channel of each.\n\n"
+    "Return ONLY the facts in this exact format, separated by ---:\n\n"
+    "what: one sentence describing the fact\n"
+    "users: user1, user2\n"
+    "channel: #channel-name\n\n"
+    "Do not add any other text, headers, or commentary."
+)
+
+PARTIAL_SEPARATOR = "\n\n=====\n\n"
+MAX_REDUCE_DEPTH = 4
+
+
+def window_tokens(llm_client) -> int:
+    """Token size of one map window: SUMMARY_WINDOW_TOKENS, or the history share of the context budget."""
+    return config.SUMMARY_WINDOW_TOKENS or llm_client.budget.section_limit("history")
+
+
+def split_windows(blocks, max_tokens, estimate) -> list[str]:
+    """Packs (heading, lines) blocks into transcript windows of at most max_tokens.
+
+    Lines keep their order; a block's heading is repeated at the top of every
+    window the block spills into.  A single line larger than a window gets a
+    window of its own and is left for the context budget to trim.
+    """
+    windows = []
+    current = []
+    size = 0
+    for heading, lines in blocks:
+        header = f"#{heading}" if heading else None
+        header_size = estimate(header) if header else 0
+        started = False
+        for line in lines:
+            line_size = estimate(line)
+            extra = line_size + (0 if started else header_size)
+            if current and size + extra > max_tokens:
+                windows.append("\n".join(current))
+                current, size, started = [], 0, False
+                extra = line_size + header_size
+            if not started and header:
+                if current:
+                    current.append("---")
+                current.append(header)
+                started = True
+            current.append(line)
+            size += extra
+    if current:
+        windows.append("\n".join(current))
+    return windows
+
+
+class Summarizer:
+    """Runs map-reduce summarization through an LLMClient."""
+
+    def __init__(self, llm_client, max_tokens: int | None = None, priority: str = "batch"):
+        self.llm = llm_client
+        self.max_tokens = max_tokens or window_tokens(llm_client)
+        self.priority = priority
+
+    def _estimate(self, text):
+        return self.llm.budget.estimate(text, self.llm.model_name)
+
+    async def _complete(self, prompt, label):
+        return await self.llm.get_completion(prompt, label=label, priority=self.priority)
+
+    async def run(self, blocks, map_prompt, reduce_prompt, label="summary", single_prompt=None) -> str | None:
+        """Summarizes blocks of transcript lines.
+
+        map_prompt(window_text) and reduce_prompt(joined_partials) each return an
+        Ollama message list.  When everything fits in one window this is a single
+        call with single_prompt (default map_prompt), identical to summarizing the
+        whole transcript at once.
+        """
+        t_start = time.monotonic()
+        windows = split_windows(blocks, self.max_tokens, self._estimate)
+        if not windows:
+            return None
+        if len(windows) == 1:
+            result = await self._complete((single_prompt or map_prompt)(windows[0]), label)
+            return result.strip() if result and result.strip() else None
+
+        partials = await asyncio.gather(*(
+            self._complete(map_prompt(w), f"{label} map {i + 1}/{len(windows)}")
+            for i, w in enumerate(windows)
+        ))
+        partials = [p.strip() for p in partials if p and p.strip()]
+        print(f"Summarizer [{label}]: mapped {len(windows)} windows in {time.monotonic() - t_start:.1f}s")
+        result = await self.reduce(partials, reduce_prompt, label)
+        print(f"Summarizer [{label}]: reduced in {time.monotonic() - t_start:.1f}s")
+        return result
+
+    async def reduce(self, partials, reduce_prompt, label="summary") -> str | None:
+        """Reduces partial summaries hierarchically until one remains."""
+        depth = 0
+        while len(partials) > 1 and depth < MAX_REDUCE_DEPTH:
+            depth += 1
+            groups = self._group(partials)
+            reduced = await asyncio.gather(*(
+                self._complete(reduce_prompt(PARTIAL_SEPARATOR.join(g)), f"{label} reduce {depth}.{i + 1}/{len(groups)}")
+                for i, g in enumerate(groups)
+            ))
+            partials = [r.strip() for r in reduced if r and r.strip()]
+        if len(partials) > 1:
+            # Give up on further reduction; the final call gets whatever fits in the budget
+            result = await self._complete(reduce_prompt(PARTIAL_SEPARATOR.join(partials)), f"{label} reduce final")
+            return result.strip() if result else None
+        return partials[0] if partials else None
+
+    def _group(self, partials) -> list[list[str]]:
+        """Groups consecutive partials into reduce inputs of at most max_tokens, at least two per group."""
+        groups = []
+        current = []
+        size = 0
+        for p in partials:
+            p_size = self._estimate(p)
+            if len(current) >= 2 and size + p_size > self.max_tokens:
+                groups.append(current)
+                current, size = [], 0
+            current.append(p)
+            size += p_size
+        if current:
+            if len(current) == 1 and groups:
+                groups[-1].append(current[0])
+            else:
+                groups.append(current)
+        return groups
+
+
+def facts_map_prompt(window):
+    return [
+        {"role": "system", "content": FACTS_SYSTEM_PROMPT},
+        {"role": "user", "content": window},
+    ]
+
+
+def facts_reduce_prompt(partials):
+    return [
+        {"role": "system", "content": FACTS_REDUCE_PROMPT},
+        {"role": "user", "content": partials},
+    ]
+
+
+def profile_map_prompt(username):
+    """Returns a map prompt builder that extracts profile notes from part of a user's transcript."""
+    def build(window):
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "You are a text analysis tool. From the chat transcript provided, list brief notes about the "
+                    "member: their interests, projects, notable facts, and conversation style. "
+                    "Output only the notes as a bulleted list."
+                ),
+            },
+            {"role": "user", "content": f"Transcript of messages from '{username}':\n\n{window}"},
+        ]
+    return build
+
+
+def channel_map_prompt(ch_name):
+    """Returns a map prompt builder for a newsletter channel summary."""
+    def build(window):
+        return [
+            {"role": "system", "content": config.SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Summarize the following messages from #{ch_name}:\n\n{window}"},
+        ]
+    return build
+
+
+def channel_reduce_prompt(ch_name):
+    """Returns a reduce prompt builder that merges partial summaries of one channel."""
+    def build(partials):
+        return [
+            {"role": "system", "content": config.SUMMARY_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": (
+                    f"The following are summaries of consecutive parts of today's messages from #{ch_name}, "
+                    f"separated by =====. Combine them into a single summary of #{ch_name}:\n\n{partials}"
+                ),
+            },
+        ]
+    return build
@@ -2,6 +2,7 @@ import re
 
 from cfmb.tools.base import Tool
 from cfmb.config import config
+from cfmb.search import hybrid_search
 
 
 def _resolve_mentions(text, id_to_name):
@@ -26,9 +27,6 @@ class GuildSearchTool(Tool):
         },
     }
 
-    def enabled(self) -> bool:
-        return bool(config.OLLAMA_EMBEDDING_MODEL)
-
     async def run(self, args: dict, context: dict) -> str:
         query = args.get("query", "")
         server_id = context["server_id"]
@@ -36,11 +34,8 @@ class GuildSearchTool(Tool):
         llm_client = context["llm_client"]
         db_manager = context["db_manager"]
 
-        embedding = await llm_client.get_embedding(query, config.OLLAMA_EMBEDDING_MODEL)
-        if not embedding:
-            return "Failed to generate embedding for search query."
         excluded = set(config.DEV_EXCLUDED_CHANNELS.split(",")) if config.DEV_EXCLUDED_CHANNELS else None
-        chunks = db_manager.search_rag_chunks(server_id, embedding, limit=3, hours=720, exclude_channels=excluded)
+        chunks = await hybrid_search(query, server_id, db_manager, llm_client, limit=3, hours=720, exclude_channels=excluded)
         if not chunks:
             return "No matching conversations found."
         results = []
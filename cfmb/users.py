@@ -0,0 +1,35 @@
+"""In-memory user directory.
+
+Each server's user_id -> display name map is loaded once from the users table
+and then kept current from incoming messages and gateway member updates, so
+mention resolution never has to query the database.
+"""
+from cfmb.config import config
+
+
+class UserDirectory:
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self._names = {}
+
+    def names(self, server_id) -> dict:
+        """Returns the live user_id -> display name map for a server, including the bot.
+
+        The map is shared; callers must not modify it.
+        """
+        if server_id not in self._names:
+            names = self.db.get_user_id_name_map(server_id, days=None)
+            names[str(config.BOT_USER_ID)] = config.BOT_DISPLAY_NAME
+            self._names[server_id] = names
+            print(f"User directory: loaded {len(names)} users for server {server_id}")
+        return self._names[server_id]
+
+    def record(self, server_id, user_id, username):
+        """Notes the display name seen on an ingested message (the users table is updated by the database)."""
+        if server_id in self._names:
+            self._names[server_id][str(user_id)] = username
+
+    def rename(self, server_id, user_id, username):
+        """Applies a display name change reported by the gateway."""
+        self.record(server_id, user_id, username)
+        self.db.update_user_name(server_id, user_id, username)
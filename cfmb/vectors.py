@@ -0,0 +1,31 @@
+"""Embedding helpers shared by search, moderation and reactions.
+
+Moderation and reactions each compare messages with a fixed set of texts
+(exemplars, emoji descriptions).  Those texts are embedded once, on first
+use, and kept for the life of the process.
+"""
+import math
+
+from cfmb.config import config
+
+
+def cosine(a, b) -> float:
+    """Returns the cosine similarity of two vectors, 0 if either is all zeros."""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class FixedEmbeddings:
+    """Embeds a fixed list of texts with the configured embedding model the first time they are needed."""
+
+    def __init__(self, llm_client, texts):
+        self.llm = llm_client
+        self.texts = list(texts)
+        self._vectors = None
+
+    async def vectors(self) -> list[list[float]] | None:
+        """Returns one vector per text, or None if embedding failed (it is retried on the next call)."""
+        if self._vectors is None:
+            self._vectors = await self.llm.get_embeddings(self.texts, config.OLLAMA_EMBEDDING_MODEL)
+        return self._vectors
@@ -9,7 +9,7 @@ import asyncio
 import sys
 
 sys.path.insert(0, ".")
-from cfmb.bot import _build_profile_prompt, _resolve_mentions
+from cfmb.bot import _generate_profile
 from cfmb.config import config
 from cfmb.db_manager import DatabaseManager
 from cfmb.llm_client import LLMClient
@@ -45,19 +45,12 @@ async def main():
             user_id = user["user_id"]
             username = user["username"]
             raw = db.get_raw_messages_by_user_7d(server_id, user_id)
-            if len(raw) < 20:
-                print(f"  {username}: fewer than 20 messages, skipping.")
+            if len(raw) < config.PROFILE_MIN_MESSAGES:
+                print(f"  {username}: fewer than {config.PROFILE_MIN_MESSAGES} messages, skipping.")
                 continue
 
-            transcript = "\n".join(
-                f"[{m['channel_name'] or 'unknown'}] {_resolve_mentions(m['content'], id_to_name)}"
-                for m in raw
-                if m["content"].strip()
-            )
-
             print(f"  {username}: generating profile from {len(raw)} messages...", end=" ", flush=True)
-            prompt = _build_profile_prompt(username, transcript)
-            profile = await llm.get_completion(prompt)
+            profile = await _generate_profile(username, raw, id_to_name, llm=llm)
             if profile:
                 db.write_user_profile(server_id, user_id, username, profile)
                 print("saved.")
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 """
-Backfill rag_chunks from the past 24 hours of raw_messages.
+Backfill rag_chunks from raw_messages.
+
+Chunks are built per channel in memory, embedded in concurrent batches and
+written in bulk.  Progress is checkpointed per channel, so rerunning after an
+interruption continues where the last run stopped; --reset starts over.
 
 Usage (from repo root):
-    source ~/.cfmb && .venv/bin/python etc/backfill_rag_chunks.py
+    source ~/.cfmb && .venv/bin/python etc/backfill_rag_chunks.py [--hours 168] [--batch-size 32] [--concurrency 4] [--reset]
 """
+import argparse
 import asyncio
 import sys
+import time
 
 from tqdm import tqdm
 
@@ -14,12 +20,17 @@ sys.path.insert(0, ".")
 from cfmb.config import config
 from cfmb.db_manager import DatabaseManager
 from cfmb.llm_client import LLMClient
-
-BATCH_THRESHOLD = 512
-BATCH_MAX_CONTENT = 2048
+from cfmb.rag_backfill import backfill_server
 
 
 async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hours", type=int, default=config.RAG_BACKFILL_HOURS, help="time window; 0 for all history")
+    parser.add_argument("--batch-size", type=int, default=config.RAG_BACKFILL_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=config.RAG_BACKFILL_CONCURRENCY)
+    parser.add_argument("--reset", action="store_true", help="ignore saved checkpoints")
+    args = parser.parse_args()
+
     if not config.OLLAMA_EMBEDDING_MODEL:
         print("OLLAMA_EMBEDDING_MODEL is not set — nothing to do.")
         return
@@ -29,62 +40,47 @@ async def main():
     llm = LLMClient(config.OLLAMA_MODEL)
 
     with db._get_connection() as conn:
-        rows = conn.execute(
-            """
-            SELECT server_id, message_id, username, content, channel_id, channel_name
-            FROM raw_messages
-            WHERE timestamp >= datetime('now', '-7 days')
-              AND content IS NOT NULL
-              AND trim(content) != ''
-              AND content NOT LIKE '/%'
-              AND channel_name IS NOT NULL
-            ORDER BY channel_id, timestamp ASC
-            """
-        ).fetchall()
-
-    if not rows:
-        print("No messages from the past 24 hours.")
+        server_ids = [row[0] for row in conn.execute("SELECT DISTINCT server_id FROM raw_messages").fetchall()]
+    if not server_ids:
+        print("No messages found in the database.")
         return
 
-    print(f"Processing {len(rows)} messages into RAG chunks with {config.OLLAMA_EMBEDDING_MODEL}...")
-
-    # Group by channel, batch into chunks
-    chunks_created = 0
-    chunks_updated = 0
-    failed = 0
-
-    with tqdm(rows, unit="msg") as bar:
-        for row in bar:
-            server_id = row["server_id"]
-            message_id = row["message_id"]
-            username = row["username"]
-            content = row["content"]
-            channel_id = row["channel_id"]
-            channel_name = row["channel_name"]
-
-            formatted = f"{username}: {content}"
-            latest = db.get_latest_rag_chunk(channel_id)
-
-            if latest and len(latest["content"]) <= BATCH_THRESHOLD:
-                new_content = (latest["content"] + "\n" + formatted)[:BATCH_MAX_CONTENT]
-                embedding = await llm.get_embedding(new_content, config.OLLAMA_EMBEDDING_MODEL)
-                if embedding:
-                    db.update_rag_chunk(latest["id"], new_content, embedding)
-                    chunks_updated += 1
-                else:
-                    failed += 1
-                    bar.write(f"  failed embedding update for {message_id}")
-            else:
-                new_content = formatted[:BATCH_MAX_CONTENT]
-                embedding = await llm.get_embedding(new_content, config.OLLAMA_EMBEDDING_MODEL)
-                if embedding:
-                    db.write_rag_chunk(server_id, message_id, channel_id, channel_name, new_content, embedding)
-                    chunks_created += 1
-                else:
-                    failed += 1
-                    bar.write(f"  failed embedding new chunk for {message_id}")
-
-    print(f"\nDone. {chunks_created} chunks created, {chunks_updated} updates, {failed} failed.")
+    window = f"past {args.hours} hours" if args.hours else "all history"
+    print(f"Backfilling RAG chunks for the {window} with {config.OLLAMA_EMBEDDING_MODEL} "
+          f"({args.batch_size} per request, {args.concurrency} in flight)...")
+
+    for server_id in server_ids:
+        if args.reset:
+            db.clear_rag_backfill_checkpoints(server_id)
+        bar = None
+        t_start = time.monotonic()
+        chunks_done = 0
+
+        def on_build(messages, chunks):
+            nonlocal bar
+            print(f"Server {server_id}: {messages} messages in {chunks} chunks to embed "
+                  f"(built in {time.monotonic() - t_start:.1f}s)")
+            bar = tqdm(total=messages, unit="msg", unit_scale=True)
+
+        def on_commit(messages, chunks):
+            nonlocal chunks_done
+            chunks_done += chunks
+            bar.update(messages)
+            bar.set_postfix(chunks=chunks_done, chunks_per_s=f"{chunks_done / max(bar.format_dict['elapsed'], 1e-9):.1f}")
+
+        stats = await backfill_server(
+            server_id, db, llm, hours=args.hours, batch_size=args.batch_size, concurrency=args.concurrency,
+            on_build=on_build, on_commit=on_commit,
+        )
+        bar.close()
+        print(f"Server {server_id}: {stats['chunks']} chunks ({stats['messages']} messages) written, "
+              f"{stats['failed']} failed, in {stats['seconds']:.1f}s "
+              f"({stats['messages'] / max(stats['seconds'], 1e-9):.1f} msgs/s, "
+              f"{stats['chunks'] / max(stats['seconds'], 1e-9):.1f} chunks/s)")
+        if stats["failed"]:
+            print("  Rerun to retry the failed chunks; written chunks are checkpointed.")
+
+    print("Done.")
 
 
 if __name__ == "__main__":
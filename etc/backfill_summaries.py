@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
 Backfill the summaries table with one summary per day for the past 7 days.
+Days with rolling digests are summarized from those instead of raw messages.
 
 Usage (from repo root):
     source ~/.cfmb && .venv/bin/python etc/backfill_summaries.py
@@ -11,25 +12,10 @@ from datetime import datetime, timedelta, timezone
 
 sys.path.insert(0, ".")
 from cfmb.config import config
-from cfmb.db_manager import DatabaseManager
+from cfmb.db_manager import DatabaseManager, iter_channels
+from cfmb.digests import SQLITE_FORMAT, load_day_blocks
 from cfmb.llm_client import LLMClient
-
-
-SUMMARY_SYSTEM_PROMPT = (
-    "You are an analyst for the Cape Fear Makers Guild Discord server. "
-    "You will be given a transcript of messages grouped by channel. "
-    "Identify the five most important facts, events, announcements, plans, or pieces of information. "
-    "For each fact, list the users involved and the channel it came from.\n\n"
-    "Return ONLY the facts in this exact format, separated by ---:\n\n"
-    "what: one sentence describing the fact\n"
-    "users: user1, user2\n"
-    "channel: #channel-name\n"
-    "---\n"
-    "what: another fact\n"
-    "users: user3\n"
-    "channel: #other-channel\n\n"
-    "Do not add any other text, headers, or commentary."
-)
+from cfmb.summarize import Summarizer, facts_map_prompt, facts_reduce_prompt
 
 
 async def main():
@@ -57,43 +43,32 @@ async def main():
             day_end = day_start + timedelta(days=1)
             label = day_start.strftime("%Y-%m-%d")
 
-            raw = db.get_raw_messages_date_range(server_id, day_start.isoformat(), day_end.isoformat())
-            if not raw:
-                print(f"  {label}: no messages, skipping.")
-                continue
-
-            channels = {}
-            for m in raw:
-                cid = m["channel_id"] or "unknown"
-                if cid in excluded:
+            blocks = load_day_blocks(
+                server_id, db, day_start.strftime(SQLITE_FORMAT), day_end.strftime(SQLITE_FORMAT), excluded,
+            )
+            if blocks is None:
+                raw = db.iter_raw_messages_date_range(server_id, day_start.isoformat(), day_end.isoformat())
+                blocks = [
+                    (name, [f"{m['username']}: {m['content']}" for m in messages])
+                    for _, name, messages in iter_channels(raw, excluded)
+                ]
+                if not blocks:
+                    print(f"  {label}: no messages, skipping.")
                     continue
-                channels.setdefault(cid, {"name": m["channel_name"] or cid, "messages": []})
-                channels[cid]["messages"].append(m)
+            else:
+                print(f"  {label}: using digests.", end=" ")
 
-            if not channels:
+            if not blocks:
                 print(f"  {label}: no messages after exclusions, skipping.")
                 continue
 
-            transcript_blocks = []
-            for data in channels.values():
-                ch_name = data["name"]
-                lines = [f"{m['username']}: {m['content']}" for m in data["messages"]]
-                transcript_blocks.append(f"#{ch_name}\n" + "\n".join(lines))
-
-            transcript = "\n---\n".join(transcript_blocks)
-
-            prompt = [
-                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
-                {"role": "user", "content": transcript},
-            ]
-
             print(f"  {label}: generating summary...", end=" ", flush=True)
-            result = await llm.get_completion(prompt)
+            result = await Summarizer(llm).run(blocks, facts_map_prompt, facts_reduce_prompt, label=f"summary {label}")
             if result:
                 with db._get_connection() as conn:
                     conn.execute(
                         "INSERT INTO summaries (timestamp, content) VALUES (?, ?)",
-                        (day_end.isoformat(), result),
+                        (day_end.strftime(SQLITE_FORMAT), result),
                     )
                 print("saved.")
             else:
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Compare RAG chunking settings on a fixture conversation.
+
+For each combination of chunk size, overlap and quiet-gap boundary, reports
+the number of chunks, their average size in tokens, and the recall@k of the
+fixture queries (a query is recalled when one of the top k chunks contains
+its answer message).  Chunks are ranked lexically by default, or with the
+configured embedding model with --embed.
+
+Usage (from repo root):
+    .venv/bin/python etc/benchmark_chunking.py [--fixture etc/fixtures/chunking_sample.json] [--k 2]
+        [--tokens 64,128,192,384] [--overlap 0,32] [--gap 0,30] [--embed]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import sys
+
+sys.path.insert(0, ".")
+from cfmb.chunking import chunk_messages
+from cfmb.compaction import content_words
+
+
+def lexical_ranker(chunks):
+    docs = [content_words(c.content) for c in chunks]
+    df = {}
+    for words in docs:
+        for w in words:
+            df[w] = df.get(w, 0) + 1
+
+    def rank(query):
+        terms = content_words(query)
+        scores = [
+            sum(math.log(1 + len(docs) / df[w]) for w in terms & words) / math.sqrt(len(words) or 1)
+            for words in docs
+        ]
+        return sorted(range(len(chunks)), key=lambda i: -scores[i])
+
+    return rank
+
+
+async def embedding_ranker(chunks, queries):
+    from cfmb.config import config
+    from cfmb.llm_client import LLMClient
+
+    llm = LLMClient(config.OLLAMA_MODEL)
+    vectors = await llm.get_embeddings([c.content for c in chunks], config.OLLAMA_EMBEDDING_MODEL)
+    query_vectors = dict(zip(queries, await llm.get_embeddings(queries, config.OLLAMA_EMBEDDING_MODEL)))
+
+    def cosine(a, b):
+        return sum(x * y for x, y in zip(a, b)) / (math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b)) or 1)
+
+    def rank(query):
+        q = query_vectors[query]
+        return sorted(range(len(chunks)), key=lambda i: -cosine(q, vectors[i]))
+
+    return rank
+
+
+async def evaluate(fixture, tokens, overlap, gap, k, embed):
+    channels = {}
+    for m in fixture["messages"]:
+        channels.setdefault(m["channel"], []).append({**m, "ts_ms": m["minute"] * 60_000})
+    chunks = [
+        c for messages in channels.values()
+        for c in chunk_messages(messages, max_tokens=tokens, overlap_tokens=overlap, gap_minutes=gap)
+    ]
+    queries = [q["query"] for q in fixture["queries"]]
+    rank = await embedding_ranker(chunks, queries) if embed else lexical_ranker(chunks)
+    hits = sum(
+        any(chunks[i].contains(q["message_id"]) for i in rank(q["query"])[:k])
+        for q in fixture["queries"]
+    )
+    return len(chunks), sum(c.tokens for c in chunks) / len(chunks), hits / len(fixture["queries"])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", default="etc/fixtures/chunking_sample.json")
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--tokens", default="64,128,192,384")
+    parser.add_argument("--overlap", default="0,32")
+    parser.add_argument("--gap", default="0,30", help="quiet minutes that end a chunk; 0 disables")
+    parser.add_argument("--embed", action="store_true", help="rank with OLLAMA_EMBEDDING_MODEL instead of word overlap")
+    args = parser.parse_args()
+
+    with open(args.fixture) as f:
+        fixture = json.load(f)
+    print(f"{len(fixture['messages'])} messages, {len(fixture['queries'])} queries, recall@{args.k} "
+          f"({'embeddings' if args.embed else 'lexical'})")
+    print(f"{'tokens':>7} {'overlap':>8} {'gap':>5} {'chunks':>7} {'avg tok':>8} {'recall':>7}")
+    grid = itertools.product(
+        (int(n) for n in args.tokens.split(",")),
+        [int(n) for n in args.overlap.split(",")],
+        [int(n) for n in args.gap.split(",")],
+    )
+    for tokens, overlap, gap in grid:
+        if overlap >= tokens:
+            continue
+        count, avg, recall = await evaluate(fixture, tokens, overlap, gap, args.k, args.embed)
+        print(f"{tokens:>7} {overlap:>8} {gap:>5} {count:>7} {avg:>8.1f} {recall:>7.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare the fast moderation engine with LLM-only moderation on a labelled fixture.
+
+For LLM-only, classifier-only and the combined engine (classifier first,
+LLM for uncertain messages), reports block precision and recall, how
+many messages went to the LLM, and mean and p95 latency per message.
+Uncertain messages count as allowed in the classifier-only row.  Then, for
+a range of allow margins, reports how many benign messages the classifier
+would allow on its own and how many block-labelled messages it would
+wrongly allow: pick the smallest margin that allows no block-labelled
+message as MODERATION_ALLOW_MARGIN.
+
+Usage (from repo root):
+    source ~/.cfmb && .venv/bin/python etc/benchmark_moderation.py [--fixture etc/fixtures/moderation_sample.json] [--margin 0.05] [--allow-margin 0.15] [--k 2]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+sys.path.insert(0, ".")
+from cfmb.config import config
+from cfmb.llm_client import LLMClient
+from cfmb.moderation import Moderator, is_block
+
+
+def report(name, labels, verdicts, seconds, escalated):
+    tp = sum(1 for l, v in zip(labels, verdicts) if l == v == "block")
+    fp = sum(1 for l, v in zip(labels, verdicts) if l == "allow" and v == "block")
+    fn = sum(1 for l, v in zip(labels, verdicts) if l == "block" and v != "block")
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    ordered = sorted(seconds)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name:<16} {precision:>9.2f} {recall:>7.2f} {escalated:>8} {sum(seconds) / len(seconds) * 1000:>9.0f} {p95 * 1000:>8.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", default="etc/fixtures/moderation_sample.json")
+    parser.add_argument("--margin", type=float, default=config.MODERATION_MARGIN)
+    parser.add_argument("--allow-margin", type=float, default=config.MODERATION_ALLOW_MARGIN)
+    parser.add_argument("--k", type=int, default=config.MODERATION_KNN)
+    args = parser.parse_args()
+
+    if not config.OLLAMA_EMBEDDING_MODEL:
+        print("OLLAMA_EMBEDDING_MODEL is not set — the classifier needs it.")
+        return
+    with open(args.fixture) as f:
+        fixture = json.load(f)["messages"]
+    texts = [m["text"] for m in fixture]
+    labels = [m["label"] for m in fixture]
+    llm = LLMClient(config.OLLAMA_MODEL)
+    print(f"{len(fixture)} messages ({labels.count('block')} block), margin {args.margin}, "
+          f"allow margin {args.allow_margin}, k {args.k}")
+    print(f"{'':<16} {'precision':>9} {'recall':>7} {'to LLM':>8} {'mean ms':>9} {'p95 ms':>8}")
+
+    verdicts, seconds = [], []
+    for text in texts:
+        t_start = time.monotonic()
+        verdicts.append("block" if is_block(await llm.moderate(text)) else "allow")
+        seconds.append(time.monotonic() - t_start)
+    report("LLM only", labels, verdicts, seconds, len(texts))
+
+    moderator = Moderator(llm, k=args.k, margin=args.margin, allow_margin=args.allow_margin, cache_size=0)
+    await moderator.classify(texts[0])  # embed the exemplars outside the timings
+    verdicts, seconds, scores, undecided = [], [], [], 0
+    for text in texts:
+        t_start = time.monotonic()
+        verdict, score = await moderator.classify(text)
+        seconds.append(time.monotonic() - t_start)
+        undecided += verdict is None
+        verdicts.append(verdict or "allow")
+        scores.append(score)
+    report("classifier only", labels, verdicts, seconds, 0)
+    print(f"{'':<16} ({undecided} uncertain)")
+
+    results = [await moderator.check(text) for text in texts]
+    report("engine", labels, [r["verdict"] for r in results], [r["seconds"] for r in results],
+           sum(r["source"] == "llm" for r in results))
+
+    print(f"\n{'allow margin':>12} {'benign allowed':>15} {'blocks allowed':>15}")
+    allow_total = labels.count("allow")
+    for step in range(0, 11):
+        margin = step * 0.05
+        allowed = [l for l, s in zip(labels, scores) if s is not None and s <= -margin]
+        print(f"{margin:>12.2f} {allowed.count('allow'):>9}/{allow_total:<5} {allowed.count('block'):>15}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
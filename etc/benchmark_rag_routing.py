@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare channel-routed RAG search against exhaustive search.
+
+Uses the embeddings of randomly sampled stored chunks as queries and reports,
+for each number of routed channels, the recall of the exhaustive top results
+and the mean query latency.
+
+Usage (from repo root):
+    source ~/.cfmb && .venv/bin/python etc/benchmark_rag_routing.py [--queries 50] [--limit 5] [--routes 1,2,4,8] [--weekly] [--hours 720]
+"""
+import argparse
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, ".")
+from cfmb.config import config
+from cfmb.db_manager import DatabaseManager
+
+
+def timed_search(db, server_id, embedding, args, route_channels):
+    t_start = time.perf_counter()
+    results = db.search_rag_chunks(
+        server_id, embedding, limit=args.limit, hours=args.hours,
+        route_channels=route_channels, route_weekly=args.weekly,
+    )
+    return {r["id"] for r in results}, time.perf_counter() - t_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--routes", default="1,2,4,8")
+    parser.add_argument("--weekly", action="store_true", help="route by channel-week centroids")
+    parser.add_argument("--hours", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    routes = [int(n) for n in args.routes.split(",")]
+
+    db = DatabaseManager(config.DB_NAME)
+    db.initialize_db()
+    with db._get_connection() as conn:
+        rows = conn.execute("SELECT server_id, embedding FROM rag_chunks").fetchall()
+    if not rows:
+        print("No rag_chunks found.")
+        return
+    sample = random.Random(args.seed).sample(rows, min(args.queries, len(rows)))
+    queries = [(server_id, list(struct.unpack(f"{len(blob) // 4}f", blob))) for server_id, blob in sample]
+    print(f"{len(rows)} chunks, {len(queries)} queries, top {args.limit}{' (weekly centroids)' if args.weekly else ''}")
+
+    exhaustive = []
+    total = 0.0
+    for server_id, embedding in queries:
+        ids, elapsed = timed_search(db, server_id, embedding, args, 0)
+        exhaustive.append(ids)
+        total += elapsed
+    base_ms = total / len(queries) * 1000
+    print(f"{'channels':>10} {'recall':>8} {'ms/query':>10} {'speedup':>8}")
+    print(f"{'all':>10} {1:>8.3f} {base_ms:>10.2f} {1:>7.1f}x")
+
+    for n in routes:
+        hits = wanted = 0
+        total = 0.0
+        for (server_id, embedding), expected in zip(queries, exhaustive):
+            ids, elapsed = timed_search(db, server_id, embedding, args, n)
+            hits += len(ids & expected)
+            wanted += len(expected)
+            total += elapsed
+        ms = total / len(queries) * 1000
+        print(f"{n:>10} {hits / max(wanted, 1):>8.3f} {ms:>10.2f} {base_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import tempfile
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from cfmb.context_budget import ContextBudget
+from cfmb.db_manager import DatabaseManager
+
+
+@pytest.fixture
+def db_manager():
+    """Fixture to create a DatabaseManager instance with a temporary database file."""
+    with tempfile.NamedTemporaryFile(delete=False) as temp_db_file:
+        db_name = temp_db_file.name
+        manager = DatabaseManager(db_name)
+        manager.initialize_db()
+        yield manager
+    os.remove(db_name)
+
+
+@pytest.fixture
+def mock_llm_client():
+    """An LLM client stand-in with a model name and an 8k context budget; modules override it to script completions."""
+    mock = MagicMock()
+    mock.model_name = "test_model"
+    mock.budget = ContextBudget(num_ctx=8192)
+    mock.get_completion = AsyncMock()
+    return mock
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import socket
+from unittest.mock import patch
+
+import pytest
+from aiohttp import web
+
+import cfmb.backends as backends
+from cfmb.backends import Backend, BackendPool, NoBackendError
+
+
+class StandIn:
+    """A local HTTP server answering the Ollama endpoints the pool uses."""
+
+    def __init__(self, name, delay=0.0, status=200):
+        self.name = name
+        self.delay = delay
+        self.status = status
+        self.hits = 0
+        self.runner = None
+        self.url = None
+
+    async def _chat(self, request):
+        self.hits += 1
+        body = await request.json()
+        await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return web.json_response({"error": "boom"}, status=self.status)
+        message = {"role": "assistant", "content": self.name}
+        if not body.get("stream", True):
+            return web.json_response({"model": body["model"], "message": message, "done": True})
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for word in ("from ", self.name):
+            await response.write((json.dumps({"model": body["model"], "message": {**message, "content": word}, "done": False}) + "\n").encode())
+        await response.write((json.dumps({"model": body["model"], "message": {**message, "content": ""}, "done": True}) + "\n").encode())
+        return response
+
+    async def _embed(self, request):
+        self.hits += 1
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return web.json_response({"model": body["model"], "embeddings": [[1.0, float(len(t))] for t in texts]})
+
+    async def _ps(self, request):
+        return web.json_response({"models": [{"model": "chat:latest", "name": "chat:latest"}]})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/api/chat", self._chat)
+        app.router.add_post("/api/embed", self._embed)
+        app.router.add_get("/api/ps", self._ps)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def _dead_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+@pytest.fixture(autouse=True)
+def circuit_settings():
+    with patch.object(backends.config, "OLLAMA_FAILURE_THRESHOLD", 2), \
+         patch.object(backends.config, "OLLAMA_COOLDOWN_SECONDS", 60.0), \
+         patch.object(backends.config, "OLLAMA_HEALTH_TIMEOUT_SECONDS", 2.0):
+        yield
+
+
+def _chat(model="chat"):
+    return lambda backend: backend.client.chat(model=model, messages=[{"role": "user", "content": "hi"}])
+
+
+def test_from_config_parses_model_tags():
+    pool = BackendPool.from_config("http://a:1=qwen3:32b|qwen3:4b, http://b:2=embed ,http://c:3")
+    assert [b.url for b in pool.backends] == ["http://a:1", "http://b:2", "http://c:3"]
+    assert pool.backends[0].models == {"qwen3:32b", "qwen3:4b"}
+    assert [b.url for b in pool.candidates("embed")] == ["http://b:2", "http://c:3"]
+    assert [b.url for b in pool.candidates("embed:latest")] == ["http://b:2", "http://c:3"]
+    assert len(BackendPool.from_config("").backends) == 1
+    with pytest.raises(NoBackendError):
+        BackendPool([Backend("http://a:1", ["embed"])]).candidates("chat")
+
+
+@pytest.mark.asyncio
+async def test_routes_by_model_tag():
+    chat, embed = await StandIn("chat").start(), await StandIn("embed").start()
+    try:
+        pool = BackendPool([Backend(chat.url, ["chat"]), Backend(embed.url, ["embed"])])
+        response = await pool.call("chat", _chat())
+        assert response["message"]["content"] == "chat"
+        vectors = await pool.call("embed", lambda b: b.client.embed(model="embed", input=["a", "bb"]))
+        assert vectors["embeddings"] == [[1.0, 1.0], [1.0, 2.0]]
+        assert (chat.hits, embed.hits) == (1, 1)
+    finally:
+        await chat.stop()
+        await embed.stop()
+
+
+@pytest.mark.asyncio
+async def test_least_outstanding_spreads_concurrent_calls():
+    a, b = await StandIn("a", delay=0.1).start(), await StandIn("b", delay=0.1).start()
+    try:
+        pool = BackendPool([Backend(a.url), Backend(b.url)])
+        await asyncio.gather(*(pool.call("chat", _chat()) for _ in range(6)))
+        assert (a.hits, b.hits) == (3, 3)
+        assert all(backend.outstanding == 0 for backend in pool.backends)
+    finally:
+        await a.stop()
+        await b.stop()
+
+
+@pytest.mark.asyncio
+async def test_fails_over_and_opens_circuit():
+    good = await StandIn("good").start()
+    try:
+        dead = Backend(_dead_url())
+        pool = BackendPool([dead, Backend(good.url)])
+        for _ in range(2):
+            dead.outstanding = -1  # make the dead backend look idle so it is tried first
+            assert (await pool.call("chat", _chat()))["message"]["content"] == "good"
+            dead.outstanding = 0
+        assert not dead.available()
+        assert pool.candidates("chat")[-1] is dead
+        assert good.hits == 2
+    finally:
+        await good.stop()
+
+
+@pytest.mark.asyncio
+async def test_server_errors_fail_over_but_client_errors_do_not():
+    broken, bad_request, good = (await StandIn("broken", status=500).start(), await StandIn("bad", status=400).start(),
+                                 await StandIn("good").start())
+    try:
+        pool = BackendPool([Backend(broken.url), Backend(good.url)])
+        assert (await pool.call("chat", _chat()))["message"]["content"] == "good"
+        assert pool.backends[0].failures == 1
+
+        pool = BackendPool([Backend(bad_request.url), Backend(good.url)])
+        with pytest.raises(backends.ollama.ResponseError):
+            await pool.call("chat", _chat())
+        assert good.hits == 1
+    finally:
+        for server in (broken, bad_request, good):
+            await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_fails_over_before_first_chunk():
+    good = await StandIn("good").start()
+    try:
+        pool = BackendPool([Backend(_dead_url()), Backend(good.url)])
+        pool.backends[1].outstanding = 1  # the dead backend is tried first
+        chunks = [c async for c in pool.chat_stream(model="chat", messages=[{"role": "user", "content": "hi"}], stream=True)]
+        assert "".join(c["message"]["content"] for c in chunks) == "from good"
+        assert pool.backends[1].outstanding == 1
+    finally:
+        await good.stop()
+
+
+@pytest.mark.asyncio
+async def test_health_check_closes_circuit():
+    good = await StandIn("good").start()
+    try:
+        backend = Backend(good.url)
+        pool = BackendPool([backend, Backend(_dead_url())])
+        backend.failures, backend.open_until = 5, float("inf")
+        assert await pool.check(backend)
+        assert backend.available() and backend.loaded == ["chat:latest"]
+        assert not await pool.check(pool.backends[1])
+        assert pool.backends[1].failures == 1
+    finally:
+        await good.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_calls_release_their_slot():
+    """A call cut short by a timeout must not leave the backend looking busy."""
+    slow = await StandIn("slow", delay=1.0).start()
+    try:
+        pool = BackendPool([Backend(slow.url)])
+        for _ in range(3):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(pool.call("chat", _chat()), timeout=0.05)
+        assert pool.backends[0].outstanding == 0
+        assert pool.backends[0].failures == 0
+    finally:
+        await slow.stop()
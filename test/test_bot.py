@@ -1,10 +1,12 @@
 import asyncio
+import gc
+import time
 from contextlib import asynccontextmanager
 from unittest.mock import AsyncMock, MagicMock, patch, call, ANY
 import pytest
 
 import cfmb.bot as bot  # Import the module containing your bot's code
-from cfmb.config import Config
+from cfmb.config import Config, config as settings
 
 
 @pytest.fixture
@@ -226,3 +228,167 @@ def test_resolve_chain_id_reference_not_found(mock_discord_message, mock_db_mana
     assert bot.resolve_chain_id(mock_discord_message) == "999"
 
 
+
+
+@pytest.mark.asyncio
+async def test_process_llm_request_prepares_alongside_moderation(mock_discord_message, mock_db_manager):
+    """Moderation and preparation overlap; the stored history gets the new message appended."""
+    events = []
+
+    async def slow_check(text):
+        events.append("check started")
+        await asyncio.sleep(0.05)
+        events.append("check done")
+        return {"verdict": "allow"}
+
+    def slow_fetch(url):
+        events.append("fetch started")
+        time.sleep(0.05)
+        events.append("fetch done")
+        return "page text"
+
+    mock_discord_message.content = "look at https://example.com"
+    mock_discord_message.channel.name = "general"
+    mock_db_manager.get_previous_message_timestamp.return_value = None
+    mock_db_manager.get_latest_user_profile.return_value = None
+    stream = AsyncMock(return_value=(None, "reply", []))
+    with patch.object(bot, "config", settings), \
+         patch.object(bot, "db_manager", mock_db_manager), \
+         patch.object(bot, "moderator", MagicMock(check=slow_check)), \
+         patch.object(bot, "user_directory", MagicMock(names=MagicMock(return_value={}))), \
+         patch.object(bot, "get_webpage_text", slow_fetch), \
+         patch.object(bot, "router", MagicMock()), \
+         patch.object(bot, "_stream_llm", stream):
+        await bot.process_llm_request(mock_discord_message, "12345", "chain", skip_moderation=False)
+
+    # Each started before the other finished, so they ran at the same time
+    assert events.index("fetch started") < events.index("check done")
+    assert events.index("check started") < events.index("fetch done")
+    context = stream.await_args.args[1]
+    assert [m["role"] for m in context] == ["system", "user", "assistant", "system", "user", "tool"]
+    assert context[3]["content"].startswith("## Metadata")
+    assert context[4]["content"] == "look at https://example.com"
+    assert context[5]["content"] == "page text"
+    mock_db_manager.get_recent_messages.assert_called_once_with("12345", "chain", settings.NUM_CLOSEST_MESSAGES - 1)
+
+
+@pytest.mark.asyncio
+async def test_process_llm_request_blocked_skips_llm(mock_discord_message, mock_db_manager):
+    mock_discord_message.content = "bad"
+    stream = AsyncMock()
+    with patch.object(bot, "config", settings), \
+         patch.object(bot, "db_manager", mock_db_manager), \
+         patch.object(bot, "moderator", MagicMock(check=AsyncMock(return_value={"verdict": "block"}))), \
+         patch.object(bot, "user_directory", MagicMock(names=MagicMock(return_value={}))), \
+         patch.object(bot, "_stream_llm", stream):
+        await bot.process_llm_request(mock_discord_message, "12345", "chain", skip_moderation=False)
+    stream.assert_not_awaited()
+    mock_db_manager.write_message.assert_not_called()
+    mock_discord_message.add_reaction.assert_awaited_once_with("⚠️")
+
+
+@pytest.mark.asyncio
+async def test_process_llm_request_timeout_is_recorded(mock_discord_message, mock_db_manager):
+    """A request that times out still counts towards its route's stats."""
+    async def time_out(*args, **kwargs):
+        raise TimeoutError
+
+    mock_discord_message.content = "hello"
+    mock_discord_message.channel.name = "general"
+    mock_db_manager.get_previous_message_timestamp.return_value = None
+    mock_db_manager.get_latest_user_profile.return_value = None
+    router = MagicMock()
+    with patch.object(bot, "config", settings), \
+         patch.object(bot, "db_manager", mock_db_manager), \
+         patch.object(bot, "user_directory", MagicMock(names=MagicMock(return_value={}))), \
+         patch.object(bot, "router", router), \
+         patch.object(bot, "_stream_llm", time_out):
+        await bot.process_llm_request(mock_discord_message, "12345", "chain")
+    router.record.assert_called_once_with(router.route.return_value, ANY, timed_out=True)
+    mock_discord_message.reply.assert_awaited_with(settings.LLM_TIMEOUT_MESSAGE)
+
+
+@pytest.mark.asyncio
+async def test_process_llm_request_block_retrieves_failed_preparation(mock_discord_message, mock_db_manager):
+    """A preparation step that failed before the block verdict is not reported as an unhandled error."""
+    async def late_block(text):
+        await asyncio.sleep(0.05)
+        return {"verdict": "block"}
+
+    def broken_fetch(url):
+        raise RuntimeError("fetch failed")
+
+    unhandled = []
+    loop = asyncio.get_running_loop()
+    loop.set_exception_handler(lambda loop, context: unhandled.append(context))
+    mock_discord_message.content = "look at https://example.com"
+    try:
+        with patch.object(bot, "config", settings), \
+             patch.object(bot, "db_manager", mock_db_manager), \
+             patch.object(bot, "moderator", MagicMock(check=late_block)), \
+             patch.object(bot, "user_directory", MagicMock(names=MagicMock(return_value={}))), \
+             patch.object(bot, "get_webpage_text", broken_fetch), \
+             patch.object(bot, "_stream_llm", AsyncMock()):
+            await bot.process_llm_request(mock_discord_message, "12345", "chain", skip_moderation=False)
+        gc.collect()
+        await asyncio.sleep(0)
+    finally:
+        loop.set_exception_handler(None)
+    assert unhandled == []
+    mock_discord_message.add_reaction.assert_awaited_once_with("⚠️")
+
+
+@pytest.mark.asyncio
+async def test_process_llm_request_failed_moderation_cancels_preparation(mock_discord_message, mock_db_manager):
+    fetch_started = asyncio.Event()
+
+    async def broken_check(text):
+        await fetch_started.wait()
+        raise RuntimeError("moderation failed")
+
+    async def slow_prompt(*args):
+        fetch_started.set()
+        await asyncio.sleep(10)
+
+    unhandled = []
+    loop = asyncio.get_running_loop()
+    loop.set_exception_handler(lambda loop, context: unhandled.append(context))
+    mock_discord_message.content = "hello"
+    try:
+        with patch.object(bot, "config", settings), \
+             patch.object(bot, "db_manager", mock_db_manager), \
+             patch.object(bot, "moderator", MagicMock(check=broken_check)), \
+             patch.object(bot, "user_directory", MagicMock(names=MagicMock(return_value={}))), \
+             patch.object(bot, "_build_system_prompt", slow_prompt):
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(bot.process_llm_request(mock_discord_message, "12345", "chain", skip_moderation=False), 1)
+        gc.collect()
+        await asyncio.sleep(0)
+    finally:
+        loop.set_exception_handler(None)
+    assert unhandled == []
+    assert not [t for t in asyncio.all_tasks() if t.get_coro().__name__ == "_timed"]
+
+
+@pytest.mark.asyncio
+async def test_build_system_prompt_keeps_volatile_metadata_out_of_prefix(mock_discord_message, mock_db_manager):
+    """The system prompt is identical across requests; the rounded time goes in the metadata message."""
+    from datetime import datetime as real_datetime
+
+    mock_discord_message.channel.name = "general"
+    mock_db_manager.get_previous_message_timestamp.return_value = None
+    mock_db_manager.get_latest_user_profile.return_value = None
+    prompts = []
+    with patch.object(bot, "config", settings), patch.object(bot.config, "PROMPT_TIME_GRANULARITY_MINUTES", 15), \
+         patch.object(bot, "db_manager", mock_db_manager):
+        for minute, second in ((31, 5), (44, 59)):
+            mock_db_manager.get_system_prompt.return_value = {"role": "system", "content": "System prompt"}
+            fixed = real_datetime(2026, 1, 2, 9, minute, second, tzinfo=bot.ZoneInfo("America/New_York"))
+            with patch.object(bot, "datetime", MagicMock(now=MagicMock(return_value=fixed), fromisoformat=real_datetime.fromisoformat)):
+                prompts.append(await bot._build_system_prompt(mock_discord_message, "12345", "hi"))
+
+    (first, first_meta), (second, second_meta) = prompts
+    assert first == second
+    assert "Current time" not in first["content"] and "#general" in first["content"]
+    assert first_meta == second_meta
+    assert "- Current time: 2026-01-02T09:30" in first_meta["content"]
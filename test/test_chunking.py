@@ -0,0 +1,57 @@
+from cfmb.chunking import ChannelChunker, chunk_messages, split_text
+from cfmb.context_budget import estimate_tokens
+
+MINUTE = 60_000
+
+
+def _msg(i, text, minute=0, reply_to=None):
+    return {"id": i, "message_id": f"m{i}", "username": "alice", "content": text, "ts_ms": minute * MINUTE, "reply_to": reply_to}
+
+
+def test_split_text_keeps_every_word():
+    text = " ".join(f"word{i}" for i in range(200))
+    pieces = split_text(text, 40)
+    assert len(pieces) > 1
+    assert all(estimate_tokens(p) <= 40 for p in pieces)
+    assert " ".join(pieces) == text
+    assert split_text("x" * 500, 40)[0] == "x" * 156
+
+
+def test_full_chunks_overlap_with_the_next():
+    messages = [_msg(i, f"message number {i} about the laser cutter") for i in range(10)]
+    chunks = chunk_messages(messages, max_tokens=40, overlap_tokens=12, gap_minutes=0)
+    assert len(chunks) > 1
+    assert all(c.tokens <= 40 for c in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.lines[0] == previous.lines[-1]
+    assert sum(c.messages for c in chunks) == 10
+
+
+def test_quiet_gap_starts_a_chunk_unless_replying_into_it():
+    messages = [
+        _msg(1, "anyone around?", minute=0),
+        _msg(2, "yes, what's up", minute=1),
+        _msg(3, "sorry, was away: the cnc is jammed", minute=90, reply_to="m2"),
+        _msg(4, "new topic entirely", minute=200),
+    ]
+    chunks = chunk_messages(messages, max_tokens=100, overlap_tokens=0, gap_minutes=30)
+    assert [c.line_ids for c in chunks] == [["m1", "m2", "m3"], ["m4"]]
+
+
+def test_reply_outside_the_chunk_quotes_its_parent():
+    chunker = ChannelChunker(max_tokens=100, overlap_tokens=0, gap_minutes=30)
+    chunker.add("m1", "bob", "the laser needs a new lens", ts_ms=0)
+    chunker.add("m2", "carol", "open house tonight", ts_ms=120 * MINUTE)
+    touched = chunker.add("m3", "alice", "ordered one", ts_ms=121 * MINUTE, reply_to="m1")
+    assert [new for _, new in touched] == [False]
+    assert touched[0][0].lines == ["carol: open house tonight", "> bob: the laser needs a new lens", "alice: ordered one"]
+
+
+def test_growing_and_splitting_reports_every_touched_chunk():
+    chunker = ChannelChunker(max_tokens=30, overlap_tokens=0, gap_minutes=0)
+    first = chunker.add("m1", "alice", "short", ts_ms=0)
+    assert [new for _, new in first] == [True]
+    assert chunker.add("m2", "alice", "grows", ts_ms=0) == [(first[0][0], False)]
+    touched = chunker.add("m3", "alice", "word " * 40, ts_ms=0)
+    assert len(touched) > 1 and all(new for _, new in touched)
+    assert " ".join(" ".join(c.lines) for c, _ in touched) == "alice: " + ("word " * 40).strip()
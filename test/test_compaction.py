@@ -0,0 +1,36 @@
+from cfmb.compaction import compact_lines, content_words
+from cfmb.context_budget import estimate_tokens
+
+
+def test_content_words_ignores_tags_links_and_stopwords():
+    assert content_words("[shop] lol check https://example.com/laser") == frozenset({"check"})
+    assert content_words("The 3d printer needs a new nozzle") == frozenset({"printer", "needs", "new", "nozzle"})
+
+
+def test_compact_lines_drops_low_content_and_duplicates():
+    lines = [
+        "[shop] lol",
+        "[shop] https://example.com",
+        "[shop] the laser cutter needs new mirrors",
+        "[shop] The laser cutter needs new mirrors!",
+        "[shop] laser cutter needs new mirrors soon",
+        "[general] I am building a synth from a kit",
+    ]
+    assert compact_lines(lines, 1000, estimate_tokens) == [
+        "[shop] laser cutter needs new mirrors soon",
+        "[general] I am building a synth from a kit",
+    ]
+
+
+def test_compact_lines_fits_budget_and_keeps_order():
+    lines = [f"[shop] project {i} uses widget{i} and gadget{i} parts" for i in range(200)]
+    compacted = compact_lines(lines, 100, estimate_tokens)
+    assert sum(map(estimate_tokens, compacted)) <= 100
+    assert compacted
+    assert compacted == [line for line in lines if line in compacted]
+
+
+def test_compact_lines_falls_back_to_recent_lines():
+    lines = ["lol", "ok", "haha"]
+    assert compact_lines(lines, 1000, estimate_tokens) == lines
+    assert compact_lines(lines, estimate_tokens("haha"), estimate_tokens) == ["haha"]
@@ -0,0 +1,66 @@
+import pytest
+
+from cfmb.context_budget import ContextBudget, estimate_tokens, trim_text, TRIM_MARKER
+
+
+def test_estimate_tokens():
+    """Token estimate scales with length and is zero for empty text."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 400) == 101
+
+
+def test_trim_text_policies():
+    """Each trim policy keeps the expected part of the text."""
+    text = "\n".join(f"line {i}" for i in range(100))
+    head = trim_text(text, 100, "head")
+    tail = trim_text(text, 100, "tail")
+    middle = trim_text(text, 100, "middle")
+
+    assert len(head) <= 100 and head.startswith("line 0") and head.endswith(TRIM_MARKER)
+    assert len(tail) <= 100 and tail.endswith("line 99") and tail.startswith(TRIM_MARKER)
+    assert middle.startswith("line 0") and middle.endswith("line 99")
+    assert trim_text("short", 100, "head") == "short"
+    with pytest.raises(ValueError):
+        trim_text(text, 100, "sideways")
+
+
+def test_allocate_redistributes_surplus():
+    """Sections under their share keep what they need; the rest goes to oversubscribed ones."""
+    budget = ContextBudget(num_ctx=1100, reserve_tokens=100)
+    alloc = budget.allocate({"system": 50, "history": 5000, "web": 5000})
+
+    assert alloc["system"] == 50
+    assert sum(alloc.values()) <= 1000
+    assert alloc["history"] > alloc["web"]
+
+
+def test_allocate_under_budget_is_untouched():
+    budget = ContextBudget(num_ctx=8192)
+    needs = {"system": 100, "history": 200}
+    assert budget.allocate(needs) == needs
+
+
+def test_fit_drops_oldest_history_first():
+    """History keeps the newest messages whole and strips the section key."""
+    budget = ContextBudget(num_ctx=400, reserve_tokens=0, shares={"system": 0.5, "history": 0.5})
+    messages = [{"role": "system", "content": "Be brief."}]
+    messages += [{"role": "user", "content": f"message {i} " + "x" * 200} for i in range(10)]
+    messages.append({"role": "tool", "content": "web text", "section": "history"})
+
+    fitted, report = budget.fit(messages)
+
+    assert fitted[0]["content"] == "Be brief."
+    assert fitted[-1] == {"role": "tool", "content": "web text"}
+    assert "message 9" in fitted[-2]["content"]
+    assert not any("message 0" in m["content"] for m in fitted)
+    used, needed = report["history"]
+    assert used < needed
+
+
+def test_calibrate_ignores_cached_prompts():
+    """A prompt mostly served from the cache does not skew the chars-per-token estimate."""
+    budget = ContextBudget(num_ctx=8192)
+    budget.calibrate("m", chars=40000, prompt_eval_count=100)
+    assert budget.ratio("m") == 4.0
+    budget.calibrate("m", chars=30000, prompt_eval_count=10000)
+    assert budget.ratio("m") < 4.0
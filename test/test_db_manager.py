@@ -1,20 +1,4 @@
-import os
-import tempfile
-
-import pytest
-
-from cfmb.db_manager import DatabaseManager
-
-
-@pytest.fixture
-def db_manager():
-    """Fixture to create a DatabaseManager instance with a temporary database file."""
-    with tempfile.NamedTemporaryFile(delete=False) as temp_db_file:
-        db_name = temp_db_file.name
-        manager = DatabaseManager(db_name)
-        manager.initialize_db()
-        yield manager
-    os.remove(db_name)
+from cfmb.db_manager import iter_channels
 
 
 def test_initialize_db(db_manager):
@@ -164,3 +148,229 @@ def test_get_recent_chains(db_manager):
     assert "chain_3" in chains
     assert "chain_2" in chains
     assert "chain_1" not in chains
+
+
+def test_write_and_get_latest_newsletter(db_manager):
+    """Test storing a newsletter and reading back the newest one with its age."""
+    assert db_manager.get_latest_newsletter("server") is None
+    db_manager.write_newsletter("server", 5, [("1", "shop", "old")], "old curated", "old joke")
+    db_manager.write_newsletter("server", 9, [("1", "shop", "new")], "new curated", None)
+
+    latest = db_manager.get_latest_newsletter("server")
+    assert latest["last_message_id"] == 9
+    assert latest["summaries"] == [("1", "shop", "new")]
+    assert latest["curated"] == "new curated"
+    assert latest["joke"] is None
+    assert latest["age_minutes"] < 1
+
+
+def test_get_raw_messages_24h_includes_row_id(db_manager):
+    """Row ids let the newsletter top-up find messages newer than a cached build."""
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hello", channel_id="1", channel_name="shop")
+    db_manager.write_raw_message("server", "m2", "u1", "alice", "again", channel_id="1", channel_name="shop")
+
+    rows = db_manager.get_raw_messages_24h("server")
+    assert [r["id"] for r in rows] == [1, 2]
+
+
+def test_get_profile_activity_7d_counts_new_messages(db_manager):
+    """Messages before a user's latest profile count toward total but not new."""
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "old message")
+    db_manager.write_raw_message("server", "m2", "u2", "bob", "hi")
+    db_manager.write_raw_message("server", "m3", "u2", "bob", "/profile")
+    with db_manager._get_connection() as conn:
+        conn.execute("UPDATE raw_messages SET timestamp = datetime('now', '-1 day') WHERE message_id = 'm1'")
+    db_manager.write_user_profile("server", "u1", "alice", "likes lasers")
+    db_manager.write_raw_message("server", "m4", "u1", "alice2", "new message")
+
+    activity = {u["user_id"]: u for u in db_manager.get_profile_activity_7d("server")}
+    assert activity["u1"] == {"user_id": "u1", "username": "alice2", "total": 2, "new": 1}
+    assert activity["u2"] == {"user_id": "u2", "username": "bob", "total": 1, "new": 1}
+
+
+def test_get_raw_messages_by_users_7d(db_manager):
+    """Transcripts for several users come back grouped, in order, capped per user."""
+    for i in range(3):
+        db_manager.write_raw_message("server", f"a{i}", "u1", "alice", f"a{i}", channel_name="shop")
+        db_manager.write_raw_message("server", f"b{i}", "u2", "bob", f"b{i}", channel_name="shop")
+    db_manager.write_raw_message("server", "c0", "u3", "carol", "c0")
+
+    by_user = db_manager.get_raw_messages_by_users_7d("server", ["u1", "u2"], limit=2)
+    assert set(by_user) == {"u1", "u2"}
+    assert [m["content"] for m in by_user["u1"]] == ["a0", "a1"]
+    assert by_user["u2"][0] == {"username": "bob", "content": "b0", "channel_name": "shop"}
+    assert db_manager.get_raw_messages_by_users_7d("server", []) == {}
+
+
+def test_search_rag_chunks_top1_matches_single_searches(db_manager):
+    """The batched top-1 search returns the same chunk and distance as one search per vector."""
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "laser", [1.0, 0.0, 0.0])
+    db_manager.write_rag_chunk("server", "m2", "2", "events", "open house", [0.0, 1.0, 0.0])
+    db_manager.write_rag_chunk("other", "m3", "3", "other", "elsewhere", [0.0, 0.0, 1.0])
+    queries = [[0.9, 0.1, 0.0], [0.1, 0.8, 0.3], [0.0, 0.1, 1.0]]
+
+    batched = db_manager.search_rag_chunks_top1("server", queries, hours=24)
+    assert batched == [db_manager.search_rag_chunks("server", q, limit=1, hours=24)[0] for q in queries]
+    assert [r["message_id"] for r in batched] == ["m1", "m2", "m2"]
+    assert db_manager.search_rag_chunks_top1("server", []) == []
+    assert db_manager.search_rag_chunks_top1("nobody", queries) == [None, None, None]
+
+
+def test_rag_centroids_follow_chunk_writes(db_manager):
+    """Centroids hold the per-channel sum of chunk embeddings, all-time and per week."""
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "a", [1.0, 0.0])
+    db_manager.write_rag_chunk("server", "m2", "1", "shop", "b", [0.0, 1.0])
+    chunk = db_manager.get_latest_rag_chunk("1")
+    db_manager.update_rag_chunk(chunk["id"], "b c", [0.0, 3.0])
+
+    with db_manager._get_connection() as conn:
+        rows = conn.execute(
+            "SELECT week, chunk_count, vec_to_json(embedding) FROM rag_centroids WHERE channel_id = '1' ORDER BY week"
+        ).fetchall()
+    assert [(r[0] == "", r[1], r[2]) for r in rows] == [
+        (True, 2, "[1.000000,3.000000]"),
+        (False, 2, "[1.000000,3.000000]"),
+    ]
+
+
+def test_search_rag_chunks_routed_to_closest_channels(db_manager):
+    """Routed search only scores chunks in the channels whose centroids are closest."""
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "laser", [1.0, 0.0])
+    db_manager.write_rag_chunk("server", "m2", "1", "shop", "cnc", [0.9, 0.1])
+    db_manager.write_rag_chunk("server", "m3", "2", "events", "party", [0.0, 1.0])
+    db_manager.write_rag_chunk("server", "m4", "2", "events", "laser party", [0.8, 0.2])
+
+    query = [1.0, 0.0]
+    exhaustive = db_manager.search_rag_chunks("server", query, limit=3)
+    assert [r["message_id"] for r in exhaustive] == ["m1", "m2", "m4"]
+    routed = db_manager.search_rag_chunks("server", query, limit=3, route_channels=1)
+    assert [r["message_id"] for r in routed] == ["m1", "m2"]
+    weekly = db_manager.search_rag_chunks("server", query, limit=3, hours=24, route_channels=2, route_weekly=True)
+    assert [r["message_id"] for r in weekly] == ["m1", "m2", "m4"]
+    assert db_manager.search_rag_chunks("server", query, route_channels=1, exclude_channels={"1"})[0]["message_id"] == "m4"
+
+
+def test_epoch_ms_columns_follow_text_timestamps(db_manager):
+    """ts_ms is filled on insert and kept in step when the text timestamp changes."""
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hello", channel_id="1", channel_name="shop")
+    with db_manager._get_connection() as conn:
+        conn.execute("UPDATE raw_messages SET timestamp = '2024-01-02 03:04:05'")
+        conn.execute("INSERT INTO summaries (timestamp, content) VALUES ('2024-01-02T00:00:00+00:00', 'x')")
+        raw_ms = conn.execute("SELECT ts_ms FROM raw_messages").fetchone()[0]
+        summary_ms = conn.execute("SELECT ts_ms FROM summaries").fetchone()[0]
+    assert raw_ms == 1704164645000
+    assert summary_ms == 1704153600000
+
+
+def test_epoch_ms_migration_backfills_existing_rows(db_manager):
+    """Databases created before the epoch columns get them added, backfilled and normalized."""
+    with db_manager._get_connection() as conn:
+        conn.executescript(
+            """
+            DROP TABLE summaries;
+            CREATE TABLE summaries (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, content TEXT);
+            INSERT INTO summaries (timestamp, content) VALUES ('2024-01-02T05:00:00+00:00', 'old');
+            """
+        )
+    db_manager.initialize_db()
+    with db_manager._get_connection() as conn:
+        row = conn.execute("SELECT timestamp, ts_ms FROM summaries").fetchone()
+    assert tuple(row) == ("2024-01-02 05:00:00", 1704171600000)
+
+
+def test_get_raw_messages_date_range_accepts_iso_timestamps(db_manager):
+    """Window bounds in either ISO or SQLite format select the same rows."""
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "in range", channel_id="1", channel_name="shop")
+    db_manager.write_raw_message("server", "m2", "u1", "alice", "too late", channel_id="1", channel_name="shop")
+    with db_manager._get_connection() as conn:
+        conn.execute("UPDATE raw_messages SET timestamp = '2024-01-01 12:00:00' WHERE message_id = 'm1'")
+        conn.execute("UPDATE raw_messages SET timestamp = '2024-01-02 00:00:00' WHERE message_id = 'm2'")
+
+    iso = db_manager.get_raw_messages_date_range("server", "2024-01-01T00:00:00+00:00", "2024-01-02T00:00:00+00:00")
+    sqlite_format = db_manager.get_raw_messages_date_range("server", "2024-01-01 00:00:00", "2024-01-02 00:00:00")
+    assert [m["content"] for m in iso] == [m["content"] for m in sqlite_format] == ["in range"]
+
+
+def test_activity_hourly_follows_ingest_and_timestamp_updates(db_manager):
+    """Each message bumps its server/hour/channel/user bucket; moving a message moves its count."""
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hello", channel_id="1", channel_name="shop")
+    db_manager.write_raw_message("server", "m2", "u1", "alice", "again", channel_id="1", channel_name="shop")
+    db_manager.write_raw_message("server", "m3", "u1", "alice", "/stats", channel_id="1", channel_name="shop")
+    with db_manager._get_connection() as conn:
+        conn.execute("UPDATE raw_messages SET timestamp = '2024-01-02 03:04:05' WHERE message_id = 'm1'")
+        rows = conn.execute("SELECT hour_ms, message_count FROM activity_hourly ORDER BY hour_ms").fetchall()
+    assert [tuple(r) for r in rows][0] == (1704164400000, 1)
+    assert [r[1] for r in rows[1:]] == [1]
+    assert db_manager.get_user_message_count("server", "u1") == 1
+
+
+def test_activity_hourly_backfilled_from_existing_messages(db_manager):
+    """A database created before the rollup gets it rebuilt from raw_messages."""
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hello", channel_id="1", channel_name="shop")
+    db_manager.write_raw_message("server", "m2", "u2", "bob", "hi", channel_id="2", channel_name="events")
+    with db_manager._get_connection() as conn:
+        conn.execute("DROP TABLE activity_hourly")
+    db_manager.initialize_db()
+
+    stats = db_manager.get_activity_stats("server", 24)
+    assert stats["messages"] == 2
+    assert stats["users"] == 2
+    assert sorted(stats["channels"]) == [("events", 1), ("shop", 1)]
+    assert sorted(stats["top_users"]) == [("alice", 1), ("bob", 1)]
+
+
+def test_get_previous_message_timestamp(db_manager):
+    """The previous message is the user's last one before the message being handled, not after it."""
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hello")
+    assert db_manager.get_previous_message_timestamp("server", "u1", "m1") is None
+    with db_manager._get_connection() as conn:
+        conn.execute("UPDATE raw_messages SET timestamp = datetime('now', '-1 hour'), ts_ms = ts_ms - 3600000")
+        expected = conn.execute("SELECT timestamp FROM raw_messages").fetchone()[0]
+    db_manager.write_raw_message("server", "m2", "u1", "alice", "again")
+    assert db_manager.get_previous_message_timestamp("server", "u1", "m2") == expected
+    assert db_manager.get_previous_message_timestamp("server", "u2", "m2") is None
+
+    # The user posts again before m2 is handled
+    db_manager.write_raw_message("server", "m3", "u1", "alice", "and again")
+    assert db_manager.get_previous_message_timestamp("server", "u1", "m2") == expected
+
+
+def test_iter_raw_messages_streams_records_in_batches(db_manager):
+    """The streaming read yields slotted records in channel order, fetching a batch at a time."""
+    for i in range(5):
+        db_manager.write_raw_message("server", f"m{i}", "u1", "alice", f"msg {i}", channel_id=str(2 - i % 2), channel_name="shop")
+    db_manager.write_raw_message("server", "c", "u1", "alice", "/stats", channel_id="1", channel_name="shop")
+
+    stream = db_manager.iter_raw_messages_24h("server", batch_size=2)
+    first = next(stream)
+    assert not hasattr(first, "__dict__")
+    assert (first.channel_id, first["content"]) == ("1", "msg 1")
+    assert [m.content for m in stream] == ["msg 3", "msg 0", "msg 2", "msg 4"]
+    assert db_manager.get_raw_messages_24h("server")[0] == first.to_dict()
+    assert db_manager.get_last_raw_message_id("server") == 5
+    assert db_manager.get_last_raw_message_id("other") is None
+
+
+def test_iter_channels_groups_lazily():
+    stream = iter([
+        {"content": "laser", "channel_id": "1", "channel_name": "shop"},
+        {"content": "nice", "channel_id": "1", "channel_name": "shop"},
+        {"content": "open house", "channel_id": "2", "channel_name": "events"},
+        {"content": "secret", "channel_id": "3", "channel_name": "dev"},
+    ])
+    channels = iter_channels(stream, excluded={"3"})
+    cid, name, messages = next(channels)
+    assert (cid, name) == ("1", "shop")
+    assert [m["content"] for m in messages] == ["laser", "nice"]
+    assert [(cid, name) for cid, name, _ in channels] == [("2", "events")]
+
+
+def test_model_overrides_per_channel_and_user(db_manager):
+    db_manager.set_model_override("server", "channel", "c1", "slow")
+    db_manager.set_model_override("server", "user", "u1", "slow")
+    db_manager.set_model_override("server", "user", "u1", "fast")
+    assert db_manager.get_model_overrides("server", "c1", "u1") == {"channel": "slow", "user": "fast"}
+    assert db_manager.get_model_overrides("server", "c2", "u2") == {}
+    assert db_manager.get_model_overrides("other", "c1", "u1") == {}
+    db_manager.set_model_override("server", "channel", "c1", None)
+    assert db_manager.get_model_overrides("server", "c1", "u1") == {"user": "fast"}
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cfmb.digests import SQLITE_FORMAT, load_channel_lines, load_day_blocks, update_digests
+
+
+@pytest.fixture
+def mock_llm_client(mock_llm_client):
+    mock_llm_client.get_completion = AsyncMock(side_effect=lambda messages, **kwargs: f"notes ({kwargs['label']})")
+    return mock_llm_client
+
+
+def _insert(db_manager, hours_ago, channel_id, content, username="alice"):
+    ts = (datetime.now(timezone.utc) - timedelta(hours=hours_ago)).strftime(SQLITE_FORMAT)
+    with db_manager._get_connection() as conn:
+        conn.execute(
+            "INSERT INTO raw_messages (server_id, message_id, user_id, username, content, channel_id, channel_name, timestamp) "
+            "VALUES ('server', 'm', 'u', ?, ?, ?, ?, ?)",
+            (username, content, channel_id, f"ch{channel_id}", ts),
+        )
+
+
+@pytest.mark.asyncio
+async def test_update_digests_only_closed_hours(db_manager, mock_llm_client):
+    """Closed hour buckets are digested once; the open hour stays raw."""
+    _insert(db_manager, 3, "1", "laser is fixed")
+    _insert(db_manager, 3, "2", "open house friday")
+    _insert(db_manager, 3, "9", "excluded chatter")
+    _insert(db_manager, 0, "1", "just now")
+
+    written = await update_digests("server", db_manager, mock_llm_client, excluded={"9"})
+    assert written == 2
+    assert await update_digests("server", db_manager, mock_llm_client, excluded={"9"}) == 0
+
+    channels = load_channel_lines("server", db_manager, excluded={"9"})
+    assert channels["1"]["lines"][0].startswith("notes (digest #ch1")
+    assert channels["1"]["lines"][1] == "alice: just now"
+    assert len(channels["2"]["lines"]) == 1
+    assert "9" not in channels
+
+
+@pytest.mark.asyncio
+async def test_update_digests_retries_failed_hour(db_manager, mock_llm_client):
+    """An hour whose digest fails is not stored and is retried on the next run."""
+    _insert(db_manager, 2, "1", "hello")
+    mock_llm_client.get_completion = AsyncMock(return_value=None)
+    assert await update_digests("server", db_manager, mock_llm_client) == 0
+    assert db_manager.get_digest_watermark("server") is None
+
+    mock_llm_client.get_completion = AsyncMock(return_value="notes")
+    assert await update_digests("server", db_manager, mock_llm_client) == 1
+
+
+def test_load_channel_lines_without_digests(db_manager):
+    """With no digests every raw message of the past day is returned."""
+    _insert(db_manager, 1, "1", "hello")
+    _insert(db_manager, 30, "1", "too old")
+    channels = load_channel_lines("server", db_manager)
+    assert channels == {"1": {"name": "ch1", "lines": ["alice: hello"]}}
+
+
+def test_load_channel_lines_bounds_a_stale_watermark(db_manager):
+    """Raw messages after an old watermark are still limited to the window and to included channels."""
+    _insert(db_manager, 40, "1", "digested")
+    _insert(db_manager, 30, "1", "after the watermark but too old")
+    _insert(db_manager, 1, "1", "recent")
+    _insert(db_manager, 1, "9", "excluded")
+    bucket = (datetime.now(timezone.utc) - timedelta(hours=40)).strftime("%Y-%m-%d %H:00:00")
+    db_manager.write_digest("server", "1", "ch1", "hour", bucket, 1, 1, 1, "old notes")
+    channels = load_channel_lines("server", db_manager, excluded={"9"})
+    assert channels == {"1": {"name": "ch1", "lines": ["alice: recent"]}}
+
+
+def test_load_day_blocks_prefers_day_digests(db_manager):
+    db_manager.write_digest("server", "1", "ch1", "hour", "2024-01-01 10:00:00", 1, 5, 5, "hour notes")
+    assert load_day_blocks("server", db_manager, "2024-01-01 00:00:00", "2024-01-02 00:00:00") == [("ch1", ["hour notes"])]
+
+    db_manager.write_digest("server", "1", "ch1", "day", "2024-01-01 00:00:00", 1, 5, 5, "day notes")
+    assert load_day_blocks("server", db_manager, "2024-01-01 00:00:00", "2024-01-02 00:00:00") == [("ch1", ["day notes"])]
+    assert load_day_blocks("server", db_manager, "2024-01-02 00:00:00", "2024-01-03 00:00:00") is None
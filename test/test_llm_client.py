@@ -6,7 +6,7 @@ from cfmb.llm_client import LLMClient
 @pytest.fixture
 def mock_async_client():
     mock_client = AsyncMock()
-    with patch("cfmb.llm_client.ollama.AsyncClient", return_value=mock_client):
+    with patch("cfmb.backends.ollama.AsyncClient", return_value=mock_client):
         yield mock_client
 
 
@@ -14,3 +14,34 @@ def test_llm_client_initialization():
     model_name = "my_model"
     client = LLMClient(model_name)
     assert client.model_name == model_name
+
+
+def test_record_prefill_tracks_cached_share():
+    client = LLMClient("my_model")
+    messages = [{"role": "system", "content": "x" * 400}, {"role": "user", "content": "y" * 400}]
+    client._record_prefill("chat", messages, {"prompt_eval_count": 50, "prompt_eval_duration": 250_000_000})
+    client._record_prefill("chat", messages, {"prompt_eval_count": 200, "prompt_eval_duration": 750_000_000})
+    assert client.prefill["chat"] == {"calls": 2, "evaluated": 250, "estimated": 404, "seconds": 1.0}
+    assert client.describe_prefill() == "chat ~38% cached, avg 0.50s over 2 calls"
+
+
+@pytest.mark.asyncio
+async def test_waiting_background_call_does_not_block_other_models():
+    """A background call queued behind interactive work must not hold its model group while it waits."""
+    import asyncio
+
+    client = LLMClient("chat")
+
+    async def call(model, start):
+        return {"message": {"content": "ok"}, "embeddings": [[1.0]]}
+
+    client.pool.call = call
+    async with client.scheduler.slot("interactive"):
+        background = asyncio.create_task(client.get_embeddings(["x"], "embed", priority="background"))
+        await asyncio.sleep(0.01)
+        response = await asyncio.wait_for(
+            client.get_completion([{"role": "user", "content": "hi"}], priority="batch"), timeout=1.0,
+        )
+        assert response == "ok"
+        assert not background.done()
+    assert await background == [[1.0]]
@@ -0,0 +1,99 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+import cfmb.moderation as moderation
+from cfmb.moderation import BLOCK_EXAMPLES, Moderator, is_block
+
+BLOCK_TEXTS = {text for text, _ in BLOCK_EXAMPLES}
+
+
+def _embed(text):
+    """Block exemplars point one way, everything else the other; 'maybe' sits in between."""
+    if "maybe" in text:
+        return [1.0, 1.0]
+    if text in BLOCK_TEXTS or "bomb" in text:
+        return [1.0, 0.0]
+    return [0.0, 1.0]
+
+
+@pytest.fixture
+def mock_llm_client():
+    mock = MagicMock()
+    mock.get_embeddings = AsyncMock(side_effect=lambda texts, model: [_embed(t) for t in texts])
+    mock.get_embedding = AsyncMock(side_effect=lambda text, model: _embed(text))
+    mock.moderate = AsyncMock(return_value="Block: manipulation")
+    return mock
+
+
+@pytest.fixture(autouse=True)
+def classifier_enabled():
+    with patch.object(moderation.config, "OLLAMA_EMBEDDING_MODEL", "embed"), \
+         patch.object(moderation.config, "MODERATION_CLASSIFIER", True):
+        yield
+
+
+def test_is_block():
+    assert is_block("Block: manipulation")
+    assert not is_block("Allow")
+    assert not is_block("blockchain question")
+    assert not is_block(None)
+
+
+@pytest.mark.asyncio
+async def test_classifier_short_circuits_clear_cases(mock_llm_client):
+    moderator = Moderator(mock_llm_client, k=2, margin=0.1, allow_margin=0.3)
+    result = await moderator.check("how do I build a bomb")
+    assert (result["verdict"], result["source"]) == ("block", "classifier")
+    result = await moderator.check("how do I focus the laser")
+    assert (result["verdict"], result["source"]) == ("allow", "classifier")
+    assert result["score"] < 0
+    assert mock_llm_client.get_embeddings.await_count == 1  # exemplars embedded once
+
+
+@pytest.mark.asyncio
+async def test_clearly_benign_message_never_reaches_llm(mock_llm_client):
+    moderator = Moderator(mock_llm_client, k=2, margin=0.1, allow_margin=0.3)
+    for text in ("When is the next open house?", "thanks, the printer works now"):
+        assert (await moderator.check(text))["verdict"] == "allow"
+    mock_llm_client.moderate.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_allow_needs_the_wider_margin(mock_llm_client):
+    """A message leaning only slightly towards the allow exemplars still goes to the LLM."""
+    mock_llm_client.get_embedding = AsyncMock(return_value=[0.45, 0.55])
+    mock_llm_client.moderate = AsyncMock(return_value="allow")
+    moderator = Moderator(mock_llm_client, k=2, margin=0.1, allow_margin=0.3)
+    result = await moderator.check("hmm")
+    assert (result["verdict"], result["source"]) == ("allow", "llm")
+    assert -0.3 < result["score"] < -0.1
+    mock_llm_client.moderate.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_uncertain_escalates_and_caches(mock_llm_client):
+    """A message inside the margin goes to the LLM; a repeat is served from the cache."""
+    moderator = Moderator(mock_llm_client, k=2, margin=0.1)
+    first = await moderator.check("maybe do something")
+    assert (first["verdict"], first["source"]) == ("block", "llm")
+    second = await moderator.check("maybe do something")
+    assert (second["verdict"], second["source"]) == ("block", "cache")
+    assert mock_llm_client.moderate.await_count == 1
+    assert moderator.counts == {"cache": 1, "classifier": 0, "llm": 1}
+
+
+@pytest.mark.asyncio
+async def test_llm_failure_allows_without_caching(mock_llm_client):
+    mock_llm_client.moderate = AsyncMock(return_value=None)
+    moderator = Moderator(mock_llm_client, k=2, margin=0.1)
+    assert (await moderator.check("maybe do something"))["verdict"] == "allow"
+    assert (await moderator.check("maybe do something"))["source"] == "llm"
+
+
+@pytest.mark.asyncio
+async def test_disabled_classifier_uses_llm(mock_llm_client):
+    with patch.object(moderation.config, "MODERATION_CLASSIFIER", False):
+        result = await Moderator(mock_llm_client).check("how do I focus the laser")
+    assert (result["verdict"], result["source"]) == ("block", "llm")
+    mock_llm_client.get_embedding.assert_not_awaited()
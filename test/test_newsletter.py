@@ -0,0 +1,101 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+import cfmb.newsletter as newsletter
+
+
+RAW = [
+    {"username": "alice", "content": "The <@123> laser is fixed", "channel_id": "1", "channel_name": "shop"},
+    {"username": "bob", "content": "nice", "channel_id": "1", "channel_name": "shop"},
+    {"username": "carol", "content": "Open house on Friday", "channel_id": "2", "channel_name": "events"},
+    {"username": "dave", "content": "secret", "channel_id": "3", "channel_name": "dev"},
+]
+
+
+@pytest.fixture
+def mock_llm_client(mock_llm_client):
+    async def completion(messages, label="completion", priority="interactive", **kwargs):
+        if label.startswith("newsletter #"):
+            return f"summary of {label[12:]}"
+        if label == "curation":
+            return "**#shop**\nLaser @fixed\n**#events**\nOpen house"
+        return "joke"
+
+    mock_llm_client.get_completion = AsyncMock(side_effect=completion)
+    return mock_llm_client
+
+
+def test_clean_content():
+    assert newsletter.clean_content("hi <@123> and <#456> @you") == "hi  and  you"
+
+
+def test_group_by_channel_excludes():
+    channels = newsletter.group_by_channel(RAW, excluded={"3"})
+    assert list(channels) == ["1", "2"]
+    assert len(channels["1"]["messages"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_build_newsletter(mock_llm_client):
+    with patch.object(newsletter.config, "OLLAMA_EMBEDDING_MODEL", None):
+        result = await newsletter.build_newsletter("server", RAW, MagicMock(), mock_llm_client, excluded={"3"})
+
+    assert result["summaries"] == [("1", "shop", "summary of shop"), ("2", "events", "summary of events")]
+    assert result["curated"] == "**#shop**\nLaser fixed\n**#events**\nOpen house"
+    assert result["joke"] == "joke"
+    assert newsletter.split_sections(result["curated"]) == ["**#shop**\nLaser fixed", "**#events**\nOpen house"]
+    labels = [c.kwargs["label"] for c in mock_llm_client.get_completion.call_args_list]
+    assert "newsletter #dev" not in labels
+
+
+@pytest.mark.asyncio
+async def test_top_up_newsletter_only_resummarizes_new_channels(mock_llm_client):
+    """Only channels with new messages are summarized; existing summaries are merged."""
+    cached = {
+        "summaries": [("1", "shop", "old shop"), ("2", "events", "old events")],
+        "curated": "cached", "joke": "cached joke",
+    }
+    new_raw = [{"username": "eve", "content": "More laser news", "channel_id": "1", "channel_name": "shop"}]
+
+    with patch.object(newsletter.config, "OLLAMA_EMBEDDING_MODEL", None):
+        result = await newsletter.top_up_newsletter("server", cached, new_raw, MagicMock(), mock_llm_client)
+
+    labels = [c.kwargs["label"] for c in mock_llm_client.get_completion.call_args_list]
+    assert "newsletter #shop" in labels
+    assert "newsletter #events" not in labels
+    assert any("top-up" in l for l in labels)
+    assert result["summaries"][1] == ("2", "events", "old events")
+    assert result["curated"] != "cached"
+
+
+@pytest.mark.asyncio
+async def test_top_up_newsletter_without_new_messages(mock_llm_client):
+    cached = {"summaries": [], "curated": "cached", "joke": None}
+    assert await newsletter.top_up_newsletter("server", cached, [], MagicMock(), mock_llm_client) is cached
+    mock_llm_client.get_completion.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_annotate_with_sources_batches_lookups(mock_llm_client):
+    """Every long segment is embedded and searched in one call each; close matches get links."""
+    text = "The laser cutter is fixed now, ok. Open house is on Friday night!"
+    mock_llm_client.get_embeddings = AsyncMock(return_value=[[1.0], [2.0]])
+    db = MagicMock()
+    db.search_rag_chunks_top1.return_value = [
+        {"channel_id": "1", "message_id": "10", "distance": 0.1},
+        {"channel_id": "2", "message_id": "20", "distance": 0.9},
+    ]
+    with patch.object(newsletter.config, "OLLAMA_EMBEDDING_MODEL", "embed"):
+        annotated = await newsletter.annotate_with_sources(text, "server", db, mock_llm_client)
+
+    mock_llm_client.get_embeddings.assert_awaited_once_with(
+        ["The laser cutter is fixed now", "Open house is on Friday night"], "embed",
+    )
+    db.search_rag_chunks_top1.assert_called_once_with(
+        "server", [[1.0], [2.0]], hours=24, model="embed", include_untagged=True,
+    )
+    assert annotated == (
+        "The laser cutter is fixed now [[1]](https://discord.com/channels/server/1/10), ok. "
+        "Open house is on Friday night!"
+    )
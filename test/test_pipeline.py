@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from cfmb.pipeline import run_dag
+
+
+@pytest.mark.asyncio
+async def test_run_dag_passes_dependency_results():
+    async def one():
+        return 1
+
+    async def add(a, b):
+        return a + b
+
+    stages = {
+        "a": ((), one),
+        "b": ((), one),
+        "sum": (("a", "b"), add),
+    }
+    results = await run_dag(stages, "test")
+    assert results == {"a": 1, "b": 1, "sum": 2}
+
+
+@pytest.mark.asyncio
+async def test_run_dag_runs_independent_stages_concurrently():
+    """Two stages depending on the same input overlap in time."""
+    running = set()
+    overlapped = False
+
+    async def source():
+        return "x"
+
+    async def branch(name):
+        nonlocal overlapped
+        running.add(name)
+        await asyncio.sleep(0.01)
+        overlapped = overlapped or len(running) == 2
+        running.discard(name)
+
+    stages = {
+        "source": ((), source),
+        "left": (("source",), lambda _: branch("left")),
+        "right": (("source",), lambda _: branch("right")),
+    }
+    await run_dag(stages, "test")
+    assert overlapped
+
+
+@pytest.mark.asyncio
+async def test_run_dag_propagates_errors():
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def never(_):
+        raise AssertionError("dependent stage should not run")
+
+    with pytest.raises(RuntimeError):
+        await run_dag({"fail": ((), fail), "after": (("fail",), never)}, "test")
@@ -0,0 +1,73 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+import cfmb.rag_backfill as rag_backfill
+from cfmb.rag_backfill import backfill_server, build_chunks
+
+
+@pytest.fixture
+def mock_llm_client():
+    mock = MagicMock()
+    mock.get_embeddings = AsyncMock(side_effect=lambda texts, model: [[1.0, float(len(t))] for t in texts])
+    return mock
+
+
+@pytest.fixture(autouse=True)
+def embedding_model():
+    with patch.object(rag_backfill.config, "OLLAMA_EMBEDDING_MODEL", "embed"):
+        yield
+
+
+def _insert(db_manager, n, channel_id, text="x" * 300):
+    for i in range(n):
+        db_manager.write_raw_message("server", f"{channel_id}-{i}", "u1", "alice", f"{text} {i}", channel_id=channel_id, channel_name=f"ch{channel_id}")
+
+
+def test_build_chunks_per_channel(db_manager):
+    """Messages fold into chunks up to the token budget, per channel, skipping blanks."""
+    _insert(db_manager, 3, "1")
+    _insert(db_manager, 1, "2", "hi")
+    db_manager.write_raw_message("server", "blank", "u1", "alice", "  ", channel_id="2", channel_name="ch2")
+
+    chunks = build_chunks("server", db_manager.iter_raw_messages_24h("server"))
+    assert [(c["channel_id"], c["message_id"], c["messages"]) for c in chunks] == [("1", "1-0", 2), ("1", "1-2", 1), ("2", "2-0", 1)]
+    assert chunks[0]["content"] == f"alice: {'x' * 300} 0\nalice: {'x' * 300} 1"
+    assert build_chunks("server", db_manager.iter_raw_messages_24h("server"), {"1": chunks[0]["last_raw_id"]})[0]["message_id"] == "1-2"
+
+
+@pytest.mark.asyncio
+async def test_backfill_writes_in_bulk_and_resumes(db_manager, mock_llm_client):
+    """A second run only embeds what arrived since the checkpoint."""
+    _insert(db_manager, 4, "1")
+    stats = await backfill_server("server", db_manager, mock_llm_client, hours=24, batch_size=1, concurrency=2)
+    assert (stats["chunks"], stats["messages"], stats["failed"]) == (2, 4, 0)
+    assert mock_llm_client.get_embeddings.await_count == 2
+
+    db_manager.write_raw_message("server", "late", "u1", "alice", "later", channel_id="1", channel_name="ch1")
+    stats = await backfill_server("server", db_manager, mock_llm_client, hours=24)
+    assert (stats["chunks"], stats["messages"]) == (1, 1)
+    with db_manager._get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM rag_chunks").fetchone()[0] == 3
+        assert tuple(conn.execute("SELECT last_raw_id, chunk_count FROM rag_backfill_checkpoints").fetchone()) == (5, 3)
+
+
+@pytest.mark.asyncio
+async def test_backfill_failure_stops_channel_at_checkpoint(db_manager, mock_llm_client):
+    """After a failed batch, later chunks of that channel wait for the next run."""
+    _insert(db_manager, 6, "1")
+    _insert(db_manager, 1, "2", "hi")
+    calls = []
+
+    async def flaky(texts, model):
+        calls.append(texts)
+        return None if len(calls) == 2 else [[1.0, 0.0] for _ in texts]
+
+    mock_llm_client.get_embeddings = AsyncMock(side_effect=flaky)
+    stats = await backfill_server("server", db_manager, mock_llm_client, hours=24, batch_size=1, concurrency=4)
+    assert (stats["chunks"], stats["failed"]) == (2, 2)
+    assert db_manager.get_rag_backfill_checkpoints("server") == {"1": 2, "2": 7}
+
+    mock_llm_client.get_embeddings = AsyncMock(side_effect=lambda texts, model: [[1.0, 0.0] for _ in texts])
+    stats = await backfill_server("server", db_manager, mock_llm_client, hours=24)
+    assert (stats["chunks"], stats["messages"]) == (2, 4)
@@ -0,0 +1,89 @@
+import random
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+import cfmb.reactions as reactions
+from cfmb.reactions import REACTION_EMOJI, ReactionPipeline, excitement
+
+
+def _message(content):
+    message = MagicMock()
+    message.content = content
+    message.add_reaction = AsyncMock()
+    return message
+
+
+@pytest.fixture
+def mock_llm_client():
+    mock = MagicMock()
+    # Each candidate description gets its own axis; messages mentioning "party" land on 🎉.
+    axes = list(REACTION_EMOJI.values())
+    mock.get_embeddings = AsyncMock(side_effect=lambda texts, model: [[float(t == a) for a in axes] for t in texts])
+    mock.get_embedding = AsyncMock(side_effect=lambda text, model: [float("party" in text and a == REACTION_EMOJI["🎉"]) for a in axes])
+    mock.get_completion = AsyncMock(return_value="🐻")
+    return mock
+
+
+@pytest.fixture(autouse=True)
+def embedding_model():
+    with patch.object(reactions.config, "OLLAMA_EMBEDDING_MODEL", "embed"), \
+         patch.object(reactions.config, "REACTION_LLM", True):
+        yield
+
+
+def test_excitement():
+    assert excitement("what feed rate for walnut?") == 0.0
+    assert excitement("IT WORKS!!! 🎉🎉") == 1.0
+    assert 0 < excitement("finished the bench!") < 1
+
+
+def test_gate_favours_excited_messages():
+    pipeline = ReactionPipeline(MagicMock(), rate=0.0, excited_rate=1.0, rng=random.Random(0))
+    assert not any(pipeline.gate("what feed rate for walnut?") for _ in range(100))
+    assert all(pipeline.gate("LET'S GO!!! 🎉") for _ in range(100))
+
+
+def test_offer_drops_when_full():
+    pipeline = ReactionPipeline(MagicMock(), rate=1.0, excited_rate=1.0, queue_size=2)
+    assert [pipeline.offer(_message(f"hi {i}")) for i in range(3)] == [True, True, False]
+    assert not pipeline.offer(_message("/stats"))
+    assert (pipeline.counts["queued"], pipeline.counts["dropped"], pipeline.queue.qsize()) == (2, 1, 2)
+
+
+@pytest.mark.asyncio
+async def test_embedding_pick_skips_llm(mock_llm_client):
+    pipeline = ReactionPipeline(mock_llm_client)
+    message = _message("party at the shop tonight")
+    await pipeline.react(message)
+    message.add_reaction.assert_awaited_once_with("🎉")
+    mock_llm_client.get_completion.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_llm_at_background_priority(mock_llm_client):
+    pipeline = ReactionPipeline(mock_llm_client)
+    message = _message("the bandsaw blade snapped")
+    await pipeline.react(message)
+    message.add_reaction.assert_awaited_once_with("🐻")
+    assert mock_llm_client.get_completion.await_args.kwargs["priority"] == "background"
+    assert pipeline.counts["llm"] == 1
+
+    with patch.object(reactions.config, "REACTION_LLM", False):
+        await pipeline.react(_message("the bandsaw blade snapped again"))
+    assert pipeline.counts["skipped"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("response, emoji", [
+    ("🐻🐻", "🐻"),
+    ("🛠️", "🛠️"),
+    ("👍🏽 nice", "👍🏽"),
+    ("🇺🇸", "🇺🇸"),
+    ("🏳️‍🌈", "🏳️‍🌈"),
+    ("👩🏽‍🔧🎉", "👩🏽‍🔧"),
+    ("no emoji here", None),
+])
+async def test_llm_pick_keeps_whole_emoji(mock_llm_client, response, emoji):
+    mock_llm_client.get_completion = AsyncMock(return_value=response)
+    assert await ReactionPipeline(mock_llm_client).pick_llm("the bandsaw blade snapped") == emoji
@@ -0,0 +1,82 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+import cfmb.reembed as reembed
+from cfmb.reembed import ReembedWorker, search_models
+from cfmb.search import QueryCache, hybrid_search
+import cfmb.search as search
+
+
+@pytest.fixture(autouse=True)
+def models(monkeypatch):
+    monkeypatch.setattr(reembed.config, "OLLAMA_EMBEDDING_MODEL", "new")
+    monkeypatch.setattr(reembed.config, "EMBEDDING_LEGACY_MODEL", "old")
+    monkeypatch.setattr(search, "query_cache", QueryCache())
+    monkeypatch.setattr(reembed, "_migrated_to", None)
+
+
+@pytest.fixture
+def mock_llm_client():
+    mock = MagicMock()
+    mock.pending_embeddings = 0
+    mock.get_embeddings = AsyncMock(side_effect=lambda texts, model, priority=None: [[0.0, 1.0, 0.0] for _ in texts])
+    mock.get_embedding = AsyncMock(side_effect=lambda text, model: [1.0, 0.0] if model == "old" else [0.0, 1.0, 0.0])
+    return mock
+
+
+def test_chunks_are_tagged_with_model_and_dimension(db_manager):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "laser", [1.0, 0.0], "old")
+    db_manager.write_rag_chunk("server", "m2", "1", "shop", "untagged", [0.5, 0.5])
+    assert db_manager.get_rag_embedding_models("server") == {None: 1, "old": 1}
+    assert search_models("server", db_manager) == ["new", "old"]
+    with db_manager._get_connection() as conn:
+        assert [r[0] for r in conn.execute("SELECT embedding_dim FROM rag_chunks")] == [2, 2]
+
+
+@pytest.mark.asyncio
+async def test_worker_reembeds_newest_first_at_background_priority(db_manager, mock_llm_client):
+    for i in range(3):
+        db_manager.write_rag_chunk("server", f"m{i}", "1", "shop", f"chunk {i}", [1.0, 0.0])
+    worker = ReembedWorker(db_manager, mock_llm_client, batch_size=2, pause=0)
+
+    await worker.run()
+    first, second = mock_llm_client.get_embeddings.await_args_list
+    assert first.args == (["chunk 2", "chunk 1"], "new") and first.kwargs == {"priority": "background"}
+    assert second.args[0] == ["chunk 0"]
+    assert worker.progress()["remaining"] == 0
+    assert db_manager.get_rag_embedding_models() == {"new": 3}
+
+
+@pytest.mark.asyncio
+async def test_search_stops_listing_models_once_migrated(db_manager, mock_llm_client, monkeypatch):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "laser", [1.0, 0.0], "old")
+    assert search_models("server", db_manager) == ["new", "old"]
+    await ReembedWorker(db_manager, mock_llm_client, pause=0).run()
+    monkeypatch.setattr(db_manager, "get_rag_embedding_models", MagicMock())
+    assert search_models("server", db_manager) == ["new"]
+    db_manager.get_rag_embedding_models.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_worker_leaves_chunks_changed_mid_batch(db_manager, mock_llm_client):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "before", [1.0, 0.0], "old")
+
+    async def embed_while_chunk_grows(texts, model, priority=None):
+        db_manager.update_rag_chunk(1, "before\nafter", [0.9, 0.1], "old")
+        return [[0.0, 1.0, 0.0]]
+
+    mock_llm_client.get_embeddings = AsyncMock(side_effect=embed_while_chunk_grows)
+    assert await ReembedWorker(db_manager, mock_llm_client).step() == 0
+    assert db_manager.get_rag_embedding_models() == {"old": 1}
+
+
+@pytest.mark.asyncio
+async def test_search_reads_both_models_during_migration(db_manager, mock_llm_client):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "laser cutter", [1.0, 0.0], "old")
+    db_manager.write_rag_chunk("server", "m2", "2", "events", "open house", [0.0, 1.0, 0.0], "new")
+
+    results = await hybrid_search("zzz", "server", db_manager, mock_llm_client, limit=5)
+    assert sorted(r["message_id"] for r in results) == ["m1", "m2"]
+    assert {c.args[1] for c in mock_llm_client.get_embedding.await_args_list} == {"new", "old"}
+    assert db_manager.search_rag_chunks("server", [1.0, 0.0, 0.0])[0]["message_id"] == "m2"
@@ -0,0 +1,112 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+import cfmb.residency as residency
+from cfmb.residency import ResidencyManager
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    with patch.object(residency.config, "OLLAMA_MODEL", "chat"), \
+         patch.object(residency.config, "OLLAMA_FAST_MODEL", ""), \
+         patch.object(residency.config, "OLLAMA_EMBEDDING_MODEL", "embed"), \
+         patch.object(residency.config, "OLLAMA_KEEP_ALIVE_RESIDENT", "-1"), \
+         patch.object(residency.config, "OLLAMA_KEEP_ALIVE", "5m"), \
+         patch.object(residency.config, "OLLAMA_KEEP_ALIVE_MODELS", "flux=1m, chat=2h"), \
+         patch.object(residency.config, "OLLAMA_BATCH_GROUP_SECONDS", 60.0):
+        yield
+
+
+def test_keep_alive_per_model():
+    manager = ResidencyManager(MagicMock())
+    assert manager.keep_alive("chat") == "2h"
+    assert manager.keep_alive("embed") == -1
+    assert manager.keep_alive("flux") == "1m"
+    assert manager.keep_alive("other") == "5m"
+
+
+def test_observe_counts_cold_loads():
+    manager = ResidencyManager(MagicMock())
+    manager.observe("chat", {"load_duration": 3_000_000_000})
+    manager.observe("chat", {"load_duration": 20_000_000})
+    manager.observe("chat", {})
+    assert manager.stats["chat"] == {"calls": 3, "loads": 1, "load_seconds": 3.0, "max_load_seconds": 3.0}
+    assert manager.describe() == "`chat` 1 loads/3 calls (avg 3.0s)"
+
+
+@pytest.mark.asyncio
+async def test_batch_work_grouped_by_model():
+    """Queued work for the running model's group goes first; the other model waits for the group to drain."""
+    manager = ResidencyManager(MagicMock())
+    order = []
+
+    async def job(model, name, hold=0.01):
+        async with manager.group(model):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    first = asyncio.create_task(job("chat", "chat-1", 0.05))
+    await asyncio.sleep(0)
+    waiting = [asyncio.create_task(job("embed", "embed-1")), asyncio.create_task(job("chat", "chat-2"))]
+    await asyncio.gather(first, *waiting)
+    assert order == ["chat-1", "chat-2", "embed-1"]
+
+
+@pytest.mark.asyncio
+async def test_group_yields_after_its_turn():
+    manager = ResidencyManager(MagicMock())
+    order = []
+
+    async def job(model, name, hold=0.01):
+        async with manager.group(model):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    with patch.object(residency.config, "OLLAMA_BATCH_GROUP_SECONDS", 0.0):
+        first = asyncio.create_task(job("chat", "chat-1", 0.05))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(job("embed", "embed-1")), asyncio.create_task(job("chat", "chat-2"))]
+        await asyncio.gather(first, *waiting)
+    assert order == ["chat-1", "embed-1", "chat-2"]
+
+
+@pytest.mark.asyncio
+async def test_preload_uses_keep_alive():
+    client = MagicMock()
+    client.generate = AsyncMock(return_value={"load_duration": 2_000_000_000})
+    client.embed = AsyncMock(return_value={"load_duration": 0})
+    pool = MagicMock()
+
+    async def call(model, start):
+        return await start(MagicMock(client=client))
+
+    pool.call = call
+    manager = ResidencyManager(pool)
+    await manager.preload("chat")
+    await manager.preload("embed", embedding=True)
+    client.generate.assert_awaited_once_with(model="chat", keep_alive="2h")
+    client.embed.assert_awaited_once_with(model="embed", input="", keep_alive=-1)
+    assert manager.stats["chat"]["loads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_group_turn_counts_from_when_the_other_model_started_waiting():
+    """A long-running group keeps admitting until the other model itself has waited its turn."""
+    manager = ResidencyManager(MagicMock())
+    order = []
+
+    async def job(model, name, delay=0.0, hold=0.01):
+        await asyncio.sleep(delay)
+        async with manager.group(model):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    with patch.object(residency.config, "OLLAMA_BATCH_GROUP_SECONDS", 0.15):
+        await asyncio.gather(
+            job("chat", "chat-1", hold=0.3),
+            job("embed", "embed-1", delay=0.2),
+            job("chat", "chat-2", delay=0.25),
+        )
+    assert order == ["chat-1", "chat-2", "embed-1"]
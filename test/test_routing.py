@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import cfmb.routing as routing
+from cfmb.routing import ModelRouter, classify
+
+
+@pytest.fixture(autouse=True)
+def models():
+    with patch.object(routing.config, "OLLAMA_FAST_MODEL", "small"), \
+         patch.object(routing.config, "OLLAMA_MODEL", "big"), \
+         patch.object(routing.config, "ROUTE_FAST_MAX_TOKENS", 48):
+        yield
+
+
+@pytest.fixture
+def mock_db_manager():
+    mock = MagicMock()
+    mock.get_model_overrides.return_value = {}
+    return mock
+
+
+@pytest.mark.parametrize("text, mode", [
+    ("what time does the shop close?", "fast"),
+    ("thanks comrade", "fast"),
+    ("why does my print warp at the corners", "slow"),
+    ("can you explain PID tuning", "slow"),
+    ("is it open? who has the key?", "slow"),
+    ("fix this ```print(1```", "slow"),
+    ("word " * 60, "slow"),
+])
+def test_classify(text, mode):
+    assert classify(text)[0] == mode
+
+
+def test_classify_attachments_go_slow():
+    assert classify("hi", images=True) == ("slow", "image attached")
+    assert classify("hi", url=True) == ("slow", "web page")
+
+
+def test_route_sets_model_and_thinking(mock_db_manager):
+    router = ModelRouter(mock_db_manager)
+    fast = router.route("s", "c", "u", "hello")
+    assert (fast.mode, fast.model, fast.think) == ("fast", "small", False)
+    slow = router.route("s", "c", "u", "explain gravity")
+    assert (slow.mode, slow.model, slow.think) == ("slow", "big", True)
+    assert router.route("s", "c", "u", "hello", debug=True).mode == "slow"
+
+
+def test_user_override_beats_channel(mock_db_manager):
+    router = ModelRouter(mock_db_manager)
+    mock_db_manager.get_model_overrides.return_value = {"channel": "slow"}
+    assert router.route("s", "c", "u", "hello").reason == "channel override"
+    mock_db_manager.get_model_overrides.return_value = {"channel": "slow", "user": "fast"}
+    route = router.route("s", "c", "u", "explain gravity")
+    assert (route.mode, route.reason) == ("fast", "user override")
+
+
+def test_no_fast_model_always_slow(mock_db_manager):
+    with patch.object(routing.config, "OLLAMA_FAST_MODEL", ""):
+        route = ModelRouter(mock_db_manager).route("s", "c", "u", "hello")
+    assert (route.mode, route.model) == ("slow", "big")
+    mock_db_manager.get_model_overrides.assert_not_called()
+
+
+def test_record_keeps_split(mock_db_manager):
+    router = ModelRouter(mock_db_manager)
+    router.record(router.route("s", "c", "u", "hello"), 1.0)
+    router.record(router.route("s", "c", "u", "hello"), 3.0)
+    router.record(router.route("s", "c", "u", "hello"), 5.0, timed_out=True)
+    assert router.stats == {
+        "fast": {"count": 3, "seconds": 9.0, "timeouts": 1},
+        "slow": {"count": 0, "seconds": 0.0, "timeouts": 0},
+    }
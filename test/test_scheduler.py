@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from cfmb.scheduler import LLMScheduler
+
+
+@pytest.mark.asyncio
+async def test_batch_concurrency_limit():
+    """No more than the batch limit run at once."""
+    scheduler = LLMScheduler({"batch": 2})
+    peak = 0
+
+    async def job():
+        nonlocal peak
+        async with scheduler.slot("batch"):
+            peak = max(peak, scheduler.active["batch"])
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(job() for _ in range(6)))
+    assert peak == 2
+    assert not scheduler.busy("batch")
+
+
+@pytest.mark.asyncio
+async def test_background_waits_for_interactive():
+    """Background work does not start while interactive work is in flight."""
+    scheduler = LLMScheduler()
+    order = []
+
+    async def interactive():
+        async with scheduler.slot("interactive"):
+            await asyncio.sleep(0.02)
+            order.append("interactive")
+
+    async def background():
+        await asyncio.sleep(0.005)
+        async with scheduler.slot("background"):
+            order.append("background")
+
+    await asyncio.gather(interactive(), background())
+    assert order == ["interactive", "background"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_priority():
+    with pytest.raises(ValueError):
+        async with LLMScheduler().slot("urgent"):
+            pass
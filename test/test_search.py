@@ -0,0 +1,137 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+import cfmb.search as search
+from cfmb.search import QueryCache, fts_query, hybrid_search, reciprocal_rank_fusion
+
+
+@pytest.fixture(autouse=True)
+def query_cache(monkeypatch):
+    cache = QueryCache()
+    monkeypatch.setattr(search, "query_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def mock_llm_client():
+    mock = MagicMock()
+    mock.pending_embeddings = 0
+    mock.get_embedding = AsyncMock(return_value=[0.0, 1.0])
+    return mock
+
+
+def test_fts_query():
+    assert fts_query('Need an M3-0.5 "tap"') == '"need" OR "an" OR "m3" OR "0" OR "5" OR "tap"'
+    assert fts_query("?!") is None
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "c"]]) == ["b", "c", "a"]
+
+
+def test_fts_index_follows_writes_and_updates(db_manager):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "alice: the Glowforge needs a new tube", [1.0, 0.0])
+    assert [r["message_id"] for r in db_manager.search_rag_chunks_fts("server", '"glowforge"')] == ["m1"]
+
+    chunk = db_manager.get_latest_rag_chunk("1")
+    db_manager.update_rag_chunk(chunk["id"], "alice: bought a Prusa", [1.0, 0.0])
+    assert db_manager.search_rag_chunks_fts("server", '"glowforge"') == []
+    assert len(db_manager.search_rag_chunks_fts("server", '"prusa"')) == 1
+    assert db_manager.search_rag_chunks_fts("other", '"prusa"') == []
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_fuses_vector_and_lexical(db_manager, mock_llm_client):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "alice: the glowforge needs a tube", [1.0, 0.0])
+    db_manager.write_rag_chunk("server", "m2", "2", "events", "bob: open house friday", [0.0, 1.0])
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "the glowforge needs a tube", channel_id="1", channel_name="shop")
+    db_manager.write_raw_message("server", "m3", "u2", "carol", "glowforge settings for birch", channel_id="1", channel_name="shop")
+    db_manager.write_raw_message("server", "m4", "u2", "carol", "/guildsearch glowforge", channel_id="1", channel_name="shop")
+
+    mock_llm_client.get_embedding = AsyncMock(return_value=[1.0, 0.0])
+    with patch("cfmb.search.config.OLLAMA_EMBEDDING_MODEL", "embed"):
+        results = await hybrid_search("glowforge", "server", db_manager, mock_llm_client, limit=5)
+
+    assert [(r["kind"], r["message_id"]) for r in results] == [("chunk", "m1"), ("message", "m3"), ("chunk", "m2")]
+    assert results[0]["distance"] == pytest.approx(0.0)
+    assert results[1]["distance"] is None
+    assert results[1]["content"] == "carol: glowforge settings for birch"
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_lexical_only_when_embedding_busy_or_slow(db_manager, mock_llm_client):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "alice: glowforge", [1.0, 0.0])
+    db_manager.write_rag_chunk("server", "m2", "2", "events", "bob: open house", [0.0, 1.0])
+
+    with patch("cfmb.search.config.OLLAMA_EMBEDDING_MODEL", "embed"):
+        mock_llm_client.pending_embeddings = 10
+        results = await hybrid_search("glowforge", "server", db_manager, mock_llm_client)
+        mock_llm_client.get_embedding.assert_not_called()
+        assert [r["message_id"] for r in results] == ["m1"]
+
+        async def slow(*args):
+            await asyncio.sleep(1)
+        mock_llm_client.pending_embeddings = 0
+        mock_llm_client.get_embedding = AsyncMock(side_effect=slow)
+        with patch("cfmb.search.config.SEARCH_EMBED_TIMEOUT_SECONDS", 0.01):
+            results = await hybrid_search("glowforge", "server", db_manager, mock_llm_client)
+        assert [r["message_id"] for r in results] == ["m1"]
+
+
+def test_query_cache_reuses_similar_queries():
+    cache = QueryCache(similarity=0.99)
+    cache.put("key", [1.0, 0.0, 0.0], {"1": 1}, [{"id": 1, "channel_id": "1"}])
+    assert cache.get("key", [1.0, 0.01, 0.0], {"1": 1}) == [{"id": 1, "channel_id": "1"}]
+    assert cache.get("key", [0.0, 1.0, 0.0], {"1": 1}) is None
+    assert cache.get("other", [1.0, 0.0, 0.0], {"1": 1}) is None
+    assert cache.get("key", [1.0, 0.0, 0.0], {"1": 1, "2": 3}) is not None  # another channel changed
+    assert cache.get("key", [1.0, 0.0, 0.0], {"1": 2}) is None
+    assert cache.get("key", [1.0, 0.0, 0.0], {"1": 1}) is None
+    assert not cache._buckets  # the emptied bucket is dropped
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"], stats["entries"]) == (2, 4, 1, 0)
+    assert stats["hit_ratio"] == pytest.approx(1 / 3)
+
+
+def test_query_cache_evicts_oldest():
+    cache = QueryCache(max_entries=2)
+    for i, vector in enumerate([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0]]):
+        cache.put("key", vector, {}, [{"id": i}])
+    assert cache.stats()["entries"] == 2
+    assert cache.get("key", [1.0, 0.0], {}) is None
+    assert cache.get("key", [-1.0, 0.0], {}) == [{"id": 2}]
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_caches_until_its_channels_change(db_manager, mock_llm_client, query_cache):
+    db_manager.write_rag_chunk("server", "m1", "1", "shop", "alice: glowforge", [1.0, 0.0])
+    with patch("cfmb.search.config.OLLAMA_EMBEDDING_MODEL", "embed"):
+        await hybrid_search("laser", "server", db_manager, mock_llm_client)
+        await hybrid_search("laser", "server", db_manager, mock_llm_client)
+        assert query_cache.stats()["avoided_scans"] == 1
+
+        # A chunk in a channel the cached results do not come from waits for the TTL
+        db_manager.write_rag_chunk("server", "m2", "2", "events", "bob: open house", [0.0, 1.0])
+        results = await hybrid_search("laser", "server", db_manager, mock_llm_client)
+        assert [r["message_id"] for r in results] == ["m1"]
+        assert query_cache.stats()["hits"] == 2
+
+        db_manager.write_rag_chunk("server", "m3", "1", "shop", "carol: laser is back", [0.0, 1.0])
+        results = await hybrid_search("laser", "server", db_manager, mock_llm_client)
+    assert sorted(r["message_id"] for r in results) == ["m1", "m2", "m3"]
+    assert query_cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_cache_survives_growing_chunks(db_manager, mock_llm_client, query_cache):
+    """Extending the open chunk on every message must not empty the cache."""
+    chunk_id = db_manager.write_rag_chunk("server", "m1", "1", "shop", "alice: glowforge", [1.0, 0.0])
+    with patch("cfmb.search.config.OLLAMA_EMBEDDING_MODEL", "embed"):
+        await hybrid_search("laser", "server", db_manager, mock_llm_client)
+        versions = db_manager.get_rag_versions("server")
+        db_manager.update_rag_chunk(chunk_id, "alice: glowforge\nbob: it is back", [0.9, 0.1])
+        assert db_manager.get_rag_versions("server") == versions == {"1": 1}
+        await hybrid_search("laser", "server", db_manager, mock_llm_client)
+    assert query_cache.stats()["hits"] == 1
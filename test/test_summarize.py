@@ -0,0 +1,59 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from cfmb.summarize import Summarizer, split_windows, facts_map_prompt, facts_reduce_prompt
+
+
+def estimate(text):
+    return len(text)
+
+
+@pytest.fixture
+def mock_llm_client(mock_llm_client):
+    mock_llm_client.get_completion = AsyncMock(return_value="what: fact\nusers: a\nchannel: #general")
+    return mock_llm_client
+
+
+def test_split_windows_single():
+    """A transcript that fits produces the same text as the one-shot transcript."""
+    blocks = [("general", ["a: hi", "b: yo"]), ("shop", ["c: laser"])]
+    assert split_windows(blocks, 1000, estimate) == ["#general\na: hi\nb: yo\n---\n#shop\nc: laser"]
+
+
+def test_split_windows_repeats_heading():
+    """A block spilling into a new window repeats its heading and keeps line order."""
+    lines = [f"user: message {i}" for i in range(10)]
+    windows = split_windows([("general", lines)], 60, estimate)
+
+    assert len(windows) > 1
+    assert all(w.startswith("#general\n") for w in windows)
+    assert all(len(w) <= 60 for w in windows)
+    joined = [l for w in windows for l in w.split("\n") if l != "#general"]
+    assert joined == lines
+
+
+@pytest.mark.asyncio
+async def test_run_single_window(mock_llm_client):
+    """Small transcripts are summarized in one call with the single-window prompt."""
+    single = MagicMock(return_value=[{"role": "user", "content": "x"}])
+    result = await Summarizer(mock_llm_client, max_tokens=1000).run(
+        [("general", ["a: hi"])], facts_map_prompt, facts_reduce_prompt, single_prompt=single,
+    )
+    assert result == "what: fact\nusers: a\nchannel: #general"
+    mock_llm_client.get_completion.assert_called_once()
+    single.assert_called_once_with("#general\na: hi")
+
+
+@pytest.mark.asyncio
+async def test_run_map_reduce(mock_llm_client):
+    """Large transcripts are mapped per window and reduced to a single result."""
+    lines = [f"user: {'word ' * 20}{i}" for i in range(40)]
+    summarizer = Summarizer(mock_llm_client, max_tokens=100)
+    result = await summarizer.run([("general", lines)], facts_map_prompt, facts_reduce_prompt)
+
+    assert result == "what: fact\nusers: a\nchannel: #general"
+    labels = [c.kwargs["label"] for c in mock_llm_client.get_completion.call_args_list]
+    assert any("map" in l for l in labels)
+    assert any("reduce" in l for l in labels)
+    assert all(c.kwargs["priority"] == "batch" for c in mock_llm_client.get_completion.call_args_list)
@@ -0,0 +1,40 @@
+from cfmb.config import config
+from cfmb.users import UserDirectory
+
+
+def test_users_table_follows_ingest(db_manager):
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hi")
+    db_manager.write_raw_message("server", "m2", "u1", "Alice B", "hi again")
+    db_manager.write_raw_message("server", "m3", "u2", "bob", "yo")
+    with db_manager._get_connection() as conn:
+        conn.execute("UPDATE users SET last_seen_ms = 0 WHERE user_id = 'u2'")
+        row = conn.execute("SELECT username, message_count FROM users WHERE user_id = 'u1'").fetchone()
+    assert tuple(row) == ("Alice B", 2)
+    assert db_manager.get_user_id_name_map("server") == {"u1": "Alice B"}
+    assert db_manager.get_user_id_name_map("server", days=None) == {"u1": "Alice B", "u2": "bob"}
+
+
+def test_users_table_backfilled_from_existing_messages(db_manager):
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hi")
+    db_manager.write_raw_message("server", "m2", "u1", "Alice B", "hi again")
+    with db_manager._get_connection() as conn:
+        conn.execute("DROP TABLE users")
+        conn.execute("DROP TRIGGER users_ai")
+    db_manager.initialize_db()
+    with db_manager._get_connection() as conn:
+        row = conn.execute("SELECT username, message_count FROM users").fetchone()
+    assert tuple(row) == ("Alice B", 2)
+
+
+def test_user_directory_loads_once_and_stays_current(db_manager):
+    db_manager.write_raw_message("server", "m1", "u1", "alice", "hi")
+    directory = UserDirectory(db_manager)
+    names = directory.names("server")
+    assert names == {"u1": "alice", str(config.BOT_USER_ID): config.BOT_DISPLAY_NAME}
+
+    directory.record("server", "u2", "bob")
+    directory.rename("server", "u1", "Alice B")
+    assert directory.names("server") is names
+    assert names["u2"] == "bob"
+    assert names["u1"] == "Alice B"
+    assert db_manager.get_user_id_name_map("server") == {"u1": "Alice B"}
@@ -0,0 +1,22 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from cfmb.vectors import FixedEmbeddings, cosine
+
+
+def test_cosine():
+    assert cosine([1.0, 0.0], [2.0, 0.0]) == pytest.approx(1.0)
+    assert cosine([1.0, 0.0], [0.0, 3.0]) == pytest.approx(0.0)
+    assert cosine([0.0, 0.0], [1.0, 1.0]) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_fixed_embeddings_embed_once_and_retry_failures():
+    llm = MagicMock()
+    llm.get_embeddings = AsyncMock(side_effect=[None, [[1.0], [2.0]]])
+    embeddings = FixedEmbeddings(llm, ["a", "b"])
+    assert await embeddings.vectors() is None
+    assert await embeddings.vectors() == [[1.0], [2.0]]
+    assert await embeddings.vectors() == [[1.0], [2.0]]
+    assert llm.get_embeddings.await_count == 2